@@ -0,0 +1,111 @@
+# bench_concurrency.py
+#
+# Readers and writers at the same time on a synthetic ledger (see synthetic.py), in
+# three configurations: the rollback journal with a commit per write (the old
+# behaviour), WAL with a commit per write, and WAL with writes group-committed by
+# write_queue. Readers page through and summarize random users' transactions;
+# writers add transactions to random users. Reported per configuration: committed
+# writes per second with their latency, reads per second with theirs, and for the
+# queue how many writes shared each commit.
+#
+#   python benchmarks/bench_concurrency.py [10k|1m|10m|rows] [seconds] [readers] [writers]
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import synthetic  # noqa: E402
+from models import database, instrumentation, query_cache, user_model, write_queue  # noqa: E402
+
+MODES = [
+    ("rollback journal", "DELETE", False),
+    ("wal", "WAL", False),
+    ("wal + write queue", "WAL", True),
+]
+
+
+def read(user_id, rng):
+    rows = user_model.get_transactions_page(user_id, limit=50, sort=rng.choice(["date", "price"]))
+    user_model.get_financial_summary(user_id, "2024-01-01", "2024-12-31")
+    return rows
+
+
+def write(user_id, rng, queued):
+    args = (user_id, round(rng.uniform(1, 200), 2), "Groceries", "expense", "2024-06-15", "Benchmark write")
+    if queued:
+        return write_queue.add_transaction(*args).result()
+    return user_model.add_transaction(*args)
+
+
+def worker(operation, user_ids, seed, stop, latency, errors):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            operation(rng.choice(user_ids), rng)
+        except Exception as e:  # database is locked, past the busy timeout
+            errors.append(e)
+            continue
+        latency.add(time.perf_counter() - started)
+
+
+def run(mode, user_ids, seconds, readers, writers):
+    name, journal_mode, queued = mode
+    database.configure(journal_mode=journal_mode)
+    write_queue.shutdown()
+    query_cache.clear()
+
+    stop = threading.Event()
+    read_latency, write_latency = instrumentation.Histogram(), instrumentation.Histogram()
+    read_errors, write_errors = [], []
+    threads = [threading.Thread(target=worker, args=(read, user_ids, index, stop, read_latency, read_errors))
+               for index in range(readers)]
+    threads += [threading.Thread(target=worker, args=(lambda user_id, rng: write(user_id, rng, queued), user_ids,
+                                                      1000 + index, stop, write_latency, write_errors))
+                for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    def describe(latency, errors):
+        return (f"{latency.count / seconds:8,.0f}/s  p50 {latency.percentile(50) * 1000:7.2f} ms  "
+                f"p99 {latency.percentile(99) * 1000:7.2f} ms  errors {len(errors)}")
+
+    print(f"{name}")
+    print(f"  writes {describe(write_latency, write_errors)}")
+    print(f"  reads  {describe(read_latency, read_errors)}")
+    if queued:
+        stats = write_queue.get_queue().stats()
+        print(f"  {stats['writes_per_commit']:.1f} writes per commit, largest commit {stats['largest_commit']}")
+    write_queue.shutdown()
+
+
+def main():
+    rows = synthetic.rows_for_size(sys.argv[1]) if len(sys.argv) > 1 else synthetic.SIZES["10k"]
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    writers = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+    instrumentation.configure(enabled=False)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        user_ids = [user_id for user_id, _ in synthetic.build_database(path, rows)]
+        database.set_database(path)
+        print(f"{rows:,} rows, {readers} readers, {writers} writers, {seconds:g}s each, "
+              f"synchronous {database.get_settings()[1]}")
+        for mode in MODES:
+            run(mode, user_ids, seconds, readers, writers)
+        database.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# bench_connection.py
+#
+# Per-call overhead of user_model reads: a fresh sqlite3.connect() per call
+# (the old connect_db behaviour) versus the pooled, pre-configured connection.
+# get_categories is timed without query_cache, which would otherwise answer every
+# call after the first without touching SQLite.
+#
+#   python benchmarks/bench_connection.py [calls]
+
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import database, user_model  # noqa: E402
+
+
+def get_categories_unpooled(db_path, user_id):
+    """The pre-pool implementation: open, query, close"""
+    connection = sqlite3.connect(db_path)
+    cursor = connection.cursor()
+    cursor.execute("SELECT name FROM categories WHERE user_id = ?", (user_id,))
+    categories = [row[0] for row in cursor.fetchall()]
+    connection.close()
+    return categories
+
+
+def time_calls(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e6  # microseconds per call
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        database.set_database(db_path)
+        user_model.initialize_database()
+        for name in ("Daily", "Market", "Rent", "Utilities", "Travel"):
+            user_model.add_category(1, name)
+
+        unpooled = time_calls(lambda: get_categories_unpooled(db_path, 1), calls)
+        pooled = time_calls(lambda: user_model.get_categories.uncached(1), calls)
+        database.close_all()
+
+    print(f"get_categories x{calls}")
+    print(f"  connect per call : {unpooled:8.1f} us/call")
+    print(f"  pooled connection: {pooled:8.1f} us/call")
+    print(f"  speedup          : {unpooled / pooled:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
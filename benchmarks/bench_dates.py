@@ -0,0 +1,74 @@
+# bench_dates.py
+#
+# Date normalization throughput over a million mixed inputs: ISO, DD.MM.YYYY and
+# MM/DD/YYYY dates spread over five years, with a sprinkling of natural-language
+# input. dateparser alone is timed on a sample and extrapolated, since running it
+# over every input would take minutes.
+#
+#   python benchmarks/bench_dates.py [inputs]
+
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from services import date_service  # noqa: E402
+
+NATURAL_LANGUAGE = ["yesterday", "today", "3 days ago", "2 weeks ago", "March 3 2024"]
+NATURAL_LANGUAGE_SHARE = 0.001
+DATEPARSER_SAMPLE = 2000
+
+
+def make_inputs(count):
+    rng = random.Random(42)
+    first = date(2020, 1, 1)
+    inputs = []
+    for _ in range(count):
+        if rng.random() < NATURAL_LANGUAGE_SHARE:
+            inputs.append(rng.choice(NATURAL_LANGUAGE))
+            continue
+        day = first + timedelta(days=rng.randrange(5 * 365))
+        layout = rng.random()
+        if layout < 0.8:
+            inputs.append(day.isoformat())
+        elif layout < 0.9:
+            inputs.append(day.strftime("%d.%m.%Y"))
+        else:
+            inputs.append(day.strftime("%m/%d/%Y"))
+    return inputs
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    inputs = make_inputs(count)
+    normalize = date_service.normalize_date
+
+    started = time.perf_counter()
+    import dateparser
+    import_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for value in inputs:
+        normalize(value, natural_language=True)
+    seconds = time.perf_counter() - started
+
+    sample = inputs[:DATEPARSER_SAMPLE]
+    started = time.perf_counter()
+    for value in sample:
+        dateparser.parse(value)
+    dateparser_seconds = (time.perf_counter() - started) / len(sample) * count
+
+    info = date_service.cache_info()
+    print(f"normalize_date: {count:,} inputs in {seconds:.2f}s "
+          f"({seconds / count * 1e9:,.0f} ns each), fast-path cache {info.hits:,} hits / {info.misses:,} misses")
+    print(f"dateparser.parse: ~{dateparser_seconds:.0f}s for the same inputs "
+          f"(extrapolated from {len(sample):,}); import alone {import_seconds:.2f}s")
+    print(f"speedup: {dateparser_seconds / seconds:,.0f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
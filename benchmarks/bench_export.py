@@ -0,0 +1,63 @@
+# bench_export.py
+#
+# Export time and peak Python memory (tracemalloc, on a second run) per format. Exports stream
+# from the database in batches, so peak memory should stay roughly flat as the
+# row count grows; run with two sizes to compare. The last line is the multi-format
+# job, which reads the rows once and renders Excel and PDF in parallel processes.
+#
+#   python benchmarks/bench_export.py [rows]
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import database, user_model  # noqa: E402
+from services import export_service, import_service  # noqa: E402
+from bench_import import write_csv  # noqa: E402
+
+EXPORTS = [
+    ("csv", user_model.export_transactions_to_csv),
+    ("xlsx", export_service.export_transactions_to_excel),
+    ("pdf", export_service.export_transactions_to_pdf),
+]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "ledger.csv")
+        write_csv(source, rows)
+        database.set_database(os.path.join(tmp, "bench.db"))
+        user_model.initialize_database()
+        import_service.import_csv(1, source)
+
+        for extension, export in EXPORTS:
+            filename = os.path.join(tmp, f"export.{extension}")
+            started = time.perf_counter()
+            export(1, filename)
+            seconds = time.perf_counter() - started
+
+            # Second run under tracemalloc, which slows Python down too much to time
+            tracemalloc.start()
+            export(1, filename)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{extension:5} {rows:,} rows in {seconds:6.2f}s ({rows / seconds:,.0f} rows/s), "
+                  f"peak {peak / 2**20:.1f} MiB, file {os.path.getsize(filename) / 2**20:.1f} MiB")
+
+        exports = {"csv": os.path.join(tmp, "all.csv"), "excel": os.path.join(tmp, "all.xlsx"),
+                   "pdf": os.path.join(tmp, "all.pdf")}
+        report = export_service.export_transactions(1, exports)
+        formats = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in report.seconds.items())
+        print(f"all   {rows:,} rows in {report.total_seconds:6.2f}s (read {report.read_seconds:.2f}s; {formats})")
+        database.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
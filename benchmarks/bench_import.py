@@ -0,0 +1,60 @@
+# bench_import.py
+#
+# Bulk import throughput. Writes a CSV in the layout produced by
+# export_transactions_to_csv (newest first), imports it into an empty database as an
+# exclusive initial load and reports rows/second. The target is >= 100k rows/s.
+#
+#   python benchmarks/bench_import.py [rows]
+
+import csv
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import database, user_model  # noqa: E402
+from services import import_service  # noqa: E402
+
+CATEGORIES = ["Daily", "Market", "Rent", "Utilities", "Travel", "Health", "Salary", "Gifts"]
+TARGET_ROWS_PER_SECOND = 100_000
+
+
+def write_csv(filename, rows):
+    rng = random.Random(42)
+    day = date(2024, 12, 31)
+    with open(filename, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["ID", "User ID", "Price", "Category", "Type", "Date", "Description"])
+        for i in range(rows):
+            if rng.random() < 0.002:
+                day -= timedelta(days=1)
+            category = rng.choice(CATEGORIES)
+            kind = "income" if category == "Salary" else "expense"
+            writer.writerow([i + 1, 1, f"{rng.uniform(1, 500):.2f}", category, kind, day.isoformat(),
+                             f"Purchase {i}"])
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "ledger.csv")
+        write_csv(filename, rows)
+
+        database.set_database(os.path.join(tmp, "bench.db"))
+        user_model.initialize_database()
+        result = import_service.import_csv(1, filename, exclusive=True)
+        assert user_model.check_rollups(1) == []
+        database.close_all()
+
+    rate = result["imported"] / result["seconds"]
+    print(f"imported {result['imported']} rows in {result['seconds']:.2f}s: {rate:,.0f} rows/s "
+          f"(target {TARGET_ROWS_PER_SECOND:,})")
+    return 0 if rate >= TARGET_ROWS_PER_SECOND else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
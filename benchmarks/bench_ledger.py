@@ -0,0 +1,74 @@
+# bench_ledger.py
+#
+# Columnar ledger latency. Imports a synthetic ledger, loads the user's NumPy
+# snapshot once and times the analytics it serves (best of REPEAT runs); every
+# query should stay under a millisecond on the default 1M rows.
+#
+#   python benchmarks/bench_ledger.py [rows]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import database, ledger, user_model  # noqa: E402
+from services import import_service  # noqa: E402
+from bench_import import write_csv  # noqa: E402
+
+TARGET_QUERY_MS = 1.0
+REPEAT = 50
+
+
+def timed(func, *args):
+    """Best-of-REPEAT wall time of func(*args) in milliseconds"""
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "ledger.csv")
+        write_csv(filename, rows)
+        database.set_database(os.path.join(tmp, "bench.db"))
+        user_model.initialize_database()
+        import_service.import_csv(1, filename)
+
+        started = time.perf_counter()
+        snapshot = ledger.get_ledger(1)
+        load_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        snapshot.aggregates()
+        print(f"loaded {len(snapshot):,} rows in {load_seconds:.2f}s, "
+              f"prefix sums built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        assert snapshot.summary() == user_model.get_financial_summary(1)
+        queries = [
+            ("summary", snapshot.summary),
+            ("summary, one month", lambda: snapshot.summary("2024-06-01", "2024-06-30")),
+            ("expenses by category", snapshot.totals_by_category),
+            ("expenses by category, one quarter",
+             lambda: snapshot.totals_by_category("expense", "2024-04-01", "2024-06-30")),
+            ("daily balance, one month", lambda: snapshot.daily_balance("2024-06-01", "2024-06-30")),
+            ("cached get_ledger", lambda: ledger.get_ledger(1)),
+        ]
+        failed = False
+        for name, query in queries:
+            ms = timed(query)
+            failed |= ms > TARGET_QUERY_MS
+            print(f"{ms:8.3f} ms  {name}")
+        database.close_all()
+
+    print(f"target: every query under {TARGET_QUERY_MS} ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
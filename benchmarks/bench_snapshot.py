@@ -0,0 +1,100 @@
+# bench_snapshot.py
+#
+# Columnar snapshots against the CSV export on a synthetic ledger (see synthetic.py):
+# export time and file size per format, then the cost of getting the data back -
+# loading the file into typed columns, building an analytics ledger from it and
+# re-importing it as a new user.
+#
+#   python benchmarks/bench_snapshot.py [10k|1m|10m|rows]
+
+import csv
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import synthetic  # noqa: E402
+from models import database, instrumentation, ledger, user_model  # noqa: E402
+from services import export_service, import_service, snapshot_service  # noqa: E402
+
+EXPORTS = [
+    ("csv", "csv", lambda user_id, filename: user_model.export_transactions_to_csv(user_id, filename)),
+    ("arrow", "arrow", export_service.export_transactions_to_arrow),
+    ("arrow+zstd", "arrow",
+     lambda user_id, filename: export_service.export_transactions_to_arrow(user_id, filename, compression="zstd")),
+    ("parquet", "parquet", export_service.export_transactions_to_parquet),
+]
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def load_csv(filename):
+    """The CSV export parsed back into typed columns, for comparison with open_snapshot"""
+    with open(filename, newline="", encoding="utf-8") as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader)
+        _, _, prices, categories, types, dates, descriptions = zip(*reader)
+    return (np.array(prices, dtype=np.float64), categories, types, np.array(dates, dtype="datetime64[D]"),
+            descriptions)
+
+
+def load_snapshot(filename):
+    table = snapshot_service.open_snapshot(filename)
+    # Touch every price, so a mapped file is actually read
+    return table, float(np.sum(table.column("price").to_numpy()))
+
+
+def new_user(username):
+    with database.get_connection() as connection:
+        return connection.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                                  (username, synthetic.PASSWORD)).lastrowid
+
+
+def main():
+    rows = synthetic.rows_for_size(sys.argv[1]) if len(sys.argv) > 1 else synthetic.SIZES["1m"]
+    instrumentation.configure(enabled=False)  # Timed here; no slow-call log in the output
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        users = synthetic.build_database(path, rows, users=1)
+        database.set_database(path)
+        user_id = users[0][0]
+        print(f"{rows:,} rows")
+
+        files = {}
+        for name, extension, export in EXPORTS:
+            filename = os.path.join(tmp, f"{name.replace('+', '-')}.{extension}")
+            _, seconds = timed(export, user_id, filename)
+            files[name] = filename
+            print(f"export {name:11} {seconds:6.2f}s ({rows / seconds:9,.0f} rows/s), "
+                  f"{os.path.getsize(filename) / 2**20:7.1f} MiB")
+
+        _, seconds = timed(load_csv, files["csv"])
+        print(f"load   {'csv':11} {seconds:6.3f}s")
+        for name in ("arrow", "arrow+zstd", "parquet"):
+            (table, _), seconds = timed(load_snapshot, files[name])
+            _, ledger_seconds = timed(ledger.from_snapshot, table)
+            print(f"load   {name:11} {seconds:6.3f}s, ledger from it {ledger_seconds:6.3f}s")
+        ledger.clear()
+        _, seconds = timed(ledger.get_ledger, user_id)
+        print(f"ledger from SQL     {seconds:6.3f}s")
+
+        # The CSV export has no tags column, so its re-import writes fewer rows
+        for name, reimport in (("csv", import_service.import_csv), ("arrow", import_service.import_snapshot)):
+            result, seconds = timed(reimport, new_user(f"reimport-{name}"), files[name])
+            tags = "without" if name == "csv" else "with"
+            print(f"import {name:11} {seconds:6.2f}s ({result['imported'] / seconds:9,.0f} rows/s, {tags} tags)")
+        database.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# bench_startup.py
+#
+# Cold-start cost of the desktop app. Runs `python -X importtime` on src/main.py in
+# a fresh interpreter, reports the slowest imports and fails if a heavy dependency
+# is imported before the login window or the import budget is exceeded. When a
+# display is available it also times construction of the login window. Finally it
+# times a simple command of the headless CLI (src/cli.py), which must not import any
+# GUI or plotting module either.
+#
+#   python benchmarks/bench_startup.py
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Must only be imported after login (see DEFERRED_IMPORTS in main.py)
+HEAVY_MODULES = ("dateparser", "matplotlib", "pandas", "reportlab", "numpy")
+IMPORT_BUDGET_MS = 250
+LOGIN_WINDOW_BUDGET_MS = 500
+CLI_BUDGET_MS = 100
+CLI_MODULES = HEAVY_MODULES + ("tkinter", "pyarrow")
+CLI_RUNS = 10
+
+LOGIN_WINDOW_SCRIPT = """
+import time
+start = time.perf_counter()
+import main
+app = main.FinanceTrackerApp()
+app.update()
+print((time.perf_counter() - start) * 1000)
+app.destroy()
+"""
+
+
+def import_times():
+    """Return [(module, cumulative_us)] for `import main` in a fresh interpreter"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        times.append((module.strip(), int(cumulative)))
+    return times
+
+
+def login_window_ms():
+    """Time from interpreter start of `import main` to a drawn login window, or None without a display"""
+    result = subprocess.run([sys.executable, "-c", LOGIN_WINDOW_SCRIPT], cwd=SRC_DIR,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def cli_ms():
+    """Best wall time of `cli.py users` in a fresh interpreter, and the unwanted modules it imported"""
+    with tempfile.TemporaryDirectory() as tmp:
+        command = [os.path.join(SRC_DIR, "cli.py"), "--db", os.path.join(tmp, "cli.db"), "users"]
+        subprocess.run([sys.executable, *command], check=True, capture_output=True)  # Creates the database
+        best = float("inf")
+        for _ in range(CLI_RUNS):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, *command], check=True, capture_output=True)
+            best = min(best, time.perf_counter() - started)
+        result = subprocess.run([sys.executable, "-X", "importtime", *command], check=True,
+                                capture_output=True, text=True)
+    modules = {line.split("|")[-1].strip().split(".")[0] for line in result.stderr.splitlines()
+               if line.startswith("import time:")}
+    return best * 1000, sorted(modules & set(CLI_MODULES))
+
+
+def main():
+    times = import_times()
+    total_ms = dict(times)["main"] / 1000
+    heavy = sorted({module.split(".")[0] for module, _ in times} & set(HEAVY_MODULES))
+
+    print(f"import main: {total_ms:.1f} ms (budget {IMPORT_BUDGET_MS} ms)")
+    print("slowest imports:")
+    for module, cumulative in sorted(times, key=lambda item: item[1], reverse=True)[1:6]:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    failed = total_ms > IMPORT_BUDGET_MS
+    if heavy:
+        print(f"heavy modules imported at startup: {', '.join(heavy)}")
+        failed = True
+
+    window_ms = login_window_ms()
+    if window_ms is None:
+        print("login window: skipped (no display)")
+    else:
+        print(f"time to login window: {window_ms:.1f} ms (budget {LOGIN_WINDOW_BUDGET_MS} ms)")
+        failed = failed or window_ms > LOGIN_WINDOW_BUDGET_MS
+
+    command_ms, cli_heavy = cli_ms()
+    print(f"cli.py users: {command_ms:.1f} ms, whole process (budget {CLI_BUDGET_MS} ms)")
+    if cli_heavy:
+        print(f"modules imported by the CLI: {', '.join(cli_heavy)}")
+    failed = failed or command_ms > CLI_BUDGET_MS or bool(cli_heavy)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+# bench_suite.py
+#
+# Benchmark suite over a synthetic ledger (see synthetic.py), run headless by pytest.
+# It times every public user_model function, each export path, snapshot loading and the data
+# preparation behind the charts, all for the user holding the most rows.
+#
+#   python -m pytest benchmarks/bench_suite.py -q                # 10k rows
+#   BENCH_SIZE=1m python -m pytest benchmarks/bench_suite.py -q  # 1m, 10m or a row count
+#
+# Results are written as JSON to BENCH_OUTPUT (default
+# benchmarks/results/<size>-<commit>.json): the run's environment plus min, median,
+# mean and max seconds per benchmark. Compare two runs with compare_results.py.
+
+import datetime
+import inspect
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import synthetic  # noqa: E402
+from models import analytics, database, ledger, schema, user_model  # noqa: E402
+from services import export_service, snapshot_service  # noqa: E402
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SIZE = os.environ.get("BENCH_SIZE", "10k")
+
+# Each benchmark repeats until it has run for TIME_BUDGET seconds, at least MIN_REPEAT
+# and at most MAX_REPEAT times. Calls faster than WARMUP_LIMIT get an untimed first run.
+TIME_BUDGET = float(os.environ.get("BENCH_TIME_BUDGET", 0.5))
+MIN_REPEAT = 1
+MAX_REPEAT = 200
+WARMUP_LIMIT = 0.1
+
+# A PDF of the whole ledger renders at a few thousand rows/s; above this it is skipped
+PDF_FULL_MAX_ROWS = 200_000
+QUARTER = ("2024-10-01", "2024-12-31")
+YEAR = ("2024-01-01", "2024-12-31")
+
+Dataset = namedtuple("Dataset", ["rows", "users", "user_id", "user_rows", "directory", "password_hash",
+                                 "transaction_id"])
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=BENCHMARK_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Recorder:
+    """Times benchmarks and collects their statistics"""
+
+    def __init__(self):
+        self.results = {}
+
+    def __call__(self, name, func, *args, setup=None, rows=None, **extra):
+        """Time func(*args), or func(*setup()) with fresh arguments for every call; returns the last result"""
+        timings = []
+        warmed_up = False
+        while True:
+            call_args = setup() if setup else args
+            started = time.perf_counter()
+            result = func(*call_args)
+            elapsed = time.perf_counter() - started
+            if not warmed_up and not timings and elapsed < WARMUP_LIMIT:
+                warmed_up = True  # Discard the first, cold call of quick functions
+                continue
+            timings.append(elapsed)
+            if len(timings) >= MAX_REPEAT or (len(timings) >= MIN_REPEAT and sum(timings) >= TIME_BUDGET):
+                break
+        self.results[name] = dict(
+            min=min(timings),
+            median=statistics.median(timings),
+            mean=statistics.fmean(timings),
+            max=max(timings),
+            repeat=len(timings),
+            rows=rows,
+            **extra,
+        )
+        return result
+
+    def write(self, filename, dataset):
+        commit = _git("rev-parse", "--short", "HEAD")
+        report = {
+            "meta": {
+                "size": SIZE,
+                "rows": dataset.rows,
+                "users": len(dataset.users),
+                "benchmark_user_rows": dataset.user_rows,
+                "generator_version": synthetic.GENERATOR_VERSION,
+                "schema_version": schema.LATEST_VERSION,
+                "commit": commit,
+                "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "time_budget": TIME_BUDGET,
+                "finished": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            },
+            "results": dict(sorted(self.results.items())),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with open(filename, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+            output.write("\n")
+        return report
+
+
+@pytest.fixture(scope="session")
+def dataset(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("bench")
+    rows = synthetic.rows_for_size(SIZE)
+    path = str(directory / "ledger.db")
+    users = synthetic.build_database(path, rows)
+    database.set_database(path)
+    user_id, user_rows = users[0]
+    transaction_id = database.get_connection().execute(
+        "SELECT id FROM transactions WHERE user_id = ? ORDER BY id LIMIT 1", (user_id,)
+    ).fetchone()[0]
+    yield Dataset(rows, users, user_id, user_rows, directory, user_model.hash_password(synthetic.PASSWORD),
+                  transaction_id)
+    database.close_all()
+
+
+@pytest.fixture(scope="session")
+def record(dataset):
+    recorder = Recorder()
+    yield recorder
+    filename = os.environ.get("BENCH_OUTPUT") or os.path.join(
+        BENCHMARK_DIR, "results", f"{SIZE}-{_git('rev-parse', '--short', 'HEAD') or 'unknown'}.json"
+    )
+    recorder.write(filename, dataset)
+    print(f"\nbenchmark results written to {filename}")
+
+
+_counter = itertools.count(1)
+
+
+def _unique(prefix):
+    return f"{prefix} {os.getpid()}-{next(_counter)}"
+
+
+def _consume(batches):
+    return sum(len(batch) for batch in batches)
+
+
+def _new_transaction(data):
+    return user_model.add_transaction(data.user_id, 9.99, "Dining", "expense", "2024-06-15", "Benchmark lunch")
+
+
+def _new_category(data):
+    name = _unique("Category")
+    user_model.add_category(data.user_id, name)
+    return data.user_id, name
+
+
+# user_model function -> (data -> (args, setup)); setup, when given, returns fresh arguments per call
+USER_MODEL_BENCHMARKS = {
+    "connect_db": lambda data: ((), None),
+    "initialize_database": lambda data: ((), None),
+    "hash_password": lambda data: ((synthetic.PASSWORD,), None),
+    "verify_password": lambda data: ((data.password_hash, synthetic.PASSWORD), None),
+    "create_user": lambda data: (None, lambda: (_unique("bench user"), synthetic.PASSWORD)),
+    "authenticate_user": lambda data: (("user001", synthetic.PASSWORD), None),
+    "add_category": lambda data: (None, lambda: (data.user_id, _unique("Category"))),
+    "get_categories": lambda data: ((data.user_id,), None),
+    "add_tag": lambda data: (None, lambda: (data.user_id, _unique("tag"))),
+    "get_tag_id": lambda data: ((data.user_id, "work"), None),
+    "add_tags_to_transaction": lambda data: (None, lambda: (data.transaction_id, [_unique("tag")], data.user_id)),
+    "add_transaction": lambda data: ((data.user_id, 9.99, "Dining", "expense", "2024-06-15", "Benchmark lunch"),
+                                     None),
+    "get_transactions": lambda data: ((data.user_id,), None),
+    "get_financial_summary": lambda data: ((data.user_id,), None),
+    "delete_transaction": lambda data: (None, lambda: (_new_transaction(data),)),
+    "get_expenses_by_category": lambda data: ((data.user_id,), None),
+    "rebuild_rollups": lambda data: ((data.user_id,), None),
+    "check_rollups": lambda data: ((data.user_id,), None),
+    "iter_transactions": lambda data: ((data.user_id,), None),
+    "export_transactions_to_csv": lambda data: ((data.user_id, str(data.directory / "user_model.csv")), None),
+    "get_transactions_filtered": lambda data: ((data.user_id, "Dining", ["work"]), None),
+    "get_transactions_page": lambda data: ((data.user_id,), None),
+    "page_key": lambda data: (((data.transaction_id, data.user_id, 9.99, "Dining", "expense", "2024-06-15", ""),),
+                              None),
+    "fts_query": lambda data: (("whole foods",), None),
+    "search_transactions": lambda data: ((data.user_id, "whole foods"), None),
+    "get_tags_for_transaction": lambda data: ((data.transaction_id,), None),
+    "get_tags_for_transactions": lambda data: ((list(range(data.transaction_id, data.transaction_id + 100)),),
+                                               None),
+    "delete_category": lambda data: (None, lambda: _new_category(data)),
+}
+
+
+def _public_functions(module):
+    return {name for name, value in vars(module).items()
+            if inspect.isfunction(value) and value.__module__ == module.__name__ and not name.startswith("_")}
+
+
+def test_every_public_user_model_function_is_benchmarked():
+    assert _public_functions(user_model) == set(USER_MODEL_BENCHMARKS)
+
+
+@pytest.mark.parametrize("name", sorted(USER_MODEL_BENCHMARKS))
+def test_user_model(record, dataset, name):
+    func = getattr(user_model, name)
+    args, setup = USER_MODEL_BENCHMARKS[name](dataset)
+    if name == "iter_transactions":
+        func = lambda *call_args: _consume(user_model.iter_transactions(*call_args))  # noqa: E731
+    # Cached reads are timed against the database; the cache hit is recorded separately
+    record(name, getattr(func, "uncached", func), *(args or ()), setup=setup)
+    if hasattr(func, "uncached"):
+        record(f"{name}[cached]", func, *args)
+
+
+EXPORTS = {
+    "csv": lambda user_id, filename, *filters: user_model.export_transactions_to_csv(user_id, filename, *filters),
+    "excel": export_service.export_transactions_to_excel,
+    "pdf": export_service.export_transactions_to_pdf,
+    "arrow": export_service.export_transactions_to_arrow,
+    "parquet": export_service.export_transactions_to_parquet,
+}
+EXTENSIONS = {"csv": "csv", "excel": "xlsx", "pdf": "pdf", "arrow": "arrow", "parquet": "parquet"}
+
+
+def _rows_between(data, start_date=None, end_date=None):
+    return database.get_connection().execute(
+        "SELECT COUNT(*) FROM transactions WHERE user_id = ? AND date >= ? AND date <= ?",
+        (data.user_id, start_date or "", end_date or "9999")
+    ).fetchone()[0]
+
+
+@pytest.mark.parametrize("period", ["quarter", "full"])
+@pytest.mark.parametrize("file_format", ["csv", "excel", "pdf", "arrow", "parquet", "all"])
+def test_export(record, dataset, file_format, period):
+    start_date, end_date = QUARTER if period == "quarter" else (None, None)
+    rows = _rows_between(dataset, start_date, end_date)
+    if file_format in ("pdf", "all") and rows > PDF_FULL_MAX_ROWS:
+        pytest.skip(f"{rows:,} rows is too many for a PDF benchmark (limit {PDF_FULL_MAX_ROWS:,})")
+
+    name = f"export.{file_format}[{period}]"
+    if file_format == "all":
+        exports = {kind: str(dataset.directory / f"all.{EXTENSIONS[kind]}") for kind in export_service.WRITERS}
+        report = record(name, export_service.export_transactions, dataset.user_id, exports, start_date, end_date,
+                        rows=rows)
+        assert report.rows == rows
+        # Per-format seconds of the last run, as reported by the job
+        record.results[name]["formats"] = report.seconds
+    else:
+        filename = str(dataset.directory / f"export.{EXTENSIONS[file_format]}")
+        assert record(name, EXPORTS[file_format], dataset.user_id, filename, start_date, end_date, rows=rows)
+
+
+def _chart_overview(user_id):
+    # What the Financial Overview window loads before drawing
+    return user_model.get_financial_summary.uncached(user_id), user_model.get_expenses_by_category.uncached(user_id)
+
+
+def _cold_ledger(user_id):
+    ledger.clear()
+    return ledger.get_ledger(user_id)
+
+
+def test_chart_data(record, dataset):
+    user_id = dataset.user_id
+    record("chart.overview", _chart_overview, user_id, rows=dataset.user_rows)
+    for period in analytics.PERIODS:
+        record(f"analytics.get_series[{period}]", analytics.get_series.uncached, user_id, period,
+               rows=dataset.user_rows)
+        record(f"analytics.get_series[{period}, year]", analytics.get_series.uncached, user_id, period, *YEAR)
+    record("analytics.get_category_trends[month]", analytics.get_category_trends.uncached, user_id, "month")
+    record("analytics.month_over_month", analytics.month_over_month, user_id)
+
+    snapshot = record("ledger.get_ledger[cold]", _cold_ledger, user_id, rows=dataset.user_rows)
+    record("ledger.aggregates", lambda: (setattr(snapshot, "_aggregates", None), snapshot.aggregates()))
+    record("ledger.summary[quarter]", snapshot.summary, *QUARTER)
+    record("ledger.totals_by_category[quarter]", snapshot.totals_by_category, "expense", *QUARTER)
+    record("ledger.daily_balance[year]", snapshot.daily_balance, *YEAR)
+    assert snapshot.summary() == user_model.get_financial_summary.uncached(user_id)
+
+
+@pytest.mark.parametrize("file_format", ["arrow", "parquet"])
+def test_snapshot_load(record, dataset, file_format):
+    filename = str(dataset.directory / f"snapshot.{EXTENSIONS[file_format]}")
+    assert EXPORTS[file_format](dataset.user_id, filename)
+    table = record(f"snapshot.open[{file_format}]", snapshot_service.open_snapshot, filename, rows=dataset.user_rows)
+    snapshot = record(f"ledger.from_snapshot[{file_format}]", ledger.from_snapshot, table, rows=dataset.user_rows)
+    assert snapshot.summary() == user_model.get_financial_summary.uncached(dataset.user_id)
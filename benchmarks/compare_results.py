@@ -0,0 +1,79 @@
+# compare_results.py
+#
+# Compares two bench_suite.py result files benchmark by benchmark and flags
+# regressions: a benchmark that got slower by more than the threshold fraction.
+# Best times are compared, as they are the least disturbed by other load on the
+# machine. Exits with 1 when there is a regression, so it can gate a commit.
+#
+#   python benchmarks/compare_results.py baseline.json candidate.json [threshold]
+
+import json
+import sys
+
+DEFAULT_THRESHOLD = 0.25
+STATISTIC = "min"
+# Timings this short are dominated by noise; they are listed but never flagged
+MIN_SECONDS = 0.00005
+
+
+def load(filename):
+    with open(filename, encoding="utf-8") as results:
+        return json.load(results)
+
+
+def compare(baseline, candidate, threshold=DEFAULT_THRESHOLD):
+    """Rows of (name, baseline seconds, candidate seconds, ratio, verdict) for benchmarks in either run"""
+    rows = []
+    old_results, new_results = baseline["results"], candidate["results"]
+    for name in sorted(set(old_results) | set(new_results)):
+        old, new = old_results.get(name), new_results.get(name)
+        if old is None or new is None:
+            verdict = "added" if old is None else "removed"
+            rows.append((name, old and old[STATISTIC], new and new[STATISTIC], None, verdict))
+            continue
+        ratio = new[STATISTIC] / old[STATISTIC] if old[STATISTIC] else float("inf")
+        if max(old[STATISTIC], new[STATISTIC]) < MIN_SECONDS:
+            verdict = ""
+        elif ratio > 1 + threshold:
+            verdict = "REGRESSION"
+        elif ratio < 1 / (1 + threshold):
+            verdict = "faster"
+        else:
+            verdict = ""
+        rows.append((name, old[STATISTIC], new[STATISTIC], ratio, verdict))
+    return rows
+
+
+def _ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.3f}"
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("usage: compare_results.py baseline.json candidate.json [threshold]")
+        return 2
+    baseline, candidate = load(sys.argv[1]), load(sys.argv[2])
+    threshold = float(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_THRESHOLD
+
+    for key in ("rows", "generator_version", "cpus"):
+        if baseline["meta"].get(key) != candidate["meta"].get(key):
+            print(f"warning: runs differ in {key}: {baseline['meta'].get(key)} vs {candidate['meta'].get(key)}")
+    print(f"{baseline['meta'].get('commit')} -> {candidate['meta'].get('commit')}, "
+          f"{candidate['meta'].get('rows'):,} rows, threshold {threshold:.0%}")
+
+    rows = compare(baseline, candidate, threshold)
+    width = max(len(row[0]) for row in rows)
+    print(f"{'benchmark':{width}}  {'before ms':>12}  {'after ms':>12}  {'ratio':>7}")
+    for name, old, new, ratio, verdict in rows:
+        print(f"{name:{width}}  {_ms(old):>12}  {_ms(new):>12}  "
+              f"{'-' if ratio is None else f'{ratio:.2f}x':>7}  {verdict}")
+
+    regressions = [row[0] for row in rows if row[4] == "REGRESSION"]
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# synthetic.py
+#
+# Deterministic synthetic ledgers for benchmarks. The same (rows, users, seed) always
+# produces the same database: users hold Zipf-distributed shares of the rows, and
+# each user's transactions follow a realistic calendar over three years (monthly
+# salary and rent on the 1st, bills early in the month, more spending on weekends
+# and in later years), log-normal amounts per category, merchant descriptions and
+# tags on about a third of the rows.
+#
+# Rows go through import_service.import_rows, so rollups and the search index are
+# maintained exactly as for a real import. Built databases are cached by
+# build_database(), which makes the 1M and 10M presets a one-time cost.
+#
+#   python benchmarks/synthetic.py [10k|1m|10m|rows] [path]
+
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import database, schema, user_model  # noqa: E402
+from services import import_service  # noqa: E402
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+SEED = 20240101
+DEFAULT_USERS = 20
+# Bump when the generated data changes, so cached databases are rebuilt
+GENERATOR_VERSION = 1
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+
+FIRST_DAY = np.datetime64("2022-01-01")
+LAST_DAY = np.datetime64("2024-12-31")
+CHUNK_ROWS = 100_000
+PASSWORD = "benchmark"
+
+# category: (type, share of rows, median amount, log-normal sigma, day of month or None, merchants)
+CATEGORIES = {
+    "Groceries": ("expense", 0.22, 45.0, 0.6, None, ["Whole Foods", "Trader Joe's", "Safeway", "Aldi", "Costco"]),
+    "Dining": ("expense", 0.15, 28.0, 0.7, None, ["Chipotle", "Starbucks", "Sushi Bar", "Pizza Place", "Diner"]),
+    "Transport": ("expense", 0.11, 18.0, 0.8, None, ["Uber", "Lyft", "Shell", "Metro Card", "Parking"]),
+    "Shopping": ("expense", 0.09, 60.0, 1.0, None, ["Amazon", "Target", "IKEA", "Best Buy", "Zara"]),
+    "Entertainment": ("expense", 0.06, 25.0, 0.8, None, ["Netflix", "Cinema", "Spotify", "Concert", "Steam"]),
+    "Health": ("expense", 0.04, 70.0, 0.9, None, ["Pharmacy", "Dentist", "Clinic", "Gym", "Optician"]),
+    "Travel": ("expense", 0.03, 320.0, 1.1, None, ["Airline", "Hotel", "Airbnb", "Train", "Car Rental"]),
+    "Gifts": ("expense", 0.02, 50.0, 0.9, None, ["Florist", "Bookstore", "Toy Store", "Jeweler"]),
+    "Education": ("expense", 0.02, 120.0, 1.0, None, ["Coursera", "University", "Books", "Workshop"]),
+    "Personal Care": ("expense", 0.03, 35.0, 0.6, None, ["Salon", "Barber", "Spa", "Cosmetics"]),
+    "Household": ("expense", 0.04, 40.0, 0.9, None, ["Hardware Store", "Cleaning Supplies", "Home Depot"]),
+    "Insurance": ("expense", 0.02, 150.0, 0.3, 15, ["Car Insurance", "Home Insurance", "Life Insurance"]),
+    "Utilities": ("expense", 0.05, 90.0, 0.4, 7, ["Electric Co", "Water Utility", "Internet", "Phone Bill"]),
+    "Rent": ("expense", 0.01, 1500.0, 0.15, 1, ["Landlord"]),
+    "Salary": ("income", 0.018, 4200.0, 0.2, 1, ["Employer Payroll"]),
+    "Freelance": ("income", 0.02, 600.0, 0.8, None, ["Client Invoice", "Upwork", "Consulting"]),
+    "Interest": ("income", 0.01, 12.0, 1.0, 28, ["Savings Interest", "Dividend"]),
+    "Refunds": ("income", 0.01, 40.0, 0.9, None, ["Amazon Refund", "Store Credit", "Cashback"]),
+}
+TAGS = ["work", "family", "vacation", "reimbursable", "subscription", "gift", "tax-deductible", "recurring",
+        "weekend", "shared", "online", "cash"]
+TAGGED_SHARE = 0.35
+ZIPF_EXPONENT = 1.1
+
+# Spending by weekday, Monday first
+WEEKDAY_WEIGHTS = np.array([0.9, 0.9, 1.0, 1.0, 1.3, 1.6, 1.2])
+
+_NAMES = list(CATEGORIES)
+_TYPES = [CATEGORIES[name][0] for name in _NAMES]
+_SHARES = np.array([CATEGORIES[name][1] for name in _NAMES])
+_SHARES = _SHARES / _SHARES.sum()
+_MEDIANS = np.array([CATEGORIES[name][2] for name in _NAMES])
+_SIGMAS = np.array([CATEGORIES[name][3] for name in _NAMES])
+_FIXED_DAYS = np.array([CATEGORIES[name][4] or 0 for name in _NAMES])
+
+
+def rows_for_size(size):
+    """Row count of a preset name ('10k', '1m', '10m') or a plain number"""
+    size = str(size).lower().replace("_", "")
+    return SIZES[size] if size in SIZES else int(size)
+
+
+def user_row_counts(rows, users):
+    """Rows per user, Zipf-distributed: user 1 is the heaviest and every user gets at least one row"""
+    users = max(1, min(users, rows))
+    weights = 1 / np.arange(1, users + 1) ** ZIPF_EXPONENT
+    counts = np.floor(weights / weights.sum() * (rows - users)).astype(np.int64) + 1
+    counts[0] += rows - counts.sum()
+    return counts.tolist()
+
+
+def _calendar():
+    """Every day in the generated range and its relative chance of a discretionary expense"""
+    days = np.arange(FIRST_DAY, LAST_DAY + 1)
+    weekdays = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    growth = 1 + 0.5 * np.linspace(0, 1, len(days))  # Activity grows over the years
+    weights = WEEKDAY_WEIGHTS[weekdays] * growth
+    return days, weights / weights.sum()
+
+
+def generate_rows(rng, count, tags=True):
+    """count transactions as import_rows() tuples: (price, category, type, date, description, tags)"""
+    days, day_weights = _calendar()
+    for start in range(0, count, CHUNK_ROWS):
+        n = min(CHUNK_ROWS, count - start)
+        categories = rng.choice(len(_NAMES), size=n, p=_SHARES)
+        dates = rng.choice(days, size=n, p=day_weights)
+
+        # Bills and pay days land on a fixed day of their month
+        fixed = _FIXED_DAYS[categories]
+        months = dates.astype("datetime64[M]")
+        dates = np.where(fixed > 0, months.astype("datetime64[D]") + (fixed - 1), dates)
+
+        amounts = np.round(_MEDIANS[categories] * np.exp(rng.normal(0, _SIGMAS[categories])), 2)
+        merchants = rng.integers(0, 1 << 30, size=n)
+        references = rng.integers(1000, 99999, size=n)
+        tagged = rng.random(n) < TAGGED_SHARE if tags else np.zeros(n, dtype=bool)
+        tag_picks = rng.integers(0, len(TAGS), size=(n, 2))
+        tag_counts = rng.integers(1, 3, size=n)
+
+        date_strings = np.datetime_as_string(dates, unit="D").tolist()
+        rows = []
+        for i, category_index in enumerate(categories.tolist()):
+            name = _NAMES[category_index]
+            options = CATEGORIES[name][5]
+            description = f"{options[merchants[i] % len(options)]} #{references[i]}"
+            row_tags = [TAGS[t] for t in dict.fromkeys(tag_picks[i, :tag_counts[i]].tolist())] if tagged[i] else None
+            rows.append((float(amounts[i]), name, _TYPES[category_index], date_strings[i], description, row_tags))
+        yield from rows
+
+
+def populate(rows, users=DEFAULT_USERS, seed=SEED, tags=True, progress=None):
+    """Fill the current (freshly initialized) database; returns [(user_id, rows)] heaviest first"""
+    rng = np.random.default_rng(seed)
+    connection = database.get_connection()
+    password = user_model.hash_password(PASSWORD)  # bcrypt once rather than per user
+    created = []
+    done = 0
+    for index, count in enumerate(user_row_counts(rows, users), start=1):
+        with connection:
+            cursor = connection.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                                        (f"user{index:03d}", password))
+            user_id = cursor.lastrowid
+            connection.executemany(
+                "INSERT OR IGNORE INTO categories (user_id, name) VALUES (?, ?)",
+                [(user_id, name) for name in _NAMES]
+            )
+        import_service.import_rows(user_id, generate_rows(rng, count, tags), exclusive=True)
+        created.append((user_id, count))
+        done += count
+        if progress:
+            progress(done, rows)
+    return created
+
+
+def _cache_path(rows, users, seed):
+    return os.path.join(CACHE_DIR, f"ledger-{rows}-u{users}-s{seed}-g{GENERATOR_VERSION}-v{schema.LATEST_VERSION}.db")
+
+
+def build_database(path, rows, users=DEFAULT_USERS, seed=SEED, use_cache=True):
+    """Write the synthetic ledger to path (replacing it) and return [(user_id, rows)] heaviest first.
+
+    With use_cache the generated database is kept in CACHE_DIR and copied from there
+    on later calls with the same parameters.
+    """
+    cached = _cache_path(rows, users, seed)
+    if not (use_cache and os.path.exists(cached)):
+        target = cached if use_cache else path
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        partial = target + ".part"
+        if os.path.exists(partial):
+            os.remove(partial)
+        previous = database.get_database()
+        database.set_database(partial)
+        try:
+            user_model.initialize_database()
+            populate(rows, users, seed)
+            database.get_connection().execute("ANALYZE")
+        finally:
+            database.close_all()
+            database.set_database(previous)
+        os.replace(partial, target)
+    if use_cache:
+        shutil.copyfile(cached, path)
+
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(
+            "SELECT user_id, transaction_count FROM user_totals ORDER BY transaction_count DESC, user_id"
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def main():
+    rows = rows_for_size(sys.argv[1]) if len(sys.argv) > 1 else SIZES["10k"]
+    path = sys.argv[2] if len(sys.argv) > 2 else _cache_path(rows, DEFAULT_USERS, SEED)
+    started = time.perf_counter()
+    users = build_database(path, rows, use_cache=path != _cache_path(rows, DEFAULT_USERS, SEED))
+    print(f"{rows:,} rows for {len(users)} users in {time.perf_counter() - started:.1f}s: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+# cli.py
+#
+# Headless entry point for scripted jobs (nightly imports, exports, reports and
+# maintenance) over the desktop app's database. Nothing here imports Tk, matplotlib
+# or pandas, and each command imports only the services it uses, so simple commands
+# start in a few tens of milliseconds. Output is written as it is produced: results
+# go to stdout, progress and status messages to stderr.
+#
+#   python src/cli.py [--db PATH] [--stats FILE] [--synchronous LEVEL] COMMAND ...
+#   python src/cli.py users
+#   python src/cli.py summary --user alice --start "30 days ago"
+#   python src/cli.py export --user alice ledger.parquet
+#   python src/cli.py export --user alice - > ledger.csv
+#   python src/cli.py import --user alice statement.csv --tags bank [--exclusive]
+#   python src/cli.py rebuild-rollups --all [--check]
+#   python src/cli.py recurring --user alice [--materialize [--through DATE]]
+#   python src/cli.py bench [10k|1m|10m] [pytest arguments...]
+#   python src/cli.py serve [--host 127.0.0.1] [--port 8765] [--workers 8]
+#
+# (or `python -m cli ...` from src). Exit status is 0 on success, 1 when a command
+# fails or finds a problem, 2 for usage errors.
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+from models import database
+from models import user_model
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+# Output file extension -> export format
+EXPORT_FORMATS = {'.csv': 'csv', '.xlsx': 'excel', '.pdf': 'pdf', '.arrow': 'arrow', '.parquet': 'parquet'}
+SNAPSHOT_EXTENSIONS = ('.arrow', '.parquet')
+
+# Skipped import rows listed before the rest are only counted
+MAX_REPORTED_SKIPS = 10
+
+
+class CommandError(Exception):
+    """A command can't go ahead; the message is shown without a traceback"""
+
+
+def status(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+class Progress:
+    """Progress callback that redraws one stderr line, at most every interval seconds.
+
+    Only used when stderr is a terminal, so logs of scheduled jobs stay clean.
+    """
+
+    def __init__(self, unit, interval=0.2):
+        self.unit = unit
+        self.interval = interval
+        self.last = 0.0
+        self.count = 0
+
+    def __call__(self, done, total=None):
+        self.count = done
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            text = f"{done:,} of {total:,}" if total else f"{done:,}"
+            print(f"\r{text} {self.unit}", end='', file=sys.stderr, flush=True)
+
+    def finish(self):
+        if self.last:
+            print(file=sys.stderr, flush=True)
+
+
+def _progress(unit):
+    return Progress(unit) if sys.stderr.isatty() else None
+
+
+def _date(value):
+    from services import date_service
+
+    try:
+        return date_service.normalize_date(value, natural_language=True)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _user_id(username):
+    row = database.get_connection().execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    if row is None:
+        raise CommandError(f"no user named {username!r}")
+    return row[0]
+
+
+def _money(amount):
+    return f"{amount:,.2f}"
+
+
+def cmd_users(args):
+    """List users with their transaction counts"""
+    cursor = database.get_connection().execute("""
+        SELECT u.id, u.username, IFNULL(t.transaction_count, 0)
+        FROM users u LEFT JOIN user_totals t ON t.user_id = u.id
+        ORDER BY u.id
+    """)
+    for user_id, username, count in cursor:
+        print(f"{user_id}\t{username}\t{count}", flush=True)
+    return 0
+
+
+def cmd_summary(args):
+    """Income, expenses and net for a user, then expenses by category"""
+    user_id = _user_id(args.user)
+    income, expenses = user_model.get_financial_summary(user_id, args.start, args.end)
+    print(f"Income\t{_money(income)}")
+    print(f"Expenses\t{_money(expenses)}")
+    print(f"Net\t{_money(income - expenses)}", flush=True)
+    if not args.totals_only:
+        by_category = user_model.get_expenses_by_category(user_id, args.start, args.end)
+        for category, total in sorted(by_category.items(), key=lambda item: -item[1]):
+            print(f"{category}\t{_money(total)}")
+    return 0
+
+
+def _export_to_stdout(user_id, args):
+    import csv
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['ID', 'User ID', 'Price', 'Category', 'Type', 'Date', 'Description'])
+    rows = 0
+    for batch in user_model.iter_transactions(user_id, args.start, args.end, args.category):
+        writer.writerows(batch)
+        rows += len(batch)
+    sys.stdout.flush()
+    return rows
+
+
+def cmd_export(args):
+    """Export a user's transactions; the format follows the file's extension unless --format is given"""
+    user_id = _user_id(args.user)
+    started = time.perf_counter()
+    if args.file == '-':
+        if args.format not in (None, 'csv'):
+            raise CommandError("only CSV can be written to stdout")
+        rows = _export_to_stdout(user_id, args)
+        status(f"Exported {rows:,} transactions in {time.perf_counter() - started:.1f}s")
+        return 0
+
+    file_format = args.format or EXPORT_FORMATS.get(os.path.splitext(args.file)[1].lower())
+    if file_format is None:
+        raise CommandError(f"can't tell the format of {args.file}; use --format "
+                           f"({', '.join(sorted(set(EXPORT_FORMATS.values())))})")
+
+    from services import export_service
+    export = getattr(export_service, f"export_transactions_to_{file_format}")
+
+    progress = _progress("rows")
+    try:
+        exported = export(user_id, args.file, args.start, args.end, args.category, progress=progress)
+    finally:
+        if progress:
+            progress.finish()
+    if not exported:
+        status("No transactions to export")
+        return 0
+    status(f"Exported to {args.file} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+def cmd_import(args):
+    """Import a CSV file or an Arrow/Parquet snapshot for a user, committing in batches or, with
+    --exclusive, in one transaction"""
+    from services import import_service
+
+    user_id = _user_id(args.user)
+    if not os.path.exists(args.file):
+        raise CommandError(f"{args.file} does not exist")
+    importer = (import_service.import_snapshot if args.file.lower().endswith(SNAPSHOT_EXTENSIONS)
+                else import_service.import_csv)
+    tags = [tag.strip() for tag in args.tags.split(',')] if args.tags else None
+
+    progress = _progress("rows")
+    try:
+        result = importer(user_id, args.file, tags, progress=progress, exclusive=args.exclusive)
+    except ValueError as e:  # Not a ledger file; nothing was kept
+        raise CommandError(f"{args.file}: {e}")
+    finally:
+        if progress:
+            progress.finish()
+    print(f"Imported {result['imported']:,} transactions in {result['seconds']:.1f}s", flush=True)
+    skipped = result['skipped']
+    if skipped:
+        print(f"Skipped {len(skipped):,} invalid rows:")
+        for row_number, reason in skipped[:MAX_REPORTED_SKIPS]:
+            print(f"  row {row_number}: {reason}")
+        if len(skipped) > MAX_REPORTED_SKIPS:
+            print(f"  ... and {len(skipped) - MAX_REPORTED_SKIPS:,} more")
+    return 1 if skipped and not result['imported'] else 0
+
+
+def cmd_rebuild_rollups(args):
+    """Recompute (or with --check only verify) the rollup rows of some or all users"""
+    if args.all:
+        user_ids = [row[0] for row in database.get_connection().execute("SELECT id FROM users ORDER BY id")]
+    else:
+        user_ids = [_user_id(username) for username in args.user]
+
+    drifted = 0
+    for user_id in user_ids:
+        mismatches = user_model.check_rollups(user_id)
+        if args.check:
+            print(f"user {user_id}: {'ok' if not mismatches else f'{len(mismatches)} mismatches'}", flush=True)
+            for key, rollup_value, actual_value in mismatches:
+                print(f"  {key}: rollup {rollup_value}, transactions {actual_value}")
+        else:
+            started = time.perf_counter()
+            user_model.rebuild_rollups(user_id)
+            print(f"user {user_id}: rebuilt in {time.perf_counter() - started:.2f}s"
+                  f"{f' ({len(mismatches)} mismatches fixed)' if mismatches else ''}", flush=True)
+        drifted += bool(mismatches)
+    return 1 if args.check and drifted else 0
+
+
+def cmd_recurring(args):
+    """List a user's recurring rules with their pending occurrences, or materialize those"""
+    from models import recurring
+
+    user_id = _user_id(args.user)
+    if args.materialize:
+        written = recurring.materialize(user_id, args.through)
+        print(f"Materialized {written:,} transactions", flush=True)
+        return 0
+    for rule in recurring.get_rules(user_id):
+        pending = recurring.pending_count(rule, end_date=args.through)
+        every = rule.frequency if rule.interval == 1 else f"every {rule.interval} {rule.frequency}"
+        print(f"{rule.id}\t{every}\t{_money(rule.amount)}\t{rule.category}\t{rule.type}\t"
+              f"{rule.start_date}..{rule.end_date or ''}\t{pending} pending", flush=True)
+    return 0
+
+
+def cmd_bench(args):
+    """Run the benchmark suite (benchmarks/bench_suite.py) on a synthetic ledger"""
+    import subprocess
+
+    environment = dict(os.environ, BENCH_SIZE=args.size)
+    command = [sys.executable, "-m", "pytest", os.path.join(BENCHMARK_DIR, "bench_suite.py"), "-q", *args.pytest_args]
+    # The suite builds its own databases; its output goes straight to ours
+    return subprocess.call(command, env=environment)
+
+
+def cmd_serve(args):
+    """Serve the local JSON HTTP API (services/api_service.py) until interrupted"""
+    from services import api_service
+
+    server = api_service.create_server(args.host, args.port, args.workers, args.queue)
+    status(f"Serving {database.get_database()} on http://{args.host}:{server.server_address[1]} "
+           f"with {args.workers} workers; POST /login for a token, Ctrl+C stops")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Personal Finance Tracker, headless.")
+    parser.add_argument("--db", metavar="PATH", default=database.get_database(),
+                        help="database file (default: %(default)s)")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="record the data layer's call statistics and write them to FILE as JSON")
+    parser.add_argument("--synchronous", type=str.upper, choices=database.SYNCHRONOUS_LEVELS,
+                        help="SQLite sync level for commits (default: %s, or $FINANCE_SYNCHRONOUS)"
+                        % database.SYNCHRONOUS)
+    parser.add_argument("-v", "--verbose", action="store_true", help="log progress details and slow calls")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    def command(name, func, help_text):
+        subparser = commands.add_parser(name, help=help_text, description=func.__doc__)
+        subparser.set_defaults(func=func)
+        return subparser
+
+    def add_period(subparser):
+        subparser.add_argument("--start", type=_date, help="first day included (any date, or e.g. '30 days ago')")
+        subparser.add_argument("--end", type=_date, help="last day included")
+
+    command("users", cmd_users, "list users")
+
+    summary = command("summary", cmd_summary, "totals for a user")
+    summary.add_argument("--user", required=True)
+    add_period(summary)
+    summary.add_argument("--totals-only", action="store_true", help="leave out the expenses by category")
+
+    export = command("export", cmd_export, "export a user's transactions")
+    export.add_argument("--user", required=True)
+    export.add_argument("file", help="output file, or - for CSV on stdout")
+    export.add_argument("--format", choices=sorted(set(EXPORT_FORMATS.values())))
+    add_period(export)
+    export.add_argument("--category")
+
+    import_parser = command("import", cmd_import, "import transactions for a user")
+    import_parser.add_argument("--user", required=True)
+    import_parser.add_argument("file", help="CSV file in the export layout, or a .arrow/.parquet snapshot")
+    import_parser.add_argument("--tags", help="comma-separated tags added to every imported transaction")
+    import_parser.add_argument("--exclusive", action="store_true",
+                               help="load in one transaction that locks out other writers (faster initial loads)")
+
+    rollups = command("rebuild-rollups", cmd_rebuild_rollups, "recompute the rollup tables")
+    who = rollups.add_mutually_exclusive_group(required=True)
+    who.add_argument("--user", action="append", help="user to rebuild (repeatable)")
+    who.add_argument("--all", action="store_true", help="every user")
+    rollups.add_argument("--check", action="store_true", help="only report drift; exit status 1 if any")
+
+    recurring_parser = command("recurring", cmd_recurring, "list or materialize recurring transactions")
+    recurring_parser.add_argument("--user", required=True)
+    recurring_parser.add_argument("--materialize", action="store_true",
+                                  help="write the pending occurrences as transactions")
+    recurring_parser.add_argument("--through", type=_date, help="last day included (default: today)")
+
+    bench = command("bench", cmd_bench, "run the benchmark suite")
+    bench.add_argument("size", nargs="?", default="10k", help="10k, 1m, 10m or a row count (default: 10k)")
+    bench.add_argument("pytest_args", nargs=argparse.REMAINDER, help="passed on to pytest")
+
+    serve = command("serve", cmd_serve, "serve the JSON HTTP API")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    serve.add_argument("--port", type=int, default=8765, help="0 picks a free port (default: %(default)s)")
+    serve.add_argument("--workers", type=int, default=8, help="worker threads (default: %(default)s)")
+    serve.add_argument("--queue", type=int, default=32,
+                       help="connections that may wait for a worker before getting a 503 (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO if args.verbose else logging.ERROR)
+    # Call statistics cost a little on every statement; batch jobs only pay for them when asked
+    from models import instrumentation
+    instrumentation.configure(enabled=bool(args.stats or args.verbose))
+
+    if args.synchronous:
+        database.configure(synchronous=args.synchronous)
+    if args.command != "bench":
+        database.set_database(args.db)
+        user_model.initialize_database()
+    try:
+        return args.func(args)
+    except CommandError as e:
+        status(f"error: {e}")
+        return 1
+    except BrokenPipeError:
+        # Output piped into e.g. head, which stopped reading; don't fail again flushing at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if args.stats:
+            instrumentation.dump_json(args.stats)
+        database.close_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# diagnostics_window.py
+
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+
+from models import instrumentation
+from models import query_cache
+
+
+class DiagnosticsWindow(tk.Toplevel):
+    """Live view of the data layer's instrumentation (see models/instrumentation.py).
+
+    Shows call counts and latency percentiles per function, the most frequent SQL
+    and the slow-query log with query plans. Not reachable from any button: the
+    dashboard opens it with Ctrl+Shift+D.
+    """
+
+    REFRESH_MS = 1000
+    # (column id, heading, width)
+    FUNCTION_COLUMNS = [
+        ('function', 'Function', 230),
+        ('calls', 'Calls', 60),
+        ('errors', 'Errors', 55),
+        ('rows', 'Rows', 75),
+        ('mean', 'Mean ms', 75),
+        ('p50', 'p50 ms', 70),
+        ('p90', 'p90 ms', 70),
+        ('p99', 'p99 ms', 70),
+        ('max', 'Max ms', 75),
+    ]
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.title("Diagnostics")
+        self.geometry("880x600")
+        self.slow_query_count = None
+
+        controls = ttk.Frame(self)
+        controls.pack(fill='x', padx=10, pady=(10, 5))
+        self.enabled = tk.BooleanVar(value=instrumentation.is_enabled())
+        ttk.Checkbutton(controls, text="Record", variable=self.enabled, command=self.toggle).pack(side='left')
+        ttk.Label(controls, text="Slow query threshold (ms):").pack(side='left', padx=(15, 5))
+        self.threshold = tk.StringVar(value=f"{instrumentation.get_slow_query_seconds() * 1000:g}")
+        threshold_entry = ttk.Entry(controls, textvariable=self.threshold, width=8)
+        threshold_entry.pack(side='left')
+        threshold_entry.bind('<Return>', self.set_threshold)
+        threshold_entry.bind('<FocusOut>', self.set_threshold)
+        ttk.Button(controls, text="Save JSON...", command=self.save_json).pack(side='right')
+        ttk.Button(controls, text="Reset", command=self.reset).pack(side='right', padx=5)
+
+        self.cache_label = ttk.Label(self, text="", font=("Arial", 10))
+        self.cache_label.pack(anchor='w', padx=10)
+
+        notebook = ttk.Notebook(self)
+        notebook.pack(fill='both', expand=True, padx=10, pady=10)
+
+        self.functions = ttk.Treeview(notebook, columns=[column[0] for column in self.FUNCTION_COLUMNS],
+                                      show='headings')
+        for column_id, heading, width in self.FUNCTION_COLUMNS:
+            self.functions.heading(column_id, text=heading)
+            self.functions.column(column_id, width=width, anchor='w' if column_id == 'function' else 'e')
+        notebook.add(self.functions, text="Functions")
+
+        self.statements = ttk.Treeview(notebook, columns=('count', 'sql'), show='headings')
+        self.statements.heading('count', text='Count')
+        self.statements.heading('sql', text='Statement')
+        self.statements.column('count', width=70, anchor='e', stretch=False)
+        self.statements.column('sql', width=760, anchor='w')
+        notebook.add(self.statements, text="SQL")
+
+        self.slow_queries = tk.Text(notebook, wrap='word', font=("Courier", 10))
+        notebook.add(self.slow_queries, text="Slow Queries")
+
+        self.refresh()
+
+    def refresh(self):
+        """Redraw now and again every REFRESH_MS while the window is open"""
+        if not self.winfo_exists():
+            return
+        self.update_view()
+        self.after(self.REFRESH_MS, self.refresh)
+
+    def update_view(self):
+        stats = instrumentation.get_stats()
+
+        self.functions.delete(*self.functions.get_children())
+        for label, function in sorted(stats['functions'].items(), key=lambda item: -item[1]['total_seconds']):
+            self.functions.insert('', 'end', values=(
+                label, f"{function['calls']:,}", function['errors'], f"{function['rows']:,}",
+                *(f"{function[key] * 1000:.2f}"
+                  for key in ('mean_seconds', 'p50_seconds', 'p90_seconds', 'p99_seconds', 'max_seconds')),
+            ))
+
+        self.statements.delete(*self.statements.get_children())
+        for statement in stats['statements'][:100]:
+            self.statements.insert('', 'end', values=(f"{statement['count']:,}", statement['sql']))
+
+        # The log only grows, so it is redrawn only when there is something new
+        if len(stats['slow_queries']) != self.slow_query_count:
+            self.slow_query_count = len(stats['slow_queries'])
+            self.slow_queries.delete('1.0', 'end')
+            for entry in reversed(stats['slow_queries']):
+                self.slow_queries.insert('end', f"{entry['time']}  {entry['function']}  "
+                                                f"{entry['seconds'] * 1000:.1f} ms, "
+                                                f"{entry['statement_count']:,} statements\n")
+                for statement in entry['statements']:
+                    self.slow_queries.insert('end', f"  {statement['sql']}\n")
+                    for line in statement['plan']:
+                        self.slow_queries.insert('end', f"      {line}\n")
+                self.slow_queries.insert('end', "\n")
+
+        cache = query_cache.get_stats()
+        self.cache_label.config(text=f"Query cache: {cache['hits']:,} hits, {cache['misses']:,} misses "
+                                     f"({cache['hit_rate']:.0%}), {cache['size']} of {cache['max_entries']} entries")
+
+    def toggle(self):
+        instrumentation.configure(enabled=self.enabled.get())
+
+    def set_threshold(self, event=None):
+        try:
+            instrumentation.configure(slow_query_seconds=float(self.threshold.get()) / 1000)
+        except ValueError:
+            self.threshold.set(f"{instrumentation.get_slow_query_seconds() * 1000:g}")
+
+    def reset(self):
+        instrumentation.reset()
+        self.slow_query_count = None
+        self.update_view()
+
+    def save_json(self):
+        filename = filedialog.asksaveasfilename(
+            parent=self, defaultextension='.json', filetypes=[('JSON files', '*.json')],
+            title='Save Diagnostics As'
+        )
+        if filename:
+            instrumentation.dump_json(filename)
+            messagebox.showinfo("Diagnostics", f"Statistics saved to {filename}", parent=self)
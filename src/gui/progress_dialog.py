@@ -0,0 +1,55 @@
+# progress_dialog.py
+
+import tkinter as tk
+from tkinter import ttk
+
+
+class ProgressDialog(tk.Toplevel):
+    """Small window tracking a background job, with a Cancel button.
+
+    The bar stays indeterminate until update_progress() is given a total.
+    Closing the window cancels the job.
+    """
+
+    def __init__(self, master, title, message):
+        super().__init__(master)
+        self.title(title)
+        self.geometry("360x140")
+        self.resizable(False, False)
+        self.job = None
+
+        ttk.Label(self, text=message, font=("Arial", 12)).pack(pady=(15, 5))
+
+        self.progressbar = ttk.Progressbar(self, mode='indeterminate', length=300)
+        self.progressbar.pack(pady=5)
+        self.progressbar.start(15)
+
+        self.status_label = ttk.Label(self, text="", font=("Arial", 10))
+        self.status_label.pack()
+
+        ttk.Button(self, text="Cancel", command=self.cancel).pack(pady=5)
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+    def attach(self, job):
+        self.job = job
+
+    def update_progress(self, done, total=None, unit="rows"):
+        if not self.winfo_exists():
+            return
+        if total:
+            if self.progressbar['mode'] != 'determinate':
+                self.progressbar.stop()
+                self.progressbar.config(mode='determinate')
+            self.progressbar.config(maximum=total, value=done)
+            self.status_label.config(text=f"{done:,} of {total:,} {unit}")
+        else:
+            self.status_label.config(text=f"{done:,} {unit}")
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancel()
+        self.close()
+
+    def close(self):
+        if self.winfo_exists():
+            self.destroy()
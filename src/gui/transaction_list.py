@@ -0,0 +1,221 @@
+# transaction_list.py
+
+from tkinter import ttk
+from models import user_model
+
+
+class TransactionList(ttk.Frame):
+    """Transaction table that holds a bounded window of rows around the scroll position.
+
+    Rows are fetched page by page through user_model.get_transactions_page: scrolling
+    near the bottom appends the page after the last loaded row, scrolling near the
+    top prepends the page before the first one (the same keyset query, run in the
+    opposite direction). Once more than window_pages pages are loaded, the rows
+    furthest from the view are evicted, so memory and redraw cost stay the same
+    however far the user scrolls. With jobs (a JobExecutor) pages are fetched on
+    its thread pool and inserted when they arrive; without, on the Tk thread.
+    Clicking a heading re-sorts on the database side; remove() drops a row
+    without reloading.
+
+    With search set the list shows full-text matches in relevance order instead;
+    those pages are fetched by offset and the headings don't re-sort. With
+    include_recurring set, date-sorted pages also show the recurring occurrences
+    not yet posted, marked "(recurring)"; those rows can't be selected for deletion.
+    """
+
+    # (column id, heading, width, sort key understood by get_transactions_page or None)
+    COLUMNS = [
+        ('date', 'Date', 100, 'date'),
+        ('price', 'Price', 90, 'price'),
+        ('category', 'Category', 120, 'category'),
+        ('type', 'Type', 80, 'type'),
+        ('description', 'Description', 220, None),
+        ('tags', 'Tags', 140, None),
+    ]
+
+    # Fetch the next/previous page once the view is within this fraction of either end
+    PREFETCH_MARGIN = 0.1
+
+    def __init__(self, master, user_id, category=None, tags=None, search=None, include_recurring=False,
+                 page_size=200, window_pages=3, jobs=None):
+        super().__init__(master)
+        self.user_id = user_id
+        self.category = category
+        self.tags = tags
+        self.search = search
+        self.include_recurring = include_recurring
+        self.page_size = page_size
+        self.max_rows = page_size * window_pages
+        self.jobs = jobs
+
+        self.sort = 'date'
+        self.descending = True
+        self.keys = {}  # iid -> keyset position, for the loaded rows
+        self.first_key = None  # Keyset positions of the first and last loaded rows
+        self.last_key = None
+        self.first_offset = 0  # Position of the first loaded row in the list, for search pages
+        self.at_start = True  # Nothing before the first loaded row
+        self.at_end = False  # Nothing after the last loaded row
+        self.loading = None  # 'next' or 'previous' while a page is being fetched
+        self.load_pending = False  # A load_page call is already scheduled
+        self.generation = 0  # Bumped by reload(); pages fetched for an older one are dropped
+
+        self.tree = ttk.Treeview(self, columns=[column[0] for column in self.COLUMNS], show='headings')
+        for column_id, heading, width, sort_key in self.COLUMNS:
+            command = (lambda key=sort_key: self.sort_by(key)) if sort_key and not search else ''
+            self.tree.heading(column_id, text=heading, command=command)
+            self.tree.column(column_id, width=width, anchor='e' if column_id == 'price' else 'w')
+
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.scrollbar.pack(side='right', fill='y')
+
+        self.load_page('next')
+
+    def fetch(self, direction, edge_key, first_offset, count):
+        """Query the page before or after the loaded rows, in display order"""
+        if self.search:
+            if direction == 'next':
+                offset, limit = first_offset + count, self.page_size
+            else:
+                offset = max(0, first_offset - self.page_size)
+                limit = first_offset - offset
+            return user_model.search_transactions(
+                self.user_id, self.search, category=self.category, tags=self.tags, limit=limit, offset=offset
+            )
+        # The page before the first row is the page after it in the opposite order
+        backwards = direction == 'previous'
+        rows = user_model.get_transactions_page(
+            self.user_id, after=edge_key, limit=self.page_size, sort=self.sort,
+            descending=self.descending != backwards, category=self.category, tags=self.tags,
+            include_recurring=self.include_recurring
+        )
+        return rows[::-1] if backwards else rows
+
+    def load_page(self, direction):
+        """Fetch the page on one side of the loaded rows and add it to the view"""
+        self.load_pending = False
+        if self.loading or (self.at_end if direction == 'next' else self.at_start):
+            return
+        self.loading = direction
+        edge_key = self.last_key if direction == 'next' else self.first_key
+        args = (direction, edge_key, self.first_offset, len(self.tree.get_children()))
+        generation = self.generation
+
+        if self.jobs is None:
+            self.on_loaded(generation, direction, self.fetch(*args))
+        else:
+            self.jobs.submit(self.fetch, *args,
+                             on_success=lambda rows: self.on_loaded(generation, direction, rows),
+                             on_error=lambda error: self.on_load_error(generation, error))
+
+    def on_load_error(self, generation, error):
+        if generation == self.generation:
+            self.loading = None
+        raise error  # Reported by the executor like any failed callback
+
+    def on_loaded(self, generation, direction, rows):
+        if generation != self.generation or not self.winfo_exists():
+            return  # Re-sorted or closed while the page was in flight
+        self.loading = None
+        children = self.tree.get_children()
+        first_visible = float(self.tree.yview()[0]) * len(children)
+
+        if direction == 'next':
+            for row in rows:
+                self.insert_row('end', row)
+            self.at_end = len(rows) < self.page_size
+            if rows and not self.search:
+                self.last_key = user_model.page_key(rows[-1], self.sort)
+                self.first_key = self.first_key or user_model.page_key(rows[0], self.sort)
+        else:
+            for index, row in enumerate(rows):
+                self.insert_row(index, row)
+            self.first_offset -= len(rows)
+            self.at_start = self.first_offset == 0 if self.search else len(rows) < self.page_size
+            if rows and not self.search:
+                self.first_key = user_model.page_key(rows[0], self.sort)
+            first_visible += len(rows)
+
+        # Keep the window bounded: evict from the end away from the page just added
+        children = self.tree.get_children()
+        excess = len(children) - self.max_rows
+        if excess > 0:
+            if direction == 'next':
+                evicted = children[:excess]
+                self.first_key = self.keys.get(children[excess])
+                self.first_offset += excess
+                self.at_start = False
+                first_visible -= excess
+            else:
+                evicted = children[-excess:]
+                self.last_key = self.keys.get(children[-excess - 1])
+                self.at_end = False
+            for iid in evicted:
+                self.keys.pop(iid, None)
+            self.tree.delete(*evicted)
+            children = self.tree.get_children()
+
+        if (rows and direction == 'previous') or excess > 0:
+            # Rows were added or removed above the view: keep the same rows in view
+            self.tree.yview_moveto(max(0.0, first_visible) / max(1, len(children)))
+
+    def insert_row(self, index, row):
+        # A pending recurring occurrence has minus its rule's id; one row per date
+        recurring = row[0] < 0
+        iid = f"r{-row[0]}-{row[5]}" if recurring else str(row[0])
+        self.tree.insert('', index, iid=iid, values=(
+            row[5], f"${row[2]:.2f}", row[3], row[4], row[6] or '',
+            '(recurring)' if recurring else ', '.join(row[7])
+        ))
+        if not self.search:
+            self.keys[iid] = user_model.page_key(row, self.sort)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.load_pending or self.loading:
+            return
+        if float(last) >= 1 - self.PREFETCH_MARGIN and not self.at_end:
+            self.load_pending = True
+            self.after_idle(self.load_page, 'next')
+        elif float(first) <= self.PREFETCH_MARGIN and not self.at_start:
+            self.load_pending = True
+            self.after_idle(self.load_page, 'previous')
+
+    def sort_by(self, sort_key):
+        """Sort by a column; clicking the current sort column flips the direction"""
+        if sort_key == self.sort:
+            self.descending = not self.descending
+        else:
+            self.sort, self.descending = sort_key, sort_key == 'date'
+        self.reload()
+
+    def reload(self):
+        self.generation += 1
+        self.tree.delete(*self.tree.get_children())
+        self.keys.clear()
+        self.first_key = self.last_key = None
+        self.first_offset = 0
+        self.at_start = True
+        self.at_end = False
+        self.loading = None
+        self.load_page('next')
+        self.tree.yview_moveto(0)
+
+    def selected_ids(self):
+        return [int(iid) for iid in self.tree.selection() if iid.isdigit()]
+
+    def remove(self, transaction_id):
+        """Drop a row from the view without reloading the rest"""
+        iid = str(transaction_id)
+        if self.tree.exists(iid):
+            self.tree.delete(iid)
+            self.keys.pop(iid, None)
+        if not self.tree.get_children():
+            # The loaded rows are gone; pull in whatever follows
+            self.load_page('next')
+
+    def is_empty(self):
+        return not self.tree.get_children()
@@ -2,27 +2,44 @@
 
 import sys
 import os
-import textwrap
+import importlib
+import threading
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
 from tkinter import filedialog  # Dosya diyaloğu için
 from models import user_model  # Import user_model
-import dateparser
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import pandas as pd  # Excel için pandas
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas as pdf_canvas  # PDF için
-from reportlab.lib.utils import simpleSplit  # Metin sarmak için
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import Paragraph
-from reportlab.lib import colors
-from reportlab.platypus.tables import Table, TableStyle
+from models import database
+from models import recurring
+from services import date_service
+from services import export_service
+from services.job_service import JobExecutor
+from services.visualization_service import ChartController
+from gui.transaction_list import TransactionList
+from gui.progress_dialog import ProgressDialog
+from gui.diagnostics_window import DiagnosticsWindow
 
 # Ensure the project root directory is in the path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Heavy dependencies (dateparser, matplotlib, pandas, reportlab) are imported where they
+# are used, so none of them delays the login window. After login they are warmed in a
+# background thread so the first chart, export or new transaction doesn't pay for them.
+DEFERRED_IMPORTS = (
+    "dateparser",
+    "matplotlib.figure",
+    "pandas",
+    "reportlab.pdfgen.canvas",
+    "reportlab.platypus",
+)
+
+def warm_deferred_imports():
+    for module_name in DEFERRED_IMPORTS:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass  # Reported properly when the feature that needs it is used
+
 class FinanceTrackerApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -39,16 +56,28 @@ class FinanceTrackerApp(tk.Tk):
         style.configure('TButton', background='#5DADE2', foreground='white', font=('Arial', 12))
         style.map('TButton', background=[('active', '#3498DB')])
 
-        # Initialize the database
-        user_model.create_users_table()
-        user_model.create_transactions_table()
-        user_model.create_categories_table()
-        user_model.create_tags_table()
-        user_model.create_transaction_tags_table()
+        # Initialize the database (applies any pending schema migrations)
+        user_model.initialize_database()
+
+        # Queries, password hashing and exports run here so the window never freezes
+        self.jobs = JobExecutor(self, on_error=self.show_job_error)
+
+        # Hidden data-layer statistics, for tracking down slow calls
+        self.diagnostics_window = None
+        self.bind('<Control-Shift-D>', self.show_diagnostics)
 
         # Show the login window first
         self.show_login_window()
 
+    def show_job_error(self, error):
+        messagebox.showerror("Error", f"An error occurred in a background task: {error}")
+
+    def show_diagnostics(self, event=None):
+        if self.diagnostics_window is not None and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+        else:
+            self.diagnostics_window = DiagnosticsWindow(self)
+
     def show_login_window(self):
         if hasattr(self, 'main_frame'):
             self.main_frame.destroy()
@@ -61,6 +90,11 @@ class FinanceTrackerApp(tk.Tk):
         self.main_frame = MainApplication(self, user_id)
         self.main_frame.pack(expand=True, fill="both")
 
+        # Let the dashboard draw first, then load the heavy modules off the UI thread
+        if not getattr(self, 'imports_warmed', False):
+            self.imports_warmed = True
+            self.after(500, lambda: threading.Thread(target=warm_deferred_imports, daemon=True).start())
+
 class LoginFrame(ttk.Frame):
     def __init__(self, master):
         super().__init__(master)
@@ -118,18 +152,37 @@ class LoginFrame(ttk.Frame):
             messagebox.showerror("Error", "Please enter both username and password.")
             return
 
+        # bcrypt is deliberately slow; hash on a worker so the window keeps repainting
+        self.submit_button.config(state='disabled')
         if self.is_login:
-            user_id = user_model.authenticate_user(username, password)
-            if user_id:
-                self.master.show_main_window(user_id)
-            else:
-                messagebox.showerror("Error", "Invalid credentials.")
+            self.master.jobs.submit(
+                user_model.authenticate_user, username, password,
+                on_success=self.on_authenticated, on_error=self.on_submit_error
+            )
         else:
-            if user_model.create_user(username, password):
-                messagebox.showinfo("Success", "Account created! Please login.")
-                self.toggle_mode()
-            else:
-                messagebox.showerror("Error", "Username already exists.")
+            self.master.jobs.submit(
+                user_model.create_user, username, password,
+                on_success=self.on_user_created, on_error=self.on_submit_error
+            )
+
+    def on_authenticated(self, user_id):
+        if user_id:
+            self.master.show_main_window(user_id)
+        else:
+            self.submit_button.config(state='normal')
+            messagebox.showerror("Error", "Invalid credentials.")
+
+    def on_user_created(self, created):
+        self.submit_button.config(state='normal')
+        if created:
+            messagebox.showinfo("Success", "Account created! Please login.")
+            self.toggle_mode()
+        else:
+            messagebox.showerror("Error", "Username already exists.")
+
+    def on_submit_error(self, error):
+        self.submit_button.config(state='normal')
+        messagebox.showerror("Error", f"An error occurred: {error}")
 
 class MainApplication(ttk.Frame):
     def __init__(self, master, user_id):
@@ -145,6 +198,10 @@ class MainApplication(ttk.Frame):
         export_button = ttk.Button(self, text="Export Data", style='Accent.TButton', command=self.export_data)
         export_button.place(relx=0.95, rely=0.15, anchor="ne")  # Butonu biraz aşağıya taşıdık
 
+        # Import Data button
+        import_button = ttk.Button(self, text="Import Data", style='Accent.TButton', command=self.import_data)
+        import_button.place(relx=0.95, rely=0.22, anchor="ne")
+
         # Form to add a new transaction
         self.create_transaction_form()
 
@@ -186,6 +243,12 @@ class MainApplication(ttk.Frame):
         )
         filter_button.grid(row=0, column=3, padx=10)
 
+        # Recurring transactions button
+        recurring_button = ttk.Button(
+            button_frame, text="Recurring", style='Accent.TButton', command=self.manage_recurring
+        )
+        recurring_button.grid(row=0, column=5, padx=10)
+
         # Logout button
         logout_button = ttk.Button(self, text="Logout", command=self.logout)
         logout_button.place(relx=0.95, rely=0.95, anchor="se")
@@ -199,11 +262,11 @@ class MainApplication(ttk.Frame):
         chart_button.place(relx=0.50, rely=0.95, anchor="s")
 
     def export_data(self):
-        """Export user's transactions to CSV, Excel, or PDF."""
+        """Export user's transactions to CSV, Excel, PDF or a Parquet snapshot."""
         # Ask user to choose the export format
         format_window = tk.Toplevel(self)
         format_window.title("Select Export Format")
-        format_window.geometry("500x200")
+        format_window.geometry("660x200")
 
         ttk.Label(format_window, text="Select the format to export:", font=("Arial", 12)).pack(pady=10)
 
@@ -219,6 +282,13 @@ class MainApplication(ttk.Frame):
         pdf_button = ttk.Button(button_frame, text="PDF", command=lambda: self.save_file('pdf', format_window))
         pdf_button.grid(row=0, column=2, padx=10)
 
+        parquet_button = ttk.Button(button_frame, text="Parquet",
+                                    command=lambda: self.save_file('parquet', format_window))
+        parquet_button.grid(row=0, column=3, padx=10)
+
+        all_button = ttk.Button(button_frame, text="All Formats", command=lambda: self.save_all(format_window))
+        all_button.grid(row=0, column=4, padx=10)
+
     def save_file(self, file_format, format_window):
         """Handle the file saving based on selected format."""
         format_window.destroy()  # Close the format selection window
@@ -232,6 +302,9 @@ class MainApplication(ttk.Frame):
         elif file_format == 'pdf':
             filetypes = [('PDF files', '*.pdf')]
             defaultextension = '.pdf'
+        elif file_format == 'parquet':
+            filetypes = [('Parquet files', '*.parquet'), ('Arrow files', '*.arrow')]
+            defaultextension = '.parquet'
 
         filename = filedialog.asksaveasfilename(
             defaultextension=defaultextension,
@@ -239,137 +312,144 @@ class MainApplication(ttk.Frame):
             title='Save Transactions As'
         )
 
-        if filename:
-            transactions = user_model.get_transactions(self.user_id)
-            if not transactions:
-                messagebox.showwarning("No Data", "No transactions to export.")
-                return
+        if not filename:
+            return
 
-            if file_format == 'csv':
-                success = user_model.export_transactions_to_csv(self.user_id, filename)
-                if success:
-                    messagebox.showinfo("Success", f"Transactions exported successfully to {filename}")
-                else:
-                    messagebox.showerror("Error", "An error occurred during export.")
-            elif file_format == 'excel':
-                success = self.export_transactions_to_excel(transactions, filename)
-                if success:
-                    messagebox.showinfo("Success", f"Transactions exported successfully to {filename}")
-                else:
-                    messagebox.showerror("Error", "An error occurred during export.")
-            elif file_format == 'pdf':
-                success = self.export_transactions_to_pdf(transactions, filename)
-                if success:
-                    messagebox.showinfo("Success", f"Transactions exported successfully to {filename}")
-                else:
-                    messagebox.showerror("Error", "An error occurred during export.")
+        if file_format == 'parquet' and filename.lower().endswith('.arrow'):
+            file_format = 'arrow'
 
-    def export_transactions_to_excel(self, transactions, filename):
-        """Export transactions to an Excel file with text wrapping in the Description column."""
-        try:
-            # Convert transactions to a DataFrame
-            df = pd.DataFrame(transactions, columns=['ID', 'User ID', 'Price', 'Category', 'Type', 'Date', 'Description'])
+        if file_format in export_service.RENDERED_FORMATS:
+            # Rows are read on the worker and the workbook or report is rendered in the process
+            # pool; the file appears only once it is complete, so Cancel leaves nothing behind
+            def run(job):
+                return export_service.export_transactions(self.user_id, {file_format: filename},
+                                                          progress=job.report_progress,
+                                                          cpu_pool=self.master.jobs.cpu_pool)
+        else:
+            # CSV rows go straight to the file and Arrow encodes each batch in native code, so these
+            # are written on the worker itself; a cancelled export deletes its partial file
+            export = {
+                'csv': export_service.export_transactions_to_csv,
+                'parquet': export_service.export_transactions_to_parquet,
+                'arrow': export_service.export_transactions_to_arrow,
+            }[file_format]
+
+            def run(job):
+                return export(self.user_id, filename, progress=job.report_progress)
+
+        self.run_export(run, filename)
+
+    def run_export(self, run, filename):
+        """Run run(job) on a worker behind a progress dialog whose Cancel stops it"""
+        dialog = ProgressDialog(self, "Exporting", "Exporting transactions...")
+
+        def on_done(success):
+            dialog.close()
+            self.on_export_finished(success, filename)
+
+        def on_error(error):
+            dialog.close()
+            self.on_export_error(error)
+
+        job = self.master.jobs.submit(
+            run, pass_job=True, on_success=on_done, on_error=on_error,
+            # Rows are counted while reading, formats while rendering
+            on_progress=lambda done, total=None: dialog.update_progress(done, total, "formats" if total else "rows")
+        )
+        dialog.attach(job)
 
-            # Create a Pandas Excel writer using XlsxWriter as the engine
-            writer = pd.ExcelWriter(filename, engine='xlsxwriter')
-            df.to_excel(writer, index=False, sheet_name='Transactions')
+    def save_all(self, format_window):
+        """Export CSV, Excel and PDF files sharing one name from a single read of the transactions."""
+        format_window.destroy()
+        filename = filedialog.asksaveasfilename(title='Save Transactions As (all formats)')
+        if not filename:
+            return
+        base = os.path.splitext(filename)[0]
+        exports = {'csv': base + '.csv', 'excel': base + '.xlsx', 'pdf': base + '.pdf'}
 
-            # Get the xlsxwriter workbook and worksheet objects
-            workbook  = writer.book
-            worksheet = writer.sheets['Transactions']
+        dialog = ProgressDialog(self, "Exporting", "Exporting transactions...")
 
-            # Set the column width and format
-            worksheet.set_column('A:G', 20)
+        def run(job):
+            return export_service.export_transactions(self.user_id, exports, progress=job.report_progress,
+                                                      cpu_pool=self.master.jobs.cpu_pool)
 
-            # Create a format for text wrapping
-            wrap_format = workbook.add_format({'text_wrap': True})
+        def on_done(report):
+            dialog.close()
+            if not report:
+                self.on_export_finished(report, base)
+                return
+            timings = "\n".join(f"{os.path.basename(exports[file_format])}: {seconds:.1f}s"
+                                 for file_format, seconds in report.seconds.items())
+            messagebox.showinfo("Success", f"Exported {report.rows:,} transactions in "
+                                           f"{report.total_seconds:.1f}s\n\n{timings}")
+
+        def on_error(error):
+            dialog.close()
+            self.on_export_error(error)
+
+        job = self.master.jobs.submit(
+            run, pass_job=True, on_success=on_done, on_error=on_error,
+            # Rows are counted while reading, formats while rendering
+            on_progress=lambda done, total=None: dialog.update_progress(done, total, "formats" if total else "rows")
+        )
+        dialog.attach(job)
 
-            # Apply the text wrap format to the Description column
-            worksheet.set_column('G:G', 30, wrap_format)
+    def on_export_finished(self, success, filename):
+        if success:
+            messagebox.showinfo("Success", f"Transactions exported successfully to {filename}")
+        else:
+            # Exports read straight from the database and return False when there is nothing to export
+            messagebox.showwarning("No Data", "No transactions to export.")
 
-            # Close the Pandas Excel writer and output the Excel file
-            writer.save()
+    def on_export_error(self, error):
+        messagebox.showerror("Error", f"An error occurred during export: {error}")
 
-            return True
-        except Exception as e:
-            print(f"An error occurred during Excel export: {e}")
-            return False
+    def import_data(self):
+        """Import transactions from a CSV file in the export layout, or from a Parquet/Arrow snapshot."""
+        filename = filedialog.askopenfilename(
+            filetypes=[('CSV files', '*.csv'), ('Snapshots', '*.parquet *.arrow')],
+            title='Import Transactions From'
+        )
+        if not filename:
+            return
 
-    def export_transactions_to_pdf(self, transactions, filename):
-        """Export transactions to a PDF file with wrapped text in the Description field."""
-        try:
-            c = pdf_canvas.Canvas(filename, pagesize=letter)
-            width, height = letter
-
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(50, height - 50, "Transactions Report")
-
-            c.setFont("Helvetica", 12)
-            text_y = height - 80
-
-            # Define table headers
-            headers = ['ID', 'Price', 'Category', 'Type', 'Date', 'Description']
-
-            # Prepare data for the table
-            data = [headers]
-
-            for transaction in transactions:
-                desc = transaction[6]
-                # Wrap the description text
-                wrapped_desc = simpleSplit(desc, 'Helvetica', 12, 200)
-                data.append([
-                    str(transaction[0]),  # ID
-                    f"${transaction[2]:.2f}",  # Price
-                    transaction[3],  # Category
-                    transaction[4],  # Type
-                    transaction[5],  # Date
-                    '\n'.join(wrapped_desc)  # Wrapped Description
-                ])
-
-            # Create a table
-            table = Table(data, colWidths=[50, 60, 80, 60, 80, 200])
-
-            # Add style to the table
-            style = TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.gray),
-                ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
-                ('ALIGN',(0,0),(-1,-1),'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0,0), (-1,0), 12),
-                ('GRID', (0,0), (-1,-1), 1, colors.black),
-                ('VALIGN',(0,0),(-1,-1),'TOP'),
-            ])
-            table.setStyle(style)
-
-            # Calculate available space on the page
-            available_height = text_y - 50
-
-            # Build the table and split if necessary
-            table.wrapOn(c, width, available_height)
-            table_height = table._height
-
-            if table_height < available_height:
-                table.drawOn(c, 50, text_y - table_height)
-            else:
-                # If table is too long, split it
-                from reportlab.platypus import SimpleDocTemplate
-                doc = SimpleDocTemplate(filename, pagesize=letter)
-                elements = [table]
-                doc.build(elements)
-                c.save()
-                return True
-
-            c.save()
-            return True
-        except Exception as e:
-            print(f"An error occurred during PDF export: {e}")
-            return False
+        from services import import_service
+
+        dialog = ProgressDialog(self, "Importing", "Importing transactions...")
+
+        def run(job):
+            # A cancel raises JobCancelled inside the import, which rolls the whole file back
+            if filename.lower().endswith(('.parquet', '.arrow')):
+                return import_service.import_snapshot(self.user_id, filename, progress=job.report_progress)
+            return import_service.import_csv(self.user_id, filename, progress=job.report_progress)
+
+        def on_done(result):
+            dialog.close()
+            self.update_category_menu()
+            message = f"Imported {result['imported']:,} transactions."
+            if result['skipped']:
+                message += f"\n{len(result['skipped']):,} rows were skipped as invalid."
+            messagebox.showinfo("Import Finished", message)
+
+        def on_error(error):
+            dialog.close()
+            messagebox.showerror("Error", f"An error occurred during import: {error}")
+
+        job = self.master.jobs.submit(
+            run, pass_job=True, on_success=on_done, on_error=on_error, on_progress=dialog.update_progress
+        )
+        dialog.attach(job)
 
     def show_chart(self):
         """Display a detailed window with financial summaries and a Pie Chart that resizes and handles long category names."""
-        # Get total income and expenses
-        total_income, total_expenses = user_model.get_financial_summary(self.user_id)
+        # Query on a worker; the window is built once the numbers are back
+        def load():
+            return user_model.get_financial_summary(self.user_id), user_model.get_expenses_by_category(self.user_id)
+
+        self.master.jobs.submit(load, on_success=lambda data: self.build_chart_window(*data))
+
+    def build_chart_window(self, summary, expenses_by_category):
+        total_income, total_expenses = summary
         remaining_balance = total_income - total_expenses
     
         # Format amounts to two decimal places
@@ -417,185 +497,36 @@ class MainApplication(ttk.Frame):
         # Create a frame for the legend
         legend_frame = ttk.Frame(chart_window)
         legend_frame.pack(pady=5)
+
+        # Figure, axes and legends of both charts are kept alive for the life of the window
+        chart = ChartController(chart_window, legend_frame, chart_title_label)
+        chart.set_data(summary, expenses_by_category)
     
         # Change Chart Button
         change_chart_button = ttk.Button(
             summary_frame,
             text="Change Chart",
-            command=lambda: self.toggle_chart(canvas, ax, fig, chart_title_label, legend_frame)
+            command=lambda: self.toggle_chart(chart)
         )
         change_chart_button.pack(pady=10)
     
         # Create the initial Pie Chart (Expenses by Category)
-        fig, ax = plt.subplots(figsize=(8, 8))
-        self.current_chart = 'category'  # Keep track of current chart type
-    
-        # Get expenses by category
-        expenses_by_category = user_model.get_expenses_by_category(self.user_id)
-    
-        if not expenses_by_category:
+        if not chart.show('category'):
             messagebox.showinfo("No Data", "No expense data available to display.")
             chart_window.destroy()
             return
     
-        categories = list(expenses_by_category.keys())
-        amounts = list(expenses_by_category.values())
-    
-        # Handle long category names by wrapping text
-        wrapped_categories = ['\n'.join(textwrap.wrap(label, 15)) for label in categories]
-    
-        wedges, texts, autotexts = ax.pie(
-            amounts,
-            labels=wrapped_categories,
-            autopct='%1.1f%%',
-            startangle=90,
-            textprops={'fontsize': 10},
-            wedgeprops={'linewidth': 1, 'edgecolor': 'white'}
-        )
-        ax.axis('equal')
-        ax.set_title('Expenses by Category')
-    
-        # Remove the default matplotlib legend
-        # ax.legend(...)
-    
-        # Create a custom legend using Tkinter
-        self.create_custom_legend(legend_frame, categories, ax.patches)
-    
-        # Apply tight layout
-        fig.tight_layout()
-    
         # Embed the chart in the Tkinter window
-        canvas = FigureCanvasTkAgg(fig, master=chart_window)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=False)  # Allow canvas to expand
-        canvas.get_tk_widget().config(width=600, height=400)
-        # Update the chart when the window is resized
-        def on_resize(event):
-            # Prevent excessive redraws
-            if event.widget == chart_window:
-                new_width = event.width / 100
-                new_height = event.height / 100
-                fig.set_size_inches(new_width, new_height)
-                fig.tight_layout()
-                canvas.draw()
-        chart_window.bind('<Configure>', lambda event: canvas.draw())  # Her boyutlandırmada yeniden çizim
-
-    def toggle_chart(self, canvas, ax, fig, chart_title_label, legend_frame):
-        """Toggle the Pie Chart between Income vs Expenses and Expenses by Category"""
-        ax.clear()  # Clear the current axes
+        chart.widget.pack(fill=tk.BOTH, expand=False)
+        chart.widget.config(width=600, height=400)
 
-        if self.current_chart == 'category':
-            # Switch to Income vs Expenses chart
-            total_income, total_expenses = user_model.get_financial_summary(self.user_id)
-            if total_income == 0 and total_expenses == 0:
+    def toggle_chart(self, chart):
+        """Toggle the Pie Chart between Income vs Expenses and Expenses by Category"""
+        if chart.current == 'category':
+            if not chart.show('income_expense'):
                 messagebox.showinfo("No Data", "No income or expense data available to display.")
-                return
-            amounts = [total_income, total_expenses]
-            labels = ['Income', 'Expenses']
-            colors = ['green', 'red']
-
-            wedges, texts, autotexts = ax.pie(
-                amounts,
-                labels=labels,
-                autopct='%1.1f%%',
-                startangle=90,
-                colors=colors,
-                textprops={'fontsize': 12},
-                wedgeprops={'linewidth': 1, 'edgecolor': 'white'}
-            )
-            ax.axis('equal')
-            ax.set_title('Income vs Expenses')
-            chart_title_label.config(text="Income vs Expenses")
-
-            # Remove the old legend
-            for widget in legend_frame.winfo_children():
-                widget.destroy()
-
-            # Create a new custom legend
-            self.create_custom_legend(legend_frame, labels, wedges, colors)
-
-            self.current_chart = 'income_expense'
-        else:
-            # Switch to Expenses by Category chart
-            expenses_by_category = user_model.get_expenses_by_category(self.user_id)
-            if not expenses_by_category:
-                messagebox.showinfo("No Data", "No expense data available to display.")
-                return
-            categories = list(expenses_by_category.keys())
-            amounts = list(expenses_by_category.values())
-
-            # Handle long category names by wrapping text
-            wrapped_categories = ['\n'.join(textwrap.wrap(label, 15)) for label in categories]
-
-            wedges, texts, autotexts = ax.pie(
-                amounts,
-                labels=wrapped_categories,
-                autopct='%1.1f%%',
-                startangle=90,
-                textprops={'fontsize': 10},
-                wedgeprops={'linewidth': 1, 'edgecolor': 'white'}
-            )
-            ax.axis('equal')
-            ax.set_title('Expenses by Category')
-            chart_title_label.config(text="Expenses by Category")
-
-            # Remove the old legend
-            for widget in legend_frame.winfo_children():
-                widget.destroy()
-
-            # Create a new custom legend
-            self.create_custom_legend(legend_frame, categories, wedges)
-
-            self.current_chart = 'category'
-
-        # Apply tight layout and redraw the canvas
-        fig.tight_layout()
-        canvas.draw()
-
-
-    def create_custom_legend(self, parent_frame, labels, patches, colors=None):
-        """
-        Create a custom legend using Tkinter widgets.
-        :param parent_frame: The Tkinter frame where the legend will be placed.
-        :param labels: List of label strings.
-        :param patches: List of matplotlib Patch objects.
-        :param colors: Optional list of colors if patches do not contain color information.
-        """
-        # Clear any existing widgets in the legend frame
-        for widget in parent_frame.winfo_children():
-            widget.destroy()
-
-        # Create a title for the legend
-        legend_title = ttk.Label(parent_frame, text="Categories", font=("Arial", 14, "bold"))
-        legend_title.pack(anchor='w')
-
-        # Create a frame for the legend entries
-        entries_frame = ttk.Frame(parent_frame)
-        entries_frame.pack(anchor='w', pady=5)
-
-        for i, label in enumerate(labels):
-            # Get the color from the patch or use the provided color list
-            if colors:
-                color = colors[i] if i < len(colors) else 'black'
-            else:
-                color = patches[i].get_facecolor()
-                if isinstance(color, tuple) or isinstance(color, list):
-                    # Convert RGBA to HEX
-                    color = '#%02x%02x%02x' % (int(color[0]*255), int(color[1]*255), int(color[2]*255))
-                else:
-                    color = 'black'
-
-            # Create a colored square
-            color_label = ttk.Label(entries_frame, background=color, width=2)
-            color_label.pack(side='left', padx=(0,5))
-
-            # Create the text label
-            text_label = ttk.Label(entries_frame, text=label, font=("Arial", 12))
-            text_label.pack(side='left', padx=(0,15))
-
-        # Add some padding at the bottom
-        entries_frame.pack(pady=(0,10))
-    
+        elif not chart.show('category'):
+            messagebox.showinfo("No Data", "No expense data available to display.")
 
     def logout(self):
         self.master.show_login_window()
@@ -663,6 +594,19 @@ class MainApplication(ttk.Frame):
         self.description_text = tk.Text(form_frame, width=40, height=4, font=("Arial", 12), wrap="word")
         self.description_text.grid(row=4, column=1, padx=10, pady=5, sticky="w")
 
+        # Repeat: anything but "Never" saves a recurring rule starting on the date
+        ttk.Label(form_frame, text="Repeat:", font=("Arial", 12)).grid(row=5, column=0, padx=10, pady=5, sticky="e")
+        repeat_frame = ttk.Frame(form_frame)
+        repeat_frame.grid(row=5, column=1, padx=10, pady=5, sticky="w")
+        self.repeat_var = tk.StringVar(value="Never")
+        ttk.Combobox(
+            repeat_frame, textvariable=self.repeat_var, font=("Arial", 12), state='readonly', width=8,
+            values=["Never"] + [frequency.capitalize() for frequency in recurring.FREQUENCIES]
+        ).pack(side='left')
+        ttk.Label(repeat_frame, text="Until:", font=("Arial", 12)).pack(side='left', padx=(10, 5))
+        self.until_entry = ttk.Entry(repeat_frame, width=12, font=("Arial", 12))
+        self.until_entry.pack(side='left')
+
 
     def manage_categories(self):
         """Kategori yönetimi penceresini açar."""
@@ -759,19 +703,38 @@ class MainApplication(ttk.Frame):
             messagebox.showerror("Error", "Please enter the date.")
             return
 
-        parsed_date = dateparser.parse(date_input)
-        if parsed_date:
-            date = parsed_date.strftime("%Y-%m-%d")
-        else:
+        # Numeric dates are parsed directly; dateparser is loaded only for text like "yesterday"
+        try:
+            date = date_service.normalize_date(date_input, natural_language=True)
+        except ValueError:
             messagebox.showerror("Error", "Invalid date format. Please try again.")
             return
 
+        repeat = self.repeat_var.get()
+        if repeat != "Never":
+            self.add_recurring_rule(amount, category, transaction_type, date, repeat.lower(), description)
+            return
+
         # Add the transaction without tags
         transaction_id = user_model.add_transaction(self.user_id, amount, category, transaction_type, date, description)
 
         messagebox.showinfo("Success", "Transaction added successfully!")
         self.clear_form()
 
+    def add_recurring_rule(self, amount, category, transaction_type, date, frequency, description):
+        """Save the form as a rule; its occurrences show up as they fall due"""
+        until_input = self.until_entry.get().strip()
+        try:
+            until = date_service.normalize_date(until_input, natural_language=True) if until_input else None
+            recurring.add_rule(self.user_id, amount, category, transaction_type, date, frequency,
+                               end_date=until, description=description)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid recurring transaction: {e}")
+            return
+
+        messagebox.showinfo("Success", f"Recurring transaction added, repeating {frequency}.")
+        self.clear_form()
+
 
     def clear_form(self):
         self.price_var.set("")
@@ -783,63 +746,45 @@ class MainApplication(ttk.Frame):
         self.type_var.set("Expense")
         self.date_entry.delete(0, "end")
         self.description_text.delete("1.0", "end")
+        self.repeat_var.set("Never")
+        self.until_entry.delete(0, "end")
         #self.tags_entry.delete(0, "end")
 
     def delete_transaction(self):
-        transactions = user_model.get_transactions(self.user_id)
-
-        if not transactions:
+        if not user_model.get_transactions_page(self.user_id, limit=1):
             messagebox.showinfo("No Transactions", "No transactions to delete.")
             return
 
         delete_window = tk.Toplevel(self)
         delete_window.title("Delete Transaction")
-        delete_window.geometry("600x400")
-
-        canvas = tk.Canvas(delete_window)
-        scrollbar = ttk.Scrollbar(delete_window, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(
-                scrollregion=canvas.bbox("all")
-            )
-        )
-
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        delete_window.geometry("800x400")
 
-        for idx, transaction in enumerate(transactions):
-            frame = ttk.Frame(scrollable_frame)
-            frame.pack(pady=5, padx=10, fill='x')
+        # Rows are loaded page by page as the list scrolls
+        transaction_list = TransactionList(delete_window, self.user_id, jobs=self.master.jobs)
 
-            ttk.Label(frame, text=f"Transaction {idx + 1}:", font=("Arial", 12)).grid(row=0, column=0, padx=5, sticky="w")
-            ttk.Label(frame, text=f"Price: ${transaction[2]:.2f}", font=("Arial", 10)).grid(row=0, column=1, padx=5, sticky="w")
-            ttk.Label(frame, text=f"Category: {transaction[3]}", font=("Arial", 10)).grid(row=0, column=2, padx=5, sticky="w")
-            ttk.Label(frame, text=f"Type: {transaction[4]}", font=("Arial", 10)).grid(row=0, column=3, padx=5, sticky="w")
-            ttk.Label(frame, text=f"Date: {transaction[5]}", font=("Arial", 10)).grid(row=0, column=4, padx=5, sticky="w")
-
-            delete_button = ttk.Button(
-                frame, text="Delete", command=lambda t_id=transaction[0]: self.confirm_delete(t_id, delete_window)
-            )
-            delete_button.grid(row=0, column=5, padx=5)
+        ttk.Button(
+            delete_window, text="Delete Selected",
+            command=lambda: self.confirm_delete(transaction_list)
+        ).pack(side="bottom", pady=10)
+        transaction_list.pack(fill="both", expand=True)
+
+    def confirm_delete(self, transaction_list):
+        transaction_ids = transaction_list.selected_ids()
+        if not transaction_ids:
+            messagebox.showwarning("No Selection", "Please select a transaction to delete.")
+            return
 
-    def confirm_delete(self, transaction_id, delete_window):
         result = messagebox.askyesno("Delete Transaction", "Are you sure you want to delete this transaction?")
         if result:
-            user_model.delete_transaction(transaction_id)
+            for transaction_id in transaction_ids:
+                user_model.delete_transaction(transaction_id)
+                transaction_list.remove(transaction_id)  # Update the list in place
             messagebox.showinfo("Deleted", "Transaction deleted successfully.")
-            delete_window.destroy()
-            self.delete_transaction()  # Refresh the delete window
 
     def open_filter_window(self):
         filter_window = tk.Toplevel(self)
         filter_window.title("Filter Transactions")
-        filter_window.geometry("400x300")
+        filter_window.geometry("400x380")
 
         ttk.Label(filter_window, text="Filter Transactions", font=("Arial", 14)).pack(pady=10)
 
@@ -856,57 +801,80 @@ class MainApplication(ttk.Frame):
         tags_entry = ttk.Entry(filter_window, width=40, font=("Arial", 12))
         tags_entry.pack(pady=5)
 
+        # Description Search
+        ttk.Label(filter_window, text="Description contains:", font=("Arial", 12)).pack(pady=5)
+        search_entry = ttk.Entry(filter_window, width=40, font=("Arial", 12))
+        search_entry.pack(pady=5)
+
         # Filter Button
-        ttk.Button(filter_window, text="Apply Filter", command=lambda: self.apply_filter(category_var.get(), tags_entry.get(), filter_window)).pack(pady=10)
+        ttk.Button(filter_window, text="Apply Filter", command=lambda: self.apply_filter(category_var.get(), tags_entry.get(), filter_window, search_entry.get())).pack(pady=10)
 
-    def apply_filter(self, category, tags_input, window):
+    def apply_filter(self, category, tags_input, window, search=""):
         tags = [tag.strip() for tag in tags_input.split(',') if tag.strip()]
         if category == "All":
             category = None
-        transactions = user_model.get_transactions_filtered(self.user_id, category, tags)
         window.destroy()
-        self.view_transactions(transactions)
-
-    def view_transactions(self, transactions=None):
-        if transactions is None:
-            transactions = user_model.get_transactions(self.user_id)
+        self.view_transactions(category, tags, search.strip() or None)
 
+    def view_transactions(self, category=None, tags=None, search=None):
         view_window = tk.Toplevel(self)
         view_window.title("View Transactions")
-        view_window.geometry("600x400")
+        view_window.geometry("800x400")
 
-        canvas = tk.Canvas(view_window)
-        scrollbar = ttk.Scrollbar(view_window, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
+        # Rows (with their tags) are loaded page by page as the list scrolls; a search
+        # lists the best description matches first
+        transaction_list = TransactionList(view_window, self.user_id, category=category, tags=tags, search=search,
+                                           include_recurring=True, jobs=self.master.jobs)
+        transaction_list.pack(fill="both", expand=True)
 
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(
-                scrollregion=canvas.bbox("all")
-            )
-        )
+    def manage_recurring(self):
+        """List the recurring rules, with deletion and posting of the occurrences due"""
+        recurring_window = tk.Toplevel(self)
+        recurring_window.title("Recurring Transactions")
+        recurring_window.geometry("600x400")
 
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        ttk.Label(recurring_window, text="Recurring Transactions", font=("Arial", 14)).pack(pady=10)
 
-        canvas.pack(side="left", fill="both", expand=True)
+        list_frame = ttk.Frame(recurring_window)
+        list_frame.pack(fill="both", expand=True)
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical")
         scrollbar.pack(side="right", fill="y")
+        rule_listbox = tk.Listbox(list_frame, font=("Arial", 12), yscrollcommand=scrollbar.set)
+        rule_listbox.pack(side="left", fill="both", expand=True)
+        scrollbar.config(command=rule_listbox.yview)
+
+        rules = []
+
+        def refresh():
+            rules[:] = recurring.get_rules(self.user_id)
+            rule_listbox.delete(0, tk.END)
+            for rule in rules:
+                every = rule.frequency if rule.interval == 1 else f"every {rule.interval} {rule.frequency}"
+                until = f" until {rule.end_date}" if rule.end_date else ""
+                rule_listbox.insert(tk.END, f"${rule.amount:.2f} {rule.category} ({rule.type}), {every} "
+                                            f"from {rule.start_date}{until}: "
+                                            f"{recurring.pending_count(rule)} due")
+
+        def delete_selected():
+            selected = rule_listbox.curselection()
+            if not selected:
+                messagebox.showwarning("No Selection", "Please select a recurring transaction to delete.")
+                return
+            if messagebox.askyesno("Confirm Delete", "Stop this recurring transaction? "
+                                                     "Transactions already posted are kept."):
+                recurring.delete_rule(self.user_id, rules[selected[0]].id)
+                refresh()
+
+        def post_due():
+            written = recurring.materialize(self.user_id)
+            messagebox.showinfo("Posted", f"{written} transactions posted.")
+            refresh()
 
-        for idx, transaction in enumerate(transactions):
-            frame = ttk.Frame(scrollable_frame)
-            frame.pack(pady=5, padx=10, fill='x')
-
-            ttk.Label(frame, text=f"Transaction {idx+1}:", font=("Arial", 12)).grid(row=0, column=0, sticky="w")
-            ttk.Label(frame, text=f"Price: ${transaction[2]:.2f}", font=("Arial", 10)).grid(row=1, column=0, sticky="w")
-            ttk.Label(frame, text=f"Category: {transaction[3]}", font=("Arial", 10)).grid(row=1, column=1, sticky="w")
-            ttk.Label(frame, text=f"Type: {transaction[4]}", font=("Arial", 10)).grid(row=1, column=2, sticky="w")
-            ttk.Label(frame, text=f"Date: {transaction[5]}", font=("Arial", 10)).grid(row=1, column=3, sticky="w")
-            ttk.Label(frame, text=f"Description: {transaction[6]}", font=("Arial", 10)).grid(row=2, column=0, columnspan=4, sticky="w")
-            # Display tags
-            tags = user_model.get_tags_for_transaction(transaction[0])
-            if tags:
-                ttk.Label(frame, text=f"Tags: {', '.join(tags)}", font=("Arial", 10)).grid(row=3, column=0, columnspan=4, sticky="w")
-            ttk.Separator(scrollable_frame, orient='horizontal').pack(fill='x', pady=5)
+        button_frame = ttk.Frame(recurring_window)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Delete Selected", command=delete_selected).grid(row=0, column=0, padx=10)
+        ttk.Button(button_frame, text="Post Due Transactions", command=post_due).grid(row=0, column=1, padx=10)
+        refresh()
 
     def show_summary(self):
         total_income, total_expenses = user_model.get_financial_summary(self.user_id)
@@ -932,3 +900,5 @@ class MainApplication(ttk.Frame):
 if __name__ == "__main__":
     app = FinanceTrackerApp()
     app.mainloop()
+    app.jobs.shutdown()
+    database.close_all()  # Release pooled SQLite connections on exit
@@ -0,0 +1,183 @@
+# analytics.py
+#
+# Income/expense time series for charts. Totals are bucketed in SQL with
+# GROUP BY on a date expression and come back as NumPy arrays with one entry per
+# period (gaps filled with zeros), ready to hand to matplotlib. Rolling averages and
+# period-over-period deltas are vectorized over those arrays.
+#
+# Month and year buckets over the whole history are read from the
+# category_monthly_totals rollup, so they cost one row per category and month.
+
+from collections import namedtuple
+
+import numpy as np
+
+from models import database
+from models import instrumentation
+from models import query_cache
+
+# SQL expression naming each row's bucket, and the NumPy unit its labels parse to.
+# Weeks are labelled by their Monday.
+PERIODS = {
+    'day': ("date(date)", 'D', 1),
+    'week': ("date(date, 'weekday 0', '-6 days')", 'D', 7),
+    'month': ("strftime('%Y-%m', date)", 'M', 1),
+    'year': ("strftime('%Y', date)", 'Y', 1),
+}
+ROLLUP_PERIODS = {'month': "month", 'year': "substr(month, 1, 4)"}
+
+Series = namedtuple('Series', ['periods', 'income', 'expenses', 'net'])
+CategoryTrends = namedtuple('CategoryTrends', ['periods', 'categories', 'totals'])
+
+
+def _filters(user_id, start_date=None, end_date=None, category=None, transaction_type=None):
+    clauses, params = ["user_id = ?"], [user_id]
+    if start_date:
+        clauses.append("date >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("date <= ?")
+        params.append(end_date)
+    if category:
+        clauses.append("category = ?")
+        params.append(category)
+    if transaction_type:
+        clauses.append("type = ?")
+        params.append(transaction_type)
+    return " AND ".join(clauses), params
+
+
+def _grouped(user_id, period, values, start_date=None, end_date=None, category=None,
+             transaction_type=None, by_category=False):
+    """Rows of (period, [category,] *values) grouped by period, from the rollup when possible.
+
+    values are SQL expressions over type and an amount column written as {amount}.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period {period!r}; expected one of {', '.join(PERIODS)}")
+
+    keys = "period, category" if by_category else "period"
+    if period in ROLLUP_PERIODS and not (start_date or end_date):
+        where, params = _filters(user_id, category=category, transaction_type=transaction_type)
+        bucket, amount, table = ROLLUP_PERIODS[period], "total", "category_monthly_totals"
+        having = "HAVING period GLOB '[0-9][0-9][0-9][0-9]*'"  # Rows whose date never parsed
+    else:
+        where, params = _filters(user_id, start_date, end_date, category, transaction_type)
+        bucket, amount, table = PERIODS[period][0], "amount", "transactions"
+        having = "HAVING period IS NOT NULL"  # Dates that don't parse
+
+    columns = ", ".join(value.format(amount=amount) for value in values)
+    sql = f"""
+        SELECT {bucket} AS period, {'category, ' if by_category else ''}{columns}
+        FROM {table}
+        WHERE {where}
+        GROUP BY {keys}
+        {having}
+        ORDER BY {keys}
+    """
+    return database.get_connection().execute(sql, params).fetchall()
+
+
+def _period_range(labels, period):
+    """Every period from the first label to the last, as datetime64"""
+    _, unit, step = PERIODS[period]
+    if not labels:
+        return np.empty(0, dtype=f'datetime64[{unit}]')
+    first, last = np.datetime64(labels[0], unit), np.datetime64(labels[-1], unit)
+    return np.arange(first, last + step, step)
+
+
+def _place(periods, labels, period):
+    """Positions of labels within periods"""
+    unit = PERIODS[period][1]
+    return np.searchsorted(periods, np.array(labels, dtype=f'datetime64[{unit}]'))
+
+
+def _frozen(*arrays):
+    # Results are cached and shared between callers
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays
+
+
+@instrumentation.instrumented
+@query_cache.cached
+def get_series(user_id, period='month', start_date=None, end_date=None, category=None):
+    """Income, expenses and net per period ('day', 'week', 'month' or 'year').
+
+    Returns a Series of equally long arrays; periods is datetime64 and covers every
+    period from the first transaction to the last, empty ones holding zeros.
+    """
+    rows = _grouped(user_id, period, [
+        "TOTAL(CASE WHEN type = 'income' THEN {amount} END)",
+        "TOTAL(CASE WHEN type = 'expense' THEN {amount} END)",
+    ], start_date, end_date, category)
+
+    labels = [row[0] for row in rows]
+    periods = _period_range(labels, period)
+    income = np.zeros(len(periods))
+    expenses = np.zeros(len(periods))
+    if rows:
+        positions = _place(periods, labels, period)
+        income[positions] = [row[1] for row in rows]
+        expenses[positions] = [row[2] for row in rows]
+    income, expenses = income.round(2), expenses.round(2)
+    return Series(*_frozen(periods, income, expenses, (income - expenses).round(2)))
+
+
+@instrumentation.instrumented
+@query_cache.cached
+def get_category_trends(user_id, period='month', transaction_type='expense', start_date=None, end_date=None):
+    """Totals of one type per category and period.
+
+    totals is shaped (len(categories), len(periods)); categories are sorted by their
+    total over the whole range, largest first.
+    """
+    rows = _grouped(user_id, period, ["TOTAL({amount})"], start_date, end_date,
+                    transaction_type=transaction_type, by_category=True)
+
+    periods = _period_range(sorted({row[0] for row in rows}), period)
+    names = sorted({row[1] for row in rows})
+    totals = np.zeros((len(names), len(periods)))
+    if rows:
+        category_index = {name: i for i, name in enumerate(names)}
+        totals[[category_index[row[1]] for row in rows], _place(periods, [row[0] for row in rows], period)] = \
+            [row[2] for row in rows]
+    order = np.argsort(-totals.sum(axis=1), kind='stable')
+    totals = totals[order].round(2)
+    return CategoryTrends(*_frozen(periods), [names[i] for i in order], *_frozen(totals))
+
+
+def rolling_average(values, window):
+    """Mean of each value and the window - 1 before it; NaN until a full window is available"""
+    values = np.asarray(values, dtype=float)
+    averages = np.full(len(values), np.nan)
+    if window <= 0 or len(values) < window:
+        return averages
+    sums = np.cumsum(np.concatenate([[0.0], values]))
+    averages[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return averages
+
+
+def period_deltas(values):
+    """(change, percent change) from each period to the next; the first period has NaN.
+
+    Percent change is NaN where the previous period was zero.
+    """
+    values = np.asarray(values, dtype=float)
+    change = np.full(len(values), np.nan)
+    percent = np.full(len(values), np.nan)
+    if len(values) > 1:
+        previous = values[:-1]
+        change[1:] = values[1:] - previous
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent[1:] = np.where(previous != 0, change[1:] / np.abs(previous) * 100, np.nan)
+    return change, percent
+
+
+def month_over_month(user_id, transaction_type='expense', start_date=None, end_date=None):
+    """(months, totals, change, percent change) of monthly income or expenses"""
+    series = get_series(user_id, 'month', start_date, end_date)
+    totals = series.expenses if transaction_type == 'expense' else series.income
+    change, percent = period_deltas(totals)
+    return series.periods, totals, change, percent
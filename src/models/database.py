@@ -0,0 +1,131 @@
+# database.py
+
+import os
+import sqlite3
+import threading
+
+# Default location of the application database (relative to the working directory)
+DB_PATH = "db/finance_tracker.db"
+
+# Applied once to every pooled connection when it is opened
+CONNECTION_PRAGMAS = (
+    ("cache_size", -16000),      # ~16 MB page cache (negative values are KiB)
+    ("mmap_size", 268435456),    # Memory-map up to 256 MB of the database file
+    ("temp_store", "MEMORY"),    # Keep temp tables and sort spills in RAM
+)
+
+# Size of sqlite3's per-connection prepared statement cache
+STATEMENT_CACHE_SIZE = 256
+
+# Durability settings, also applied to every pooled connection (see configure). In WAL
+# mode readers never block the writer or each other, and a commit appends to the log
+# instead of rewriting pages through a rollback journal. synchronous FULL syncs the log
+# on every commit, so a committed write survives power loss; NORMAL syncs only at
+# checkpoints and can lose the last commits (never consistency) if the machine stops.
+JOURNAL_MODE = "WAL"
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+SYNCHRONOUS = os.environ.get("FINANCE_SYNCHRONOUS", "FULL").upper()
+# How long a connection waits for another connection's write lock before failing
+BUSY_TIMEOUT_MS = 5000
+
+_local = threading.local()
+_lock = threading.Lock()
+_connections = []  # Every connection opened by the pool, so they can be closed together
+_connection_hooks = []  # Called with each connection as it is opened
+_db_path = DB_PATH
+_generation = 0  # Bumped whenever the pool is reset; stale thread-local connections are reopened
+_journal_mode = JOURNAL_MODE
+_synchronous = SYNCHRONOUS
+_busy_timeout_ms = BUSY_TIMEOUT_MS
+
+
+def set_database(path):
+    """Point the pool at a different database file, closing any open connections"""
+    global _db_path
+    close_all()
+    _db_path = str(path)
+
+
+def get_database():
+    """Return the path of the database the pool is connected to"""
+    return _db_path
+
+
+def configure(journal_mode=None, synchronous=None, busy_timeout_ms=None):
+    """Change the durability settings; open connections are closed and reopened with them"""
+    global _journal_mode, _synchronous, _busy_timeout_ms
+    if synchronous is not None and synchronous.upper() not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"synchronous must be one of {', '.join(SYNCHRONOUS_LEVELS)}")
+    close_all()
+    if journal_mode is not None:
+        _journal_mode = journal_mode.upper()
+    if synchronous is not None:
+        _synchronous = synchronous.upper()
+    if busy_timeout_ms is not None:
+        _busy_timeout_ms = int(busy_timeout_ms)
+
+
+def get_settings():
+    """The (journal_mode, synchronous, busy_timeout_ms) connections are opened with"""
+    return _journal_mode, _synchronous, _busy_timeout_ms
+
+
+def _open_connection(path):
+    """Open and configure a new connection"""
+    # check_same_thread is disabled only so close_all() can close connections at shutdown;
+    # each connection is otherwise used exclusively by the thread that opened it.
+    connection = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False,
+                                 timeout=_busy_timeout_ms / 1000)
+    # The journal mode is stored in the database file; switching it back from WAL only
+    # succeeds once no other connection has the file open
+    connection.execute(f"PRAGMA journal_mode = {_journal_mode}")
+    connection.execute(f"PRAGMA synchronous = {_synchronous}")
+    for pragma, value in CONNECTION_PRAGMAS:
+        connection.execute(f"PRAGMA {pragma} = {value}")
+    for hook in _connection_hooks:
+        hook(connection)
+    return connection
+
+
+def add_connection_hook(hook):
+    """Call hook(connection) for every pooled connection, including those already open"""
+    with _lock:
+        _connection_hooks.append(hook)
+        for connection in _connections:
+            hook(connection)
+
+
+def for_each_connection(func):
+    """Call func(connection) for every open pooled connection"""
+    with _lock:
+        for connection in _connections:
+            func(connection)
+
+
+def get_connection():
+    """Return the calling thread's connection, opening it on first use.
+
+    Connections are long-lived: callers must not close them. Statements executed
+    through the same connection are compiled once and reused from its statement cache.
+    """
+    connection = getattr(_local, "connection", None)
+    if connection is None or _local.generation != _generation:
+        with _lock:
+            connection = _open_connection(_db_path)
+            _connections.append(connection)
+            _local.connection = connection
+            _local.generation = _generation
+    return connection
+
+
+def close_all():
+    """Close every pooled connection; threads reconnect lazily on their next call"""
+    global _generation
+    with _lock:
+        for connection in _connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+        _generation += 1
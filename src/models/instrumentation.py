@@ -0,0 +1,348 @@
+# instrumentation.py
+#
+# Runtime statistics for the data layer. Functions decorated with @instrumented
+# record their call count, errors, rows returned and a latency histogram. While
+# recording is on, pooled connections report every statement through sqlite3's trace
+# callback, so a call also knows the SQL it ran; calls slower than the slow-query threshold are logged
+# with the EXPLAIN QUERY PLAN of their SELECTs. The trace sees statements with their
+# parameters filled in, so only normalized SQL (literals replaced by ?) is ever
+# recorded or logged; user data stays out of the log and the JSON dump.
+#
+# get_stats() and dump_json() expose the numbers; the dashboard shows them live in
+# its hidden diagnostics window (Ctrl+Shift+D). Set FINANCE_INSTRUMENTATION=0 to
+# start with recording off and FINANCE_SLOW_QUERY_MS to change the threshold. With
+# recording off no trace callback is installed, so SQLite never calls back into
+# Python; bulk writers use untraced() to do the same for one connection.
+
+import bisect
+import contextlib
+import datetime
+import functools
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from models import database
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_SECONDS = float(os.environ.get("FINANCE_SLOW_QUERY_MS", 250)) / 1000
+
+# Statements kept per call for the slow-query log and the SQL table; beyond this
+# (executemany reports every row) they are only counted
+MAX_STATEMENTS_PER_CALL = 20
+MAX_STATEMENT_SHAPES = 500
+MAX_SLOW_QUERIES = 50
+MAX_PLANS_PER_CALL = 5
+
+# Latency histogram bucket upper bounds: 1 µs to about 2 minutes, four per doubling,
+# so a percentile read from the buckets is within 19% of the true value
+BUCKET_BOUNDS = [1e-6 * 2 ** (i / 4) for i in range(108)]
+
+_enabled = os.environ.get("FINANCE_INSTRUMENTATION", "1") != "0"
+_slow_query_seconds = SLOW_QUERY_SECONDS
+_lock = threading.Lock()
+_local = threading.local()
+_functions = {}  # label -> FunctionStats
+_statements = {}  # normalized SQL -> executions seen
+_slow_queries = deque(maxlen=MAX_SLOW_QUERIES)
+_started = time.time()
+
+# code.co_flags bit of generator functions (inspect.CO_GENERATOR; inspect itself is slow to import)
+_CO_GENERATOR = 0x20
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\?")
+_REPEATED_PLACEHOLDERS = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class Histogram:
+    """Latency counts in logarithmic buckets, with exact count, total, min and max"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)  # The last bucket takes anything slower
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the given percentile, capped at the maximum seen"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                return min(max(bound, self.min), self.max)
+        return self.max
+
+
+class FunctionStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.statements = 0
+        self.latency = Histogram()
+
+    def as_dict(self):
+        latency = self.latency
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "statements": self.statements,
+            "total_seconds": latency.total,
+            "mean_seconds": latency.total / latency.count if latency.count else 0.0,
+            "min_seconds": latency.min if latency.count else 0.0,
+            "p50_seconds": latency.percentile(50),
+            "p90_seconds": latency.percentile(90),
+            "p99_seconds": latency.percentile(99),
+            "max_seconds": latency.max,
+            "histogram": [[BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else None, count]
+                          for index, count in enumerate(latency.counts) if count],
+        }
+
+
+class _Call:
+    """Statements seen while an instrumented call runs on this thread"""
+
+    __slots__ = ("parent", "statements", "statement_count")
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.statements = []
+        self.statement_count = 0
+
+
+def _trace(statement):
+    # Runs for every statement on every pooled connection, so it does as little as possible
+    call = getattr(_local, "call", None)
+    if call is not None:
+        call.statement_count += 1
+        if len(call.statements) < MAX_STATEMENTS_PER_CALL:
+            call.statements.append(statement)
+
+
+def attach(connection):
+    """Report the connection's statements to the instrumented call running on its thread, while recording is on"""
+    connection.set_trace_callback(_trace if _enabled else None)
+
+
+@contextlib.contextmanager
+def untraced(connection):
+    """Stop tracing connection for the duration; for bulk writes, where executemany reports every row"""
+    connection.set_trace_callback(None)
+    try:
+        yield connection
+    finally:
+        attach(connection)
+
+
+def normalize_sql(statement):
+    """SQL with literals and parameters replaced by ?, lists of them collapsed, whitespace squeezed"""
+    statement = _LITERALS.sub("?", statement)
+    statement = _REPEATED_PLACEHOLDERS.sub("?, ...", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def _row_count(result):
+    return len(result) if isinstance(result, (list, dict)) else 0
+
+
+def _explain(statements):
+    """[{sql, plan}] for the SELECTs among statements, run on this thread's connection.
+
+    The plan comes from the statement as run; sql is its normalized form.
+    """
+    explained = []
+    connection = database.get_connection()
+    for statement in statements:
+        if len(explained) >= MAX_PLANS_PER_CALL:
+            break
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            continue
+        try:
+            plan = [row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + statement)]
+        except sqlite3.Error as e:
+            plan = [f"(no plan: {e})"]
+        explained.append({"sql": normalize_sql(statement), "plan": plan})
+    return explained
+
+
+def _finish(label, call, seconds, rows, error):
+    """Record a completed call; runs with call already popped off the thread's stack"""
+    parent = call.parent
+    if parent is not None:
+        # The enclosing call ran these statements too
+        parent.statement_count += call.statement_count
+        room = MAX_STATEMENTS_PER_CALL - len(parent.statements)
+        parent.statements.extend(call.statements[:room])
+
+    shapes = [normalize_sql(statement) for statement in call.statements] if parent is None else []
+    with _lock:
+        stats = _functions.get(label)
+        if stats is None:
+            stats = _functions[label] = FunctionStats()
+        stats.calls += 1
+        stats.errors += error
+        stats.rows += rows
+        stats.statements += call.statement_count
+        stats.latency.add(seconds)
+        for shape in shapes:
+            if shape in _statements or len(_statements) < MAX_STATEMENT_SHAPES:
+                _statements[shape] = _statements.get(shape, 0) + 1
+
+    if parent is None and seconds >= _slow_query_seconds:
+        _log_slow(label, call, seconds)
+
+
+def _log_slow(label, call, seconds):
+    entry = {
+        "function": label,
+        "seconds": seconds,
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "statement_count": call.statement_count,
+        "statements": _explain(call.statements),
+    }
+    with _lock:
+        _slow_queries.append(entry)
+    plans = "\n".join(f"  {item['sql']}\n" + "\n".join(f"    {line}" for line in item["plan"])
+                      for item in entry["statements"])
+    logger.warning("slow call %s took %.1f ms (%d statements)%s", label, seconds * 1000,
+                   call.statement_count, "\n" + plans if plans else "")
+
+
+def instrumented(func):
+    """Record calls of func (a generator function is timed across all of its batches)"""
+    label = f"{func.__module__.rpartition('.')[2]}.{func.__name__}"
+
+    if func.__code__.co_flags & _CO_GENERATOR:
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            if not _enabled:
+                return (yield from func(*args, **kwargs))
+            # Time only what runs inside the generator, not the consumer between batches
+            generator = func(*args, **kwargs)
+            call = _Call(getattr(_local, "call", None))
+            seconds = 0.0
+            rows = 0
+            error = True
+            try:
+                while True:
+                    outer = getattr(_local, "call", None)
+                    _local.call = call
+                    started = time.perf_counter()
+                    try:
+                        batch = next(generator)
+                    except StopIteration:
+                        break
+                    finally:
+                        seconds += time.perf_counter() - started
+                        _local.call = outer
+                    rows += len(batch) if isinstance(batch, (list, tuple)) else 1
+                    try:
+                        yield batch
+                    except GeneratorExit:
+                        error = False  # The consumer stopped early
+                        raise
+                error = False
+            finally:
+                generator.close()
+                _finish(label, call, seconds, rows, error)
+
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        call = _local.call = _Call(getattr(_local, "call", None))
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            seconds = time.perf_counter() - started
+            _local.call = call.parent
+            _finish(label, call, seconds, 0, True)
+            raise
+        seconds = time.perf_counter() - started
+        _local.call = call.parent
+        _finish(label, call, seconds, _row_count(result), False)
+        return result
+
+    return wrapper
+
+
+def is_enabled():
+    return _enabled
+
+
+def configure(enabled=None, slow_query_seconds=None):
+    """Turn recording on or off and/or change the slow-query threshold"""
+    global _enabled, _slow_query_seconds
+    if enabled is not None and bool(enabled) != _enabled:
+        _enabled = bool(enabled)
+        database.for_each_connection(attach)
+    if slow_query_seconds is not None:
+        _slow_query_seconds = float(slow_query_seconds)
+
+
+def get_slow_query_seconds():
+    return _slow_query_seconds
+
+
+def get_stats():
+    """Everything recorded so far, as plain JSON-serializable data"""
+    with _lock:
+        functions = {label: stats.as_dict() for label, stats in sorted(_functions.items())}
+        statements = sorted(_statements.items(), key=lambda item: -item[1])
+        slow_queries = list(_slow_queries)
+    return {
+        "enabled": _enabled,
+        "slow_query_seconds": _slow_query_seconds,
+        "since": datetime.datetime.fromtimestamp(_started).isoformat(timespec="seconds"),
+        "functions": functions,
+        "statements": [{"sql": sql, "count": count} for sql, count in statements],
+        "slow_queries": slow_queries,
+    }
+
+
+def dump_json(filename=None):
+    """get_stats() as JSON, written to filename when given; returns the JSON text"""
+    text = json.dumps(get_stats(), indent=2)
+    if filename:
+        with open(filename, "w", encoding="utf-8") as output:
+            output.write(text + "\n")
+    return text
+
+
+def reset():
+    """Forget every recorded call, statement and slow query"""
+    global _started
+    with _lock:
+        _functions.clear()
+        _statements.clear()
+        _slow_queries.clear()
+        _started = time.time()
+
+
+database.add_connection_hook(attach)
@@ -0,0 +1,330 @@
+# ledger.py
+#
+# Columnar in-memory snapshot of a user's transactions for analytics. Each column is
+# a NumPy array kept sorted by (day, id), so date ranges are binary searches and
+# group-bys are bincounts over small integer codes instead of SQL scans:
+#
+#   days        int32  days since 1970-01-01
+#   cents       int64  amount in cents
+#   categories  int32  index into Ledger.category_names
+#   types       int8   index into Ledger.type_names
+#
+# On first use the ledger also builds prefix sums per distinct day (by type and
+# category), which turns any date-range total into one subtraction.
+#
+# get_ledger() keeps one snapshot per user and refreshes it when the user's write
+# version (see query_cache) moves: appended rows are merged into a copy, anything else
+# reloads. A snapshot is never changed once returned, so readers can keep using it.
+# Builds take a per-user lock, so loading one user's ledger never holds up another's.
+
+import copy
+import datetime
+import threading
+
+import numpy as np
+
+from models import database
+from models import instrumentation
+from models import query_cache
+
+LOAD_BATCH_SIZE = 100000
+
+# Range queries are answered from per-day prefix sums by (type, category) unless that
+# table would exceed this many cells; then they fall back to scanning the rows in range
+MAX_CUBE_CELLS = 4000000
+EPOCH = datetime.date(1970, 1, 1)
+
+# Rows in (day, id) order; dates that don't parse land on day 0
+LEDGER_QUERY = """
+    SELECT id,
+           IFNULL(CAST(julianday(date) - 2440587.5 AS INTEGER), 0),
+           CAST(ROUND(amount * 100) AS INTEGER),
+           category,
+           type
+    FROM transactions
+    WHERE user_id = ? AND id > ?
+    ORDER BY date, id
+"""
+
+_lock = threading.Lock()  # Guards the two dicts below, never held while loading
+_ledgers = {}  # (database path, user_id) -> Ledger
+_load_locks = {}  # (database path, user_id) -> Lock held while that user's snapshot is (re)built
+
+
+def to_day(date):
+    """Day number of a 'YYYY-MM-DD' string or date"""
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    return (date - EPOCH).days
+
+
+def from_day(day):
+    return (EPOCH + datetime.timedelta(days=int(day))).isoformat()
+
+
+class Ledger:
+    """Column arrays of one user's transactions plus the dictionaries that decode them"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.ids = np.empty(0, dtype=np.int64)
+        self.days = np.empty(0, dtype=np.int32)
+        self.cents = np.empty(0, dtype=np.int64)
+        self.categories = np.empty(0, dtype=np.int32)
+        self.types = np.empty(0, dtype=np.int8)
+        self.category_names = []
+        self.type_names = []
+        self._category_codes = {}
+        self._type_codes = {}
+        self.version = None
+        self._aggregates = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def max_id(self):
+        return int(self.ids.max()) if len(self.ids) else 0
+
+    def copy(self):
+        """A copy to append to; the column arrays are shared until then, the dictionaries copied"""
+        ledger = copy.copy(self)
+        ledger.category_names = list(self.category_names)
+        ledger.type_names = list(self.type_names)
+        ledger._category_codes = dict(self._category_codes)
+        ledger._type_codes = dict(self._type_codes)
+        return ledger
+
+    def _encode(self, values, codes, names):
+        """Dictionary-encode values, growing the dictionary with unseen ones"""
+        encoded = []
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(names)
+                names.append(value)
+            encoded.append(code)
+        return encoded
+
+    def append_rows(self, rows):
+        """Add rows shaped like LEDGER_QUERY results, keeping (day, id) order"""
+        if not rows:
+            return
+        ids, days, cents, categories, types = zip(*rows)
+        new_days = np.array(days, dtype=np.int32)
+        in_order = bool(np.all(new_days[1:] >= new_days[:-1])) and (
+            not len(self.days) or new_days[0] >= self.days[-1]
+        )
+
+        self.ids = np.concatenate([self.ids, np.array(ids, dtype=np.int64)])
+        self.days = np.concatenate([self.days, new_days])
+        self.cents = np.concatenate([self.cents, np.array(cents, dtype=np.int64)])
+        self.categories = np.concatenate([
+            self.categories,
+            np.array(self._encode(categories, self._category_codes, self.category_names), dtype=np.int32)
+        ])
+        self.types = np.concatenate([
+            self.types,
+            np.array(self._encode(types, self._type_codes, self.type_names), dtype=np.int8)
+        ])
+
+        if not in_order:
+            # Back-dated rows: ids break ties, so sorting by them and then stably by day gives (day, id)
+            order = np.argsort(self.ids, kind='stable')
+            order = order[np.argsort(self.days[order], kind='stable')]
+            for column in ('ids', 'days', 'cents', 'categories', 'types'):
+                setattr(self, column, getattr(self, column)[order])
+        self._aggregates = None
+
+    def type_code(self, transaction_type):
+        """Code of a type name, or -1 when the ledger has no such rows"""
+        return self._type_codes.get(transaction_type, -1)
+
+    def bounds(self, start_date=None, end_date=None):
+        """Index range [lo, hi) of the rows dated start_date..end_date inclusive"""
+        lo = 0 if start_date is None else int(np.searchsorted(self.days, to_day(start_date), 'left'))
+        hi = len(self.days) if end_date is None else int(np.searchsorted(self.days, to_day(end_date), 'right'))
+        return lo, max(lo, hi)
+
+    def signed_cents(self, lo=0, hi=None):
+        """Amounts with expenses negated"""
+        cents = self.cents[lo:hi]
+        return np.where(self.types[lo:hi] == self.type_code('expense'), -cents, cents)
+
+    def aggregates(self):
+        """Per-day prefix sums, built on first use after a change.
+
+        Returns (day_values, net, totals, counts): the distinct days, and cumulative
+        arrays with one more entry than there are days, so the sum over days
+        lo..hi-1 is array[hi] - array[lo]. net is the signed daily total; totals and
+        counts are shaped (days + 1, types, categories), or None when too large.
+        """
+        if self._aggregates is None:
+            n = len(self.days)
+            starts = np.flatnonzero(np.concatenate([[True], self.days[1:] != self.days[:-1]])) if n else np.empty(0, dtype=np.int64)
+            day_values = self.days[starts]
+            day_index = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+
+            net = np.zeros(len(starts) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(day_index, weights=self.signed_cents(), minlength=len(starts)).astype(np.int64),
+                      out=net[1:])
+
+            types, categories = len(self.type_names), len(self.category_names)
+            totals = counts = None
+            cells = len(starts) * types * categories
+            if cells <= MAX_CUBE_CELLS:
+                cell = (day_index * types + self.types) * categories + self.categories
+                shape = (len(starts), types, categories)
+                totals = np.zeros((len(starts) + 1, types, categories), dtype=np.int64)
+                counts = np.zeros_like(totals)
+                np.cumsum(np.bincount(cell, weights=self.cents, minlength=cells).astype(np.int64).reshape(shape),
+                          axis=0, out=totals[1:])
+                np.cumsum(np.bincount(cell, minlength=cells).reshape(shape), axis=0, out=counts[1:])
+            self._aggregates = (day_values, net, totals, counts)
+        return self._aggregates
+
+    def day_bounds(self, start_date=None, end_date=None):
+        """Index range [lo, hi) into the distinct days dated start_date..end_date inclusive"""
+        day_values = self.aggregates()[0]
+        lo = 0 if start_date is None else int(np.searchsorted(day_values, to_day(start_date), 'left'))
+        hi = len(day_values) if end_date is None else int(np.searchsorted(day_values, to_day(end_date), 'right'))
+        return lo, max(lo, hi)
+
+    def _range_totals(self, start_date, end_date):
+        """(totals, counts) by [type, category] over a date range, in cents"""
+        _, _, totals, counts = self.aggregates()
+        if totals is not None:
+            lo, hi = self.day_bounds(start_date, end_date)
+            return totals[hi] - totals[lo], counts[hi] - counts[lo]
+
+        lo, hi = self.bounds(start_date, end_date)
+        shape = (len(self.type_names), len(self.category_names))
+        cell = self.types[lo:hi].astype(np.int64) * shape[1] + self.categories[lo:hi]
+        cells = shape[0] * shape[1]
+        return (np.bincount(cell, weights=self.cents[lo:hi], minlength=cells).reshape(shape),
+                np.bincount(cell, minlength=cells).reshape(shape))
+
+    def totals_by_type(self, start_date=None, end_date=None):
+        """{type: total in currency units} over a date range"""
+        totals, _ = self._range_totals(start_date, end_date)
+        return {name: round(float(totals[code].sum()) / 100, 2) for code, name in enumerate(self.type_names)}
+
+    def summary(self, start_date=None, end_date=None):
+        """(total income, total expenses) like user_model.get_financial_summary"""
+        totals = self.totals_by_type(start_date, end_date)
+        return totals.get('income', 0), totals.get('expense', 0)
+
+    def totals_by_category(self, transaction_type='expense', start_date=None, end_date=None):
+        """{category: total} for one type over a date range, categories without rows omitted"""
+        code = self.type_code(transaction_type)
+        if code < 0:
+            return {}
+        totals, counts = self._range_totals(start_date, end_date)
+        return {self.category_names[category]: round(float(totals[code, category]) / 100, 2)
+                for category in np.flatnonzero(counts[code])}
+
+    def daily_balance(self, start_date=None, end_date=None):
+        """(days, balance) arrays: the running net total at the end of each day with activity"""
+        day_values, net = self.aggregates()[:2]
+        lo, hi = self.day_bounds(start_date, end_date)
+        return day_values[lo:hi], (net[lo + 1:hi + 1] - net[lo]) / 100
+
+
+def from_snapshot(table, user_id=None):
+    """Build a Ledger from a snapshot table (see services/snapshot_service.open_snapshot).
+
+    The snapshot's dictionary-encoded category and type columns already are the
+    ledger's codes, and its date32 column its day numbers, so nothing is parsed.
+    The result isn't tied to the database: get_ledger() never returns it.
+    """
+    import pyarrow as pa
+
+    table = table.select(['id', 'user_id', 'price', 'category', 'type', 'date']).unify_dictionaries()
+    if user_id is None and table.num_rows:
+        user_id = table.column('user_id')[0].as_py()
+    ledger = Ledger(user_id)
+    if not table.num_rows:
+        return ledger
+
+    def codes(name, dtype):
+        # After unify_dictionaries() every chunk shares one dictionary
+        column = table.column(name)
+        ledger_names = column.chunk(0).dictionary.to_pylist()
+        indices = np.concatenate([chunk.indices.to_numpy(zero_copy_only=False) for chunk in column.chunks])
+        return indices.astype(dtype, copy=False), ledger_names
+
+    ledger.ids = table.column('id').to_numpy()
+    # Unparseable dates were stored as null; like LEDGER_QUERY, they land on day 0
+    ledger.days = table.column('date').cast(pa.int32()).fill_null(0).to_numpy()
+    ledger.cents = np.round(table.column('price').to_numpy() * 100).astype(np.int64)
+    ledger.categories, ledger.category_names = codes('category', np.int32)
+    ledger.types, ledger.type_names = codes('type', np.int8)
+    ledger._category_codes = {name: code for code, name in enumerate(ledger.category_names)}
+    ledger._type_codes = {name: code for code, name in enumerate(ledger.type_names)}
+
+    order = np.lexsort((ledger.ids, ledger.days))
+    for column in ('ids', 'days', 'cents', 'categories', 'types'):
+        setattr(ledger, column, getattr(ledger, column)[order])
+    return ledger
+
+
+def _load(connection, ledger):
+    cursor = connection.execute(LEDGER_QUERY, (ledger.user_id, ledger.max_id))
+    while True:
+        rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+        if not rows:
+            break
+        ledger.append_rows(rows)
+
+
+def _transaction_count(connection, user_id):
+    # Maintained by the rollup triggers (schema migration 3)
+    row = connection.execute(
+        "SELECT transaction_count FROM user_totals WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+@instrumentation.instrumented
+def get_ledger(user_id):
+    """Return the user's ledger snapshot, current as of its latest write.
+
+    When only new rows were added since the snapshot they are appended; deletes
+    (seen as a row count that doesn't add up) trigger a full reload.
+    """
+    key = (database.get_database(), user_id)
+    version = query_cache.get_version(user_id)
+    with _lock:
+        ledger = _ledgers.get(key)
+        if ledger is not None and ledger.version == version:
+            return ledger
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    # One build per user at a time; other users' snapshots stay available meanwhile
+    with load_lock:
+        version = query_cache.get_version(user_id)
+        with _lock:
+            ledger = _ledgers.get(key)
+        if ledger is not None and ledger.version == version:
+            return ledger  # Refreshed by another thread while this one waited
+
+        connection = database.get_connection()
+        if ledger is not None:
+            # Readers may still hold the current snapshot: append to a copy of it
+            ledger = ledger.copy()
+            _load(connection, ledger)  # Rows added since the snapshot
+            if len(ledger) != _transaction_count(connection, user_id):
+                ledger = None  # Rows were deleted too
+        if ledger is None:
+            ledger = Ledger(user_id)
+            _load(connection, ledger)
+        ledger.version = version
+        with _lock:
+            _ledgers[key] = ledger
+        return ledger
+
+
+def clear():
+    """Drop every snapshot"""
+    with _lock:
+        _ledgers.clear()
@@ -0,0 +1,102 @@
+# query_cache.py
+#
+# In-process read-through cache for user_model queries. Every user has a version,
+# part of each cache key, so a write makes all of that user's cached reads
+# unreachable at once and the stale entries simply age out of the LRU. The version
+# pairs a counter the write functions bump after committing with the user's row in
+# data_versions (schema migration 7), which triggers bump on every write from any
+# connection or process, so writes made outside user_model are seen too. Today's
+# date is part of the key as well: results that include recurring occurrences due
+# so far change at midnight.
+
+import copy
+import datetime
+import functools
+import threading
+from collections import OrderedDict
+
+from models import database
+
+# Upper bound on cached results across all users and queries
+MAX_ENTRIES = 512
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> result, least recently used first
+_versions = {}  # (database path, user_id) -> write version
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+def _freeze(value):
+    """Make list/dict arguments usable in a cache key"""
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def get_version(user_id):
+    """user_id's current version; it changes with every committed write to the user's rows"""
+    row = database.get_connection().execute(
+        "SELECT version FROM data_versions WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return _versions.get((database.get_database(), user_id), 0), row[0] if row else 0
+
+
+def bump_version(user_id):
+    """Invalidate every cached read of user_id; call after the write has committed"""
+    key = (database.get_database(), user_id)
+    with _lock:
+        _versions[key] = _versions.get(key, 0) + 1
+        _stats["invalidations"] += 1
+
+
+def cached(func):
+    """Cache func(user_id, ...) per user, arguments and write version.
+
+    Callers get a deep copy of the result, so mutating a returned value (or the tag
+    lists inside returned rows) can't corrupt the cached one.
+    """
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        key = (database.get_database(), name, user_id, get_version(user_id), datetime.date.today(),
+               _freeze(args), _freeze(kwargs))
+        with _lock:
+            if key in _entries:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                return copy.deepcopy(_entries[key])
+            _stats["misses"] += 1
+
+        # Query outside the lock so slow reads don't serialize the other threads
+        result = func(user_id, *args, **kwargs)
+
+        with _lock:
+            _entries[key] = result
+            _entries.move_to_end(key)
+            while len(_entries) > MAX_ENTRIES:
+                _entries.popitem(last=False)
+                _stats["evictions"] += 1
+        return copy.deepcopy(result)
+
+    wrapper.uncached = func
+    return wrapper
+
+
+def get_stats():
+    """Hit/miss counters plus the current size and hit rate"""
+    with _lock:
+        stats = dict(_stats, size=len(_entries), max_entries=MAX_ENTRIES)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def clear():
+    """Drop every cached result and reset the counters"""
+    with _lock:
+        _entries.clear()
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,265 @@
+# recurring.py
+#
+# Recurring transactions (rent, salary, subscriptions) kept as rules instead of rows. A
+# rule repeats every `interval` days, weeks, months or years from its start date, up to
+# its end date if it has one. Occurrences are not written to transactions up front:
+#
+#   occurrences()     a generator over any date range; each occurrence is computed from
+#                     its index, so expansion starts anywhere and runs in either order
+#   pending_totals()  counts the occurrences in a range arithmetically, so a summary
+#                     over decades costs the same as one over a week: O(rules)
+#   materialize()     writes the occurrences up to a day into transactions, on demand;
+#                     from then on they are ordinary rows (taggable, exported, deletable)
+#
+# Occurrences not materialized yet are "pending". user_model folds them into
+# get_financial_summary, get_expenses_by_category and, with include_recurring=True,
+# get_transactions_page, where a pending row's id is minus its rule's id. A range
+# without an end date takes the occurrences due up to today; pass a future end_date
+# for a forecast. Monthly and yearly rules keep their start day, moving to the last
+# day of shorter months (from Jan 31: Feb 28 or 29, Mar 31, Apr 30, ...).
+
+import calendar
+import datetime
+import heapq
+import math
+from collections import namedtuple
+
+from models import database
+from models import instrumentation
+from models import query_cache
+
+# frequency -> (units per interval, unit)
+FREQUENCIES = {'daily': (1, 'days'), 'weekly': (7, 'days'), 'monthly': (1, 'months'), 'yearly': (12, 'months')}
+TRANSACTION_TYPES = ('income', 'expense')
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+Rule = namedtuple('Rule', ['id', 'user_id', 'amount', 'category', 'type', 'description', 'frequency', 'interval',
+                           'start_date', 'end_date', 'materialized_through'])
+RULE_QUERY = f"SELECT {', '.join(Rule._fields)} FROM recurring_rules WHERE user_id = ? ORDER BY id"
+
+
+def _to_date(value):
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+
+class Schedule:
+    """Occurrence arithmetic of one rule: occurrence k falls k * step days or months after the start"""
+
+    def __init__(self, start, frequency, interval=1, end=None):
+        units, self.unit = FREQUENCIES[frequency]
+        self.step = units * interval
+        self.start = _to_date(start)
+        self.end = _to_date(end)
+
+    def occurrence(self, k):
+        """Date of the k-th occurrence (0 is the start), ignoring the end date"""
+        if self.unit == 'days':
+            return self.start + datetime.timedelta(days=k * self.step)
+        months = self.start.month - 1 + k * self.step
+        year, month = self.start.year + months // 12, months % 12 + 1
+        return datetime.date(year, month, min(self.start.day, calendar.monthrange(year, month)[1]))
+
+    def first_on_or_after(self, day):
+        """Index of the first occurrence dated day or later, ignoring the end date"""
+        if day <= self.start:
+            return 0
+        if self.unit == 'days':
+            return -(-(day - self.start).days // self.step)
+        # Occurrence k is in month start + k * step, so at most one index needs checking
+        k = ((day.year - self.start.year) * 12 + day.month - self.start.month) // self.step
+        return k if self.occurrence(k) >= day else k + 1
+
+    def index_range(self, first_day, last_day):
+        """[lo, hi) of the occurrence indexes dated first_day..last_day inclusive and within the rule's dates"""
+        if self.end is not None and self.end < last_day:
+            last_day = self.end
+        lo = self.first_on_or_after(first_day) if first_day else 0
+        return lo, max(lo, self.first_on_or_after(last_day + _ONE_DAY))
+
+
+def schedule_of(rule):
+    return Schedule(rule.start_date, rule.frequency, rule.interval, rule.end_date)
+
+
+def _pending_range(rule, start_date, end_date):
+    """Index range of the rule's pending occurrences dated start_date..end_date (today when None)"""
+    first_day = _to_date(start_date)
+    materialized = _to_date(rule.materialized_through)
+    if materialized is not None and (first_day is None or first_day <= materialized):
+        first_day = materialized + _ONE_DAY
+    last_day = _to_date(end_date) or datetime.date.today()
+    return schedule_of(rule).index_range(first_day, last_day)
+
+
+def occurrences(rule, start_date=None, end_date=None, descending=False):
+    """Yield the dates ('YYYY-MM-DD') of a rule's pending occurrences between start_date and end_date.
+
+    end_date defaults to today. Nothing is computed ahead of what the caller consumes.
+    """
+    schedule = schedule_of(rule)
+    lo, hi = _pending_range(rule, start_date, end_date)
+    for k in (range(hi - 1, lo - 1, -1) if descending else range(lo, hi)):
+        yield schedule.occurrence(k).isoformat()
+
+
+def pending_count(rule, start_date=None, end_date=None):
+    """Number of the rule's pending occurrences between start_date and end_date, without expanding them"""
+    lo, hi = _pending_range(rule, start_date, end_date)
+    return hi - lo
+
+
+def _validate(amount, category, transaction_type, frequency, interval, start_date, end_date):
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount):
+        raise ValueError(f"invalid amount {amount!r}")
+    if not category:
+        raise ValueError("missing category")
+    if transaction_type not in TRANSACTION_TYPES:
+        raise ValueError(f"invalid type {transaction_type!r}")
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"frequency must be one of {', '.join(FREQUENCIES)}")
+    if not isinstance(interval, int) or interval < 1:
+        raise ValueError("interval must be a positive whole number")
+    start, end = _to_date(start_date), _to_date(end_date)  # ValueError unless ISO dates
+    if start is None:
+        raise ValueError("missing start date")
+    if end is not None and end < start:
+        raise ValueError("end date is before the start date")
+    return start.isoformat(), end.isoformat() if end else None
+
+
+@instrumentation.instrumented
+def add_rule(user_id, amount, category, transaction_type, start_date, frequency='monthly', interval=1,
+             end_date=None, description=''):
+    """Add a recurring rule and return its id; raises ValueError for an invalid rule.
+
+    Dates are 'YYYY-MM-DD' strings or dates; the first occurrence is on start_date.
+    """
+    start_date, end_date = _validate(amount, category, transaction_type, frequency, interval, start_date,
+                                     end_date)
+    connection = database.get_connection()
+    with connection:
+        cursor = connection.execute("""
+            INSERT INTO recurring_rules (user_id, amount, category, type, description, frequency, interval,
+                                         start_date, end_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, amount, category, transaction_type, description, frequency, interval, start_date, end_date))
+    query_cache.bump_version(user_id)
+    return cursor.lastrowid
+
+
+def _load_rules(user_id):
+    return [Rule(*row) for row in database.get_connection().execute(RULE_QUERY, (user_id,))]
+
+
+@instrumentation.instrumented
+@query_cache.cached
+def get_rules(user_id):
+    """The user's rules, oldest first"""
+    return _load_rules(user_id)
+
+
+@instrumentation.instrumented
+def delete_rule(user_id, rule_id):
+    """Delete a rule; its materialized transactions stay. Returns False if the user has no such rule"""
+    connection = database.get_connection()
+    with connection:
+        deleted = connection.execute("DELETE FROM recurring_rules WHERE id = ? AND user_id = ?",
+                                     (rule_id, user_id)).rowcount
+    if deleted:
+        query_cache.bump_version(user_id)
+    return bool(deleted)
+
+
+def pending_totals(user_id, start_date=None, end_date=None):
+    """{(type, category): (total, count)} of the pending occurrences dated start_date..end_date"""
+    totals = {}
+    for rule in _load_rules(user_id):
+        pending = pending_count(rule, start_date, end_date)
+        if pending:
+            key = (rule.type, rule.category)
+            total, count = totals.get(key, (0.0, 0))
+            totals[key] = (total + rule.amount * pending, count + pending)
+    return totals
+
+
+def pending_summary(user_id, start_date=None, end_date=None):
+    """(income, expenses) of the pending occurrences, like user_model.get_financial_summary"""
+    income = expenses = 0.0
+    for (transaction_type, _), (total, _) in pending_totals(user_id, start_date, end_date).items():
+        if transaction_type == 'income':
+            income += total
+        else:
+            expenses += total
+    return income, expenses
+
+
+def pending_expenses_by_category(user_id, start_date=None, end_date=None):
+    """{category: total} of the pending expense occurrences"""
+    return {category: total for (transaction_type, category), (total, _)
+            in pending_totals(user_id, start_date, end_date).items() if transaction_type == 'expense'}
+
+
+def _rows(rule, start_date, end_date, descending):
+    for date in occurrences(rule, start_date, end_date, descending):
+        yield (-rule.id, rule.user_id, rule.amount, rule.category, rule.type, date, rule.description, [])
+
+
+def pending_rows(user_id, start_date=None, end_date=None, category=None, descending=False, after=None):
+    """Yield the pending occurrences as transaction rows with tags, in (date, id) order.
+
+    Rows look like get_transactions_page rows, with minus the rule id as their id, so
+    they interleave with stored rows in date order. after is a (date, id) keyset
+    position as in get_transactions_page; only rows past it are produced.
+    """
+    streams = []
+    for rule in _load_rules(user_id):
+        if category is not None and rule.category != category:
+            continue
+        first_day, last_day = start_date, end_date
+        if after is not None:
+            # Skip to the occurrences past the key: on its date only if -rule.id sorts after its id
+            day = _to_date(after[0])
+            if descending:
+                day = day if -rule.id < after[1] else day - _ONE_DAY
+                last_day = min(day, _to_date(end_date) or datetime.date.today())
+            else:
+                day = day if -rule.id > after[1] else day + _ONE_DAY
+                first_day = max(day, _to_date(start_date)) if start_date else day
+        streams.append(_rows(rule, first_day, last_day, descending))
+    return heapq.merge(*streams, key=lambda row: (row[5], row[0]), reverse=descending)
+
+
+@instrumentation.instrumented
+def materialize(user_id, through_date=None):
+    """Write the user's pending occurrences up to through_date (default today) as transactions.
+
+    Runs in one transaction; returns the number of transactions written.
+    """
+    through = _to_date(through_date) or datetime.date.today()
+    connection = database.get_connection()
+    written = 0
+    # Take the write lock before reading the rules: two calls that both read the same
+    # materialized_through would otherwise both post the occurrences after it
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        for rule in _load_rules(user_id):
+            rows = [(user_id, rule.amount, rule.category, rule.type, date, rule.description)
+                    for date in occurrences(rule, end_date=through)]
+            connection.executemany("""
+                INSERT INTO transactions (user_id, amount, category, type, date, description)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            if not rule.materialized_through or rule.materialized_through < through.isoformat():
+                connection.execute("UPDATE recurring_rules SET materialized_through = ? WHERE id = ?",
+                                   (through.isoformat(), rule.id))
+            written += len(rows)
+        connection.commit()
+    except BaseException:
+        if connection.in_transaction:
+            connection.rollback()
+        raise
+    query_cache.bump_version(user_id)
+    return written
@@ -0,0 +1,376 @@
+# schema.py
+#
+# Versioned schema migrations. The database records the last applied migration
+# in PRAGMA user_version; migrate() applies only the ones that are missing, so a
+# current database does no DDL at startup.
+
+import re
+
+# Adds one to a user's data version (migration 7); for writes made with the version
+# triggers suspended, such as bulk imports
+BUMP_DATA_VERSION = """
+    INSERT INTO data_versions (user_id, version) VALUES (?, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+"""
+
+# Per-row triggers a bulk writer switches off for its own transaction by inserting a
+# row into bulk_writes (migration 8) and deleting it again before committing; the
+# writer applies their effect once per batch instead. Other connections only ever see
+# bulk_writes empty, and no DDL runs, so their prepared statements stay valid.
+BULK_GATED_TRIGGER_PATTERNS = ('trg_transactions_rollup_*', 'trg_transactions_fts_*',
+                               'trg_transactions_version_*', 'trg_transaction_tags_version_*')
+SUSPEND_TRIGGERS = "INSERT INTO bulk_writes (id) VALUES (1)"
+RESUME_TRIGGERS = "DELETE FROM bulk_writes"
+_BULK_GATE = "NOT EXISTS (SELECT 1 FROM bulk_writes)"
+
+
+def _data_version_triggers(table, owners):
+    """CREATE TRIGGER statements bumping the data version of a row's user on every write to table.
+
+    owners maps 'NEW'/'OLD' to an SQL expression giving the user id of the new or
+    old row; an UPDATE bumps both users when a row changes hands.
+    """
+    def bump(row):
+        return f"""
+            INSERT INTO data_versions (user_id, version)
+            SELECT {owners[row]}, 1 WHERE {owners[row]} IS NOT NULL
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;"""
+
+    events = [('insert', 'INSERT', ['NEW']), ('delete', 'DELETE', ['OLD']), ('update', 'UPDATE', ['OLD', 'NEW'])]
+    return [
+        f"CREATE TRIGGER trg_{table}_version_{name} AFTER {event} ON {table} BEGIN"
+        f"{''.join(bump(row) for row in rows)}\n        END"
+        for name, event, rows in events
+    ]
+
+
+def _gate_bulk_triggers(connection):
+    """Recreate the BULK_GATED_TRIGGER_PATTERNS triggers with a WHEN clause that is false during bulk writes"""
+    triggers = connection.execute("""
+        SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND ({})
+    """.format(' OR '.join(['name GLOB ?'] * len(BULK_GATED_TRIGGER_PATTERNS))),
+        BULK_GATED_TRIGGER_PATTERNS).fetchall()
+    for name, sql in triggers:
+        header, begin, body = re.split(r"(\bBEGIN\b)", sql, maxsplit=1, flags=re.IGNORECASE)
+        when = re.search(r"\bWHEN\b", header, re.IGNORECASE)
+        if when:
+            header = f"{header[:when.start()]}WHEN ({header[when.end():].strip()}) AND {_BULK_GATE}\n        "
+        else:
+            header = f"{header.rstrip()}\n        WHEN {_BULK_GATE}\n        "
+        connection.execute(f"DROP TRIGGER {name}")
+        connection.execute(header + begin + body)
+
+
+# Each migration is (version, description, statements); a statement is SQL, or a
+# function run with the connection for a step that depends on what is already in
+# the database. Append new migrations to the end of the list; never edit one that
+# has already shipped.
+MIGRATIONS = [
+    (1, "base tables", [
+        # IF NOT EXISTS keeps databases created before versioning (user_version 0) working
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            type TEXT NOT NULL,  -- 'income' or 'expense'
+            date TEXT NOT NULL,
+            description TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            name TEXT NOT NULL,
+            UNIQUE(user_id, name),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            name TEXT NOT NULL,
+            UNIQUE(user_id, name),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transaction_tags (
+            transaction_id INTEGER,
+            tag_id INTEGER,
+            FOREIGN KEY (transaction_id) REFERENCES transactions(id),
+            FOREIGN KEY (tag_id) REFERENCES tags(id),
+            PRIMARY KEY (transaction_id, tag_id)
+        )
+        """,
+    ]),
+    (2, "indexes for the per-user transaction queries", [
+        # Transaction listings: WHERE user_id = ? ORDER BY date DESC (rowid breaks ties)
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date)",
+        # Summary and expenses-by-category totals are answered from the index alone
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_type_category_amount "
+        "ON transactions (user_id, type, category, amount)",
+        # Category filter, still returned in date order
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_category_date ON transactions (user_id, category, date)",
+        # Tag filter: tag name -> tag id -> transactions
+        "CREATE INDEX IF NOT EXISTS idx_transaction_tags_tag ON transaction_tags (tag_id, transaction_id)",
+    ]),
+    (3, "rollup tables maintained by triggers", [
+        # Running per-user totals, so the financial summary is a single-row lookup
+        """
+        CREATE TABLE user_totals (
+            user_id INTEGER PRIMARY KEY,
+            total_income REAL NOT NULL DEFAULT 0,
+            total_expenses REAL NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # Per user/type/category/month sums; month is the 'YYYY-MM' prefix of transactions.date
+        """
+        CREATE TABLE category_monthly_totals (
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            month TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, type, category, month)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER trg_transactions_rollup_insert AFTER INSERT ON transactions
+        WHEN NEW.user_id IS NOT NULL
+        BEGIN
+            INSERT INTO user_totals (user_id, total_income, total_expenses, transaction_count)
+            VALUES (NEW.user_id,
+                    CASE WHEN NEW.type = 'income' THEN NEW.amount ELSE 0 END,
+                    CASE WHEN NEW.type = 'expense' THEN NEW.amount ELSE 0 END,
+                    1)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_income = total_income + excluded.total_income,
+                total_expenses = total_expenses + excluded.total_expenses,
+                transaction_count = transaction_count + 1;
+
+            INSERT INTO category_monthly_totals (user_id, type, category, month, total, transaction_count)
+            VALUES (NEW.user_id, NEW.type, NEW.category, substr(NEW.date, 1, 7), NEW.amount, 1)
+            ON CONFLICT (user_id, type, category, month) DO UPDATE SET
+                total = total + excluded.total,
+                transaction_count = transaction_count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER trg_transactions_rollup_delete AFTER DELETE ON transactions
+        WHEN OLD.user_id IS NOT NULL
+        BEGIN
+            UPDATE user_totals SET
+                total_income = total_income - CASE WHEN OLD.type = 'income' THEN OLD.amount ELSE 0 END,
+                total_expenses = total_expenses - CASE WHEN OLD.type = 'expense' THEN OLD.amount ELSE 0 END,
+                transaction_count = transaction_count - 1
+            WHERE user_id = OLD.user_id;
+
+            UPDATE category_monthly_totals SET
+                total = total - OLD.amount,
+                transaction_count = transaction_count - 1
+            WHERE user_id = OLD.user_id AND type = OLD.type AND category = OLD.category
+              AND month = substr(OLD.date, 1, 7);
+
+            DELETE FROM category_monthly_totals
+            WHERE user_id = OLD.user_id AND type = OLD.type AND category = OLD.category
+              AND month = substr(OLD.date, 1, 7) AND transaction_count <= 0;
+        END
+        """,
+        """
+        CREATE TRIGGER trg_transactions_rollup_update
+        AFTER UPDATE OF user_id, amount, category, type, date ON transactions
+        WHEN OLD.user_id IS NOT NULL AND NEW.user_id IS NOT NULL
+        BEGIN
+            UPDATE user_totals SET
+                total_income = total_income - CASE WHEN OLD.type = 'income' THEN OLD.amount ELSE 0 END,
+                total_expenses = total_expenses - CASE WHEN OLD.type = 'expense' THEN OLD.amount ELSE 0 END,
+                transaction_count = transaction_count - 1
+            WHERE user_id = OLD.user_id;
+
+            UPDATE category_monthly_totals SET
+                total = total - OLD.amount,
+                transaction_count = transaction_count - 1
+            WHERE user_id = OLD.user_id AND type = OLD.type AND category = OLD.category
+              AND month = substr(OLD.date, 1, 7);
+
+            DELETE FROM category_monthly_totals
+            WHERE user_id = OLD.user_id AND type = OLD.type AND category = OLD.category
+              AND month = substr(OLD.date, 1, 7) AND transaction_count <= 0;
+
+            INSERT INTO user_totals (user_id, total_income, total_expenses, transaction_count)
+            VALUES (NEW.user_id,
+                    CASE WHEN NEW.type = 'income' THEN NEW.amount ELSE 0 END,
+                    CASE WHEN NEW.type = 'expense' THEN NEW.amount ELSE 0 END,
+                    1)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_income = total_income + excluded.total_income,
+                total_expenses = total_expenses + excluded.total_expenses,
+                transaction_count = transaction_count + 1;
+
+            INSERT INTO category_monthly_totals (user_id, type, category, month, total, transaction_count)
+            VALUES (NEW.user_id, NEW.type, NEW.category, substr(NEW.date, 1, 7), NEW.amount, 1)
+            ON CONFLICT (user_id, type, category, month) DO UPDATE SET
+                total = total + excluded.total,
+                transaction_count = transaction_count + 1;
+        END
+        """,
+        # Backfill from the rows that already exist
+        """
+        INSERT INTO user_totals (user_id, total_income, total_expenses, transaction_count)
+        SELECT user_id,
+               TOTAL(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+               TOTAL(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+               COUNT(*)
+        FROM transactions
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+        """,
+        """
+        INSERT INTO category_monthly_totals (user_id, type, category, month, total, transaction_count)
+        SELECT user_id, type, category, substr(date, 1, 7), TOTAL(amount), COUNT(*)
+        FROM transactions
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, type, category, substr(date, 1, 7)
+        """,
+    ]),
+    (4, "drop the totals index superseded by the rollup tables", [
+        # Summary and expenses-by-category now read the rollups (migration 3); this was the
+        # most expensive index to maintain on insert and no query needs it any more
+        "DROP INDEX IF EXISTS idx_transactions_user_type_category_amount",
+    ]),
+    (5, "full-text index over transaction descriptions", [
+        # External-content FTS5 table: it stores only the index and reads description
+        # back from transactions by rowid. remove_diacritics lets "cafe" match "café".
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+            description,
+            content='transactions',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert
+        AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete
+        AFTER DELETE ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description)
+            VALUES ('delete', OLD.id, OLD.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update
+        AFTER UPDATE OF description ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description)
+            VALUES ('delete', OLD.id, OLD.description);
+            INSERT INTO transactions_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+        """,
+        # Index the existing rows
+        "INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')",
+    ]),
+    (6, "recurring transaction rules", [
+        # One row per rule, however long it repeats: occurrences are computed when queried
+        # (see models/recurring.py) and only written to transactions when materialized
+        """
+        CREATE TABLE recurring_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            type TEXT NOT NULL,  -- 'income' or 'expense'
+            description TEXT,
+            frequency TEXT NOT NULL,  -- 'daily', 'weekly', 'monthly' or 'yearly'
+            interval INTEGER NOT NULL DEFAULT 1,  -- every interval days/weeks/months/years
+            start_date TEXT NOT NULL,  -- the first occurrence
+            end_date TEXT,  -- no occurrence after this day; NULL repeats indefinitely
+            materialized_through TEXT,  -- occurrences up to this day are rows in transactions
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        "CREATE INDEX idx_recurring_rules_user ON recurring_rules (user_id)",
+    ]),
+    (7, "per-user data versions maintained by triggers", [
+        # Bumped on every write to a user's rows, whichever connection or process makes it;
+        # query_cache and the ledger snapshots compare it to tell whether they are stale
+        """
+        CREATE TABLE data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        *_data_version_triggers('transactions', {'NEW': 'NEW.user_id', 'OLD': 'OLD.user_id'}),
+        *_data_version_triggers('categories', {'NEW': 'NEW.user_id', 'OLD': 'OLD.user_id'}),
+        *_data_version_triggers('tags', {'NEW': 'NEW.user_id', 'OLD': 'OLD.user_id'}),
+        *_data_version_triggers('transaction_tags', {
+            'NEW': '(SELECT user_id FROM tags WHERE id = NEW.tag_id)',
+            'OLD': '(SELECT user_id FROM tags WHERE id = OLD.tag_id)',
+        }),
+        *_data_version_triggers('recurring_rules', {'NEW': 'NEW.user_id', 'OLD': 'OLD.user_id'}),
+    ]),
+    (8, "switch for the per-row triggers during bulk writes", [
+        # Imports used to drop and recreate these triggers around every batch; each DDL
+        # statement made every other connection re-prepare its cached statements
+        "CREATE TABLE bulk_writes (id INTEGER PRIMARY KEY)",
+        _gate_bulk_triggers,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(connection):
+    """Return the schema version recorded in the database"""
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection):
+    """Bring the database schema up to LATEST_VERSION.
+
+    Each migration runs in its own transaction together with its user_version
+    bump, so an interrupted upgrade resumes from the last completed step.
+    Returns the schema version after migrating.
+    """
+    version = get_version(connection)
+    if version >= LATEST_VERSION:
+        return version
+
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        connection.execute("BEGIN")
+        try:
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.execute(statement)
+            connection.execute(f"PRAGMA user_version = {migration_version}")
+        except Exception:
+            connection.rollback()
+            raise
+        connection.commit()
+        version = migration_version
+
+    return version
@@ -2,103 +2,27 @@
 
 import sqlite3
 import bcrypt
-import csv
+import heapq
+import itertools
+import json
+import logging
+from models import database
+from models import instrumentation
+from models import query_cache
+from models import recurring
+from models import schema
+
+logger = logging.getLogger(__name__)
 
 # Database setup and connection
 def connect_db():
-    connection = sqlite3.connect("db/finance_tracker.db")
-    return connection
+    """Return the calling thread's pooled connection (owned by the pool, never close it)"""
+    return database.get_connection()
 
-def create_users_table():
-    """Create the users table if it doesn't exist"""
-    connection = connect_db()
-    cursor = connection.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL
-    )
-    """)
-
-    connection.commit()
-    connection.close()
-
-def create_transactions_table():
-    """Create the transactions table if it doesn't exist"""
-    connection = connect_db()
-    cursor = connection.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS transactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        amount REAL NOT NULL,
-        category TEXT NOT NULL,
-        type TEXT NOT NULL,  -- 'income' or 'expense'
-        date TEXT NOT NULL,
-        description TEXT,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )
-    """)
-
-    connection.commit()
-    connection.close()
-
-def create_categories_table():
-    """Create the categories table if it doesn't exist"""
-    connection = connect_db()
-    cursor = connection.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS categories (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        name TEXT NOT NULL,
-        UNIQUE(user_id, name),
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )
-    """)
-
-    connection.commit()
-    connection.close()
-
-def create_tags_table():
-    """Create the tags table if it doesn't exist"""
-    connection = connect_db()
-    cursor = connection.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS tags (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        name TEXT NOT NULL,
-        UNIQUE(user_id, name),
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )
-    """)
-
-    connection.commit()
-    connection.close()
-
-def create_transaction_tags_table():
-    """Create the transaction_tags table if it doesn't exist"""
-    connection = connect_db()
-    cursor = connection.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS transaction_tags (
-        transaction_id INTEGER,
-        tag_id INTEGER,
-        FOREIGN KEY (transaction_id) REFERENCES transactions(id),
-        FOREIGN KEY (tag_id) REFERENCES tags(id),
-        PRIMARY KEY (transaction_id, tag_id)
-    )
-    """)
-
-    connection.commit()
-    connection.close()
+@instrumentation.instrumented
+def initialize_database():
+    """Create or upgrade the database schema; a no-op when it is already current"""
+    return schema.migrate(connect_db())
 
 # Password handling functions (hashing, verification, etc.)
 def hash_password(password):
@@ -111,19 +35,19 @@ def verify_password(stored_password, provided_password):
     """Verify the stored hashed password against the provided password"""
     return bcrypt.checkpw(provided_password.encode('utf-8'), stored_password)
 
+# create_user and authenticate_user are not instrumented: bcrypt is slow on purpose,
+# so every login would be logged as a slow call
+
 def create_user(username, password):
     """Create a new user with a hashed password"""
     connection = connect_db()
-    cursor = connection.cursor()
+    hashed_password = hash_password(password)
 
     try:
-        hashed_password = hash_password(password)
-        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-        connection.commit()
+        with connection:
+            connection.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
     except sqlite3.IntegrityError:
         return False  # Username already exists
-    finally:
-        connection.close()
 
     return True
 
@@ -135,33 +59,96 @@ def authenticate_user(username, password):
     cursor.execute("SELECT id, password FROM users WHERE username = ?", (username,))
     user = cursor.fetchone()
 
-    connection.close()
-
     if user:
         user_id, stored_password = user
         if verify_password(stored_password, password):
             return user_id  # Return the user_id upon successful authentication
     return None  # Return None if authentication fails
 
+# Statements of the single-row writes below, run on a connection inside the caller's
+# transaction. The write functions commit each one on its own; write_queue runs them
+# for many callers at once and group-commits them.
+
+def insert_transaction(connection, user_id, amount, category, transaction_type, date, description):
+    """INSERT one transaction and return its id"""
+    cursor = connection.execute("""
+        INSERT INTO transactions (user_id, amount, category, type, date, description)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (user_id, amount, category, transaction_type, date, description))
+    return cursor.lastrowid
+
+def insert_category(connection, user_id, category_name):
+    """INSERT one category; raises sqlite3.IntegrityError if the user already has it"""
+    connection.execute("""
+        INSERT INTO categories (user_id, name)
+        VALUES (?, ?)
+    """, (user_id, category_name))
+
+def link_tags(connection, transaction_id, tags, user_id):
+    """Tag a transaction, creating the user's tags that don't exist yet"""
+    cursor = connection.cursor()
+    for tag_name in tags:
+        # Ensure the tag exists
+        cursor.execute("""
+            SELECT id FROM tags WHERE user_id = ? AND name = ?
+        """, (user_id, tag_name))
+        result = cursor.fetchone()
+        if result:
+            tag_id = result[0]
+        else:
+            # Tag does not exist, create it
+            cursor.execute("""
+                INSERT INTO tags (user_id, name)
+                VALUES (?, ?)
+            """, (user_id, tag_name))
+            tag_id = cursor.lastrowid
+
+        # Associate tag with transaction
+        try:
+            cursor.execute("""
+                INSERT INTO transaction_tags (transaction_id, tag_id)
+                VALUES (?, ?)
+            """, (transaction_id, tag_id))
+        except sqlite3.IntegrityError:
+            # Association already exists
+            pass
+
+def remove_transaction(connection, transaction_id, user_id=None):
+    """DELETE a transaction and its tag links; returns its owner's id, or None if there was none.
+
+    With user_id, only that user's transaction is deleted.
+    """
+    owner = connection.execute("SELECT user_id FROM transactions WHERE id = ?", (transaction_id,)).fetchone()
+    if owner is None or user_id is not None and owner[0] != user_id:
+        return None
+    connection.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+    # Also delete related tags
+    connection.execute("DELETE FROM transaction_tags WHERE transaction_id = ?", (transaction_id,))
+    return owner[0] if owner else None
+
+def remove_category(connection, user_id, category_name):
+    """DELETE one of the user's categories; returns whether there was one"""
+    return connection.execute("""
+        DELETE FROM categories WHERE user_id = ? AND name = ?
+    """, (user_id, category_name)).rowcount > 0
+
+@instrumentation.instrumented
 def add_category(user_id, category_name):
     """Add a new category for the user"""
     connection = connect_db()
-    cursor = connection.cursor()
 
     try:
-        cursor.execute("""
-            INSERT INTO categories (user_id, name)
-            VALUES (?, ?)
-        """, (user_id, category_name))
-        connection.commit()
+        with connection:
+            insert_category(connection, user_id, category_name)
     except sqlite3.IntegrityError:
         # Category already exists for this user
         return False
-    finally:
-        connection.close()
 
+    query_cache.bump_version(user_id)
     return True
 
+@instrumentation.instrumented
+@query_cache.cached
 def get_categories(user_id):
     """Retrieve all categories for a specific user"""
     connection = connect_db()
@@ -172,26 +159,26 @@ def get_categories(user_id):
     """, (user_id,))
     categories = [row[0] for row in cursor.fetchall()]
 
-    connection.close()
     return categories
 
+@instrumentation.instrumented
 def add_tag(user_id, tag_name):
     """Add a new tag for the user"""
     connection = connect_db()
-    cursor = connection.cursor()
 
     try:
-        cursor.execute("""
-            INSERT INTO tags (user_id, name)
-            VALUES (?, ?)
-        """, (user_id, tag_name))
-        connection.commit()
+        with connection:
+            connection.execute("""
+                INSERT INTO tags (user_id, name)
+                VALUES (?, ?)
+            """, (user_id, tag_name))
     except sqlite3.IntegrityError:
         # Tag already exists for this user
         pass  # Ignore if the tag already exists
-    finally:
-        connection.close()
+    else:
+        query_cache.bump_version(user_id)
 
+@instrumentation.instrumented
 def get_tag_id(user_id, tag_name):
     """Retrieve the tag ID for a given tag name and user"""
     connection = connect_db()
@@ -202,156 +189,280 @@ def get_tag_id(user_id, tag_name):
     """, (user_id, tag_name))
     result = cursor.fetchone()
 
-    connection.close()
-
     if result:
         return result[0]
     else:
         return None
 
+@instrumentation.instrumented
 def add_tags_to_transaction(transaction_id, tags, user_id):
     """Associate tags with a transaction"""
     connection = connect_db()
-    cursor = connection.cursor()
 
-    try:
-        for tag_name in tags:
-            # Ensure the tag exists
-            cursor.execute("""
-                SELECT id FROM tags WHERE user_id = ? AND name = ?
-            """, (user_id, tag_name))
-            result = cursor.fetchone()
-            if result:
-                tag_id = result[0]
-            else:
-                # Tag does not exist, create it
-                cursor.execute("""
-                    INSERT INTO tags (user_id, name)
-                    VALUES (?, ?)
-                """, (user_id, tag_name))
-                tag_id = cursor.lastrowid
-
-            # Associate tag with transaction
-            try:
-                cursor.execute("""
-                    INSERT INTO transaction_tags (transaction_id, tag_id)
-                    VALUES (?, ?)
-                """, (transaction_id, tag_id))
-            except sqlite3.IntegrityError:
-                # Association already exists
-                pass
-
-        connection.commit()
-    finally:
-        connection.close()
+    with connection:
+        link_tags(connection, transaction_id, tags, user_id)
+
+    query_cache.bump_version(user_id)
 
+@instrumentation.instrumented
 def add_transaction(user_id, amount, category, transaction_type, date, description):
     """Add a new transaction to the database"""
     connection = connect_db()
-    cursor = connection.cursor()
-
-    cursor.execute("""
-        INSERT INTO transactions (user_id, amount, category, type, date, description)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (user_id, amount, category, transaction_type, date, description))
 
-    transaction_id = cursor.lastrowid  # Get the ID of the inserted transaction
+    with connection:
+        transaction_id = insert_transaction(connection, user_id, amount, category, transaction_type, date,
+                                            description)
 
-    connection.commit()
-    connection.close()
+    query_cache.bump_version(user_id)
 
     return transaction_id
 
-def get_transactions(user_id):
-    """Get all transactions for a specific user"""
+# Correlated subquery appended to transaction queries by with_tags=True: the row's tag
+# names joined with TAG_LIST_SEPARATOR, resolved through the transaction_tags primary key
+TAG_LIST_SEPARATOR = '\x1f'
+TAGS_COLUMN_SQL = """
+    (SELECT GROUP_CONCAT(tg.name, char(31))
+     FROM transaction_tags tt JOIN tags tg ON tg.id = tt.tag_id
+     WHERE tt.transaction_id = t.id) AS tags
+"""
+
+def _split_tag_lists(rows):
+    """Turn the trailing tags column of each row into a list of tag names"""
+    return [row[:-1] + (row[-1].split(TAG_LIST_SEPARATOR) if row[-1] else [],) for row in rows]
+
+@instrumentation.instrumented
+def get_transactions(user_id, with_tags=False):
+    """Get all transactions for a specific user.
+
+    With with_tags=True each row gets an extra trailing element: the list of its
+    tag names, fetched in the same query.
+    """
     connection = connect_db()
     cursor = connection.cursor()
 
+    if with_tags:
+        cursor.execute(f"""
+            SELECT t.*, {TAGS_COLUMN_SQL} FROM transactions t WHERE t.user_id = ? ORDER BY t.date DESC
+        """, (user_id,))
+        return _split_tag_lists(cursor.fetchall())
+
     cursor.execute("""
         SELECT * FROM transactions WHERE user_id = ? ORDER BY date DESC
     """, (user_id,))
     transactions = cursor.fetchall()
 
-    connection.close()
     return transactions
 
-def get_financial_summary(user_id):
-    """Get the total income and total expenses for the logged-in user"""
+@instrumentation.instrumented
+@query_cache.cached
+def get_financial_summary(user_id, start_date=None, end_date=None):
+    """Get the total income and total expenses for the logged-in user.
+
+    Whole-history totals come from the rollup table; a start_date/end_date range
+    ('YYYY-MM-DD', inclusive) is answered from the user's in-memory ledger. Both
+    include the recurring occurrences due by end_date (default today) that are not
+    materialized yet (see models/recurring.py).
+    """
+    if start_date or end_date:
+        from models import ledger
+        return _with_pending(user_id, ledger.get_ledger(user_id).summary(start_date, end_date),
+                             start_date, end_date)
+
     try:
         with connect_db() as connection:
             cursor = connection.cursor()
 
-            # Calculate total income
+            # Totals are kept current by triggers on transactions (see schema migration 3);
+            # rounding to cents hides float residue left behind by deletes
             cursor.execute("""
-                SELECT SUM(amount) FROM transactions WHERE user_id = ? AND type = 'income'
+                SELECT ROUND(total_income, 2), ROUND(total_expenses, 2) FROM user_totals WHERE user_id = ?
             """, (user_id,))
-            total_income = cursor.fetchone()[0] or 0  # Use 0 if there are no income transactions
-
-            # Calculate total expenses
-            cursor.execute("""
-                SELECT SUM(amount) FROM transactions WHERE user_id = ? AND type = 'expense'
-            """, (user_id,))
-            total_expenses = cursor.fetchone()[0] or 0  # Use 0 if there are no expense transactions
+            row = cursor.fetchone()
+            total_income, total_expenses = row if row else (0, 0)  # No transactions yet
 
         # Return both values
-        return total_income, total_expenses
+        return _with_pending(user_id, (total_income, total_expenses))
 
     except Exception as e:
-        print(f"An error occurred while fetching the financial summary: {e}")
+        logger.error("An error occurred while fetching the financial summary: %s", e)
         return 0, 0  # Return 0 for both income and expenses in case of an error
 
+def _with_pending(user_id, summary, start_date=None, end_date=None):
+    """Add the pending recurring occurrences to an (income, expenses) summary"""
+    pending_income, pending_expenses = recurring.pending_summary(user_id, start_date, end_date)
+    if not (pending_income or pending_expenses):
+        return summary
+    return round(summary[0] + pending_income, 2), round(summary[1] + pending_expenses, 2)
+
+@instrumentation.instrumented
 def delete_transaction(transaction_id):
     """Delete a transaction from the database by its transaction ID"""
     try:
         with connect_db() as connection:
-            cursor = connection.cursor()
-            cursor.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
-            # Also delete related tags
-            cursor.execute("DELETE FROM transaction_tags WHERE transaction_id = ?", (transaction_id,))
-            connection.commit()
-        print(f"Transaction {transaction_id} deleted successfully.")
+            owner = remove_transaction(connection, transaction_id)
+        # The owner's cached reads have to be invalidated once the delete commits
+        if owner is not None:
+            query_cache.bump_version(owner)
+        logger.info("Transaction %s deleted successfully.", transaction_id)
     except Exception as e:
-        print(f"An error occurred while deleting transaction: {e}")
+        logger.error("An error occurred while deleting transaction: %s", e)
+
+@instrumentation.instrumented
+@query_cache.cached
+def get_expenses_by_category(user_id, start_date=None, end_date=None):
+    """Get expenses grouped by category for a specific user, optionally within a date range.
+
+    Pending recurring occurrences are included as in get_financial_summary.
+    """
+    if start_date or end_date:
+        from models import ledger
+        expenses = ledger.get_ledger(user_id).totals_by_category('expense', start_date, end_date)
+    else:
+        expenses = _expenses_from_rollups(user_id)
 
-def get_expenses_by_category(user_id):
-    """Get expenses grouped by category for a specific user."""
+    for category, total in recurring.pending_expenses_by_category(user_id, start_date, end_date).items():
+        expenses[category] = round(expenses.get(category, 0) + total, 2)
+    return expenses
+
+def _expenses_from_rollups(user_id):
     connection = connect_db()
     cursor = connection.cursor()
+    # Read from the monthly rollup: one row per category and month, independent of ledger size
     cursor.execute("""
-        SELECT category, SUM(amount)
-        FROM transactions
+        SELECT category, ROUND(SUM(total), 2)
+        FROM category_monthly_totals
         WHERE user_id = ? AND type = 'expense'
         GROUP BY category
     """, (user_id,))
     result = cursor.fetchall()
-    connection.close()
     return {category: total for category, total in result}
 
-def export_transactions_to_csv(user_id, filename):
-    """Export user's transactions to a CSV file."""
-    transactions = get_transactions(user_id)
+@instrumentation.instrumented
+def rebuild_rollups(user_id):
+    """Recompute a user's rollup rows from the transactions table"""
+    connection = connect_db()
+
+    with connection:
+        connection.execute("DELETE FROM user_totals WHERE user_id = ?", (user_id,))
+        connection.execute("DELETE FROM category_monthly_totals WHERE user_id = ?", (user_id,))
+        connection.execute("""
+            INSERT INTO user_totals (user_id, total_income, total_expenses, transaction_count)
+            SELECT user_id,
+                   TOTAL(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+                   TOTAL(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+                   COUNT(*)
+            FROM transactions
+            WHERE user_id = ?
+            GROUP BY user_id
+        """, (user_id,))
+        connection.execute("""
+            INSERT INTO category_monthly_totals (user_id, type, category, month, total, transaction_count)
+            SELECT user_id, type, category, substr(date, 1, 7), TOTAL(amount), COUNT(*)
+            FROM transactions
+            WHERE user_id = ?
+            GROUP BY user_id, type, category, substr(date, 1, 7)
+        """, (user_id,))
+    query_cache.bump_version(user_id)
+
+@instrumentation.instrumented
+def check_rollups(user_id):
+    """Compare a user's rollup rows against the transactions table.
+
+    Returns a list of (key, rollup_value, actual_value) mismatches; an empty
+    list means the rollups are consistent. Amounts are compared to the cent.
+    """
+    connection = connect_db()
+    cursor = connection.cursor()
+    mismatches = []
+
+    cursor.execute("""
+        SELECT total_income, total_expenses, transaction_count FROM user_totals WHERE user_id = ?
+    """, (user_id,))
+    rollup = cursor.fetchone() or (0, 0, 0)
+    cursor.execute("""
+        SELECT TOTAL(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+               TOTAL(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+               COUNT(*)
+        FROM transactions
+        WHERE user_id = ?
+    """, (user_id,))
+    actual = cursor.fetchone()
+    for key, rollup_value, actual_value in zip(('income', 'expenses', 'count'), rollup, actual):
+        if round(rollup_value - actual_value, 2) != 0:
+            mismatches.append((key, rollup_value, actual_value))
+
+    cursor.execute("""
+        SELECT type, category, month, total, transaction_count
+        FROM category_monthly_totals WHERE user_id = ?
+    """, (user_id,))
+    rollup = {row[:3]: row[3:] for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT type, category, substr(date, 1, 7), TOTAL(amount), COUNT(*)
+        FROM transactions
+        WHERE user_id = ?
+        GROUP BY type, category, substr(date, 1, 7)
+    """, (user_id,))
+    actual = {row[:3]: row[3:] for row in cursor.fetchall()}
+    for key in rollup.keys() | actual.keys():
+        rollup_value = rollup.get(key, (0, 0))
+        actual_value = actual.get(key, (0, 0))
+        if round(rollup_value[0] - actual_value[0], 2) != 0 or rollup_value[1] != actual_value[1]:
+            mismatches.append((key, rollup_value, actual_value))
+
+    return mismatches
+
+@instrumentation.instrumented
+def iter_transactions(user_id, start_date=None, end_date=None, category=None, batch_size=1000, with_tags=False):
+    """Yield a user's transactions newest first, in lists of at most batch_size rows.
+
+    start_date and end_date are inclusive 'YYYY-MM-DD' bounds. Rows are pulled from
+    the cursor with fetchmany, so only one batch is held in memory at a time. With
+    with_tags each row ends with its list of tag names, as in get_transactions.
+    """
+    connection = connect_db()
+    cursor = connection.cursor()
 
-    if not transactions:
-        return False  # No transactions to export
+    params = [user_id]
+    query = f"SELECT t.*{', ' + TAGS_COLUMN_SQL if with_tags else ''} FROM transactions t WHERE user_id = ?"
+    if start_date:
+        query += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND date <= ?"
+        params.append(end_date)
+    if category:
+        query += " AND category = ?"
+        params.append(category)
+    query += " ORDER BY date DESC"
 
-    fieldnames = ['ID', 'User ID', 'Price', 'Category', 'Type', 'Date', 'Description']
+    cursor.execute(query, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield _split_tag_lists(rows) if with_tags else rows
+    finally:
+        cursor.close()
 
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(fieldnames)
-        for transaction in transactions:
-            writer.writerow(transaction)
+@instrumentation.instrumented
+def export_transactions_to_csv(user_id, filename, start_date=None, end_date=None, category=None, progress=None):
+    """Export user's transactions to a CSV file; see export_service.export_transactions_to_csv
 
-    return True
+    Returns False without creating the file when there is nothing to export.
+    """
+    from services import export_service  # export_service imports this module
+    return export_service.export_transactions_to_csv(user_id, filename, start_date, end_date, category, progress)
 
-def get_transactions_filtered(user_id, category=None, tags=[]):
-    """Retrieve transactions filtered by category and tags"""
+@instrumentation.instrumented
+def get_transactions_filtered(user_id, category=None, tags=[], with_tags=False):
+    """Retrieve transactions filtered by category and tags (with_tags as in get_transactions)"""
     connection = connect_db()
     cursor = connection.cursor()
 
     params = [user_id]
-    query = """
-        SELECT DISTINCT t.*
+    query = f"""
+        SELECT DISTINCT t.*{", " + TAGS_COLUMN_SQL if with_tags else ""}
         FROM transactions t
     """
 
@@ -375,9 +486,109 @@ def get_transactions_filtered(user_id, category=None, tags=[]):
     cursor.execute(query, params)
     transactions = cursor.fetchall()
 
-    connection.close()
+    if with_tags:
+        return _split_tag_lists(transactions)
     return transactions
 
+def _filter_clauses(params, category=None, tags=None):
+    """SQL conditions on t for the category and tag filters; appends their parameters to params"""
+    clauses = ""
+    if category:
+        clauses += " AND t.category = ?"
+        params.append(category)
+
+    if tags:
+        clauses += """
+            AND EXISTS (SELECT 1 FROM transaction_tags tt JOIN tags tg ON tg.id = tt.tag_id
+                        WHERE tt.transaction_id = t.id AND tg.name IN ({}))
+        """.format(','.join('?' * len(tags)))
+        params.extend(tags)
+    return clauses
+
+# Columns a transaction listing can be sorted by, mapped to their position in a row
+SORT_COLUMNS = {'date': 5, 'price': 2, 'category': 3, 'type': 4}
+_SORT_SQL = {'date': 't.date', 'price': 't.amount', 'category': 't.category', 'type': 't.type'}
+
+@instrumentation.instrumented
+@query_cache.cached
+def get_transactions_page(user_id, after=None, limit=100, sort='date', descending=True,
+                          category=None, tags=None, include_recurring=False):
+    """Retrieve one page of a user's transactions using keyset pagination.
+
+    Rows are ordered by the sort column, then id, and include their tag list as
+    in get_transactions(with_tags=True). after is the (sort value, id) key of the
+    last row of the previous page (see page_key); None starts at the beginning.
+    Each page costs an index range scan of at most limit rows for date order,
+    however deep into the ledger it is.
+
+    With include_recurring, pages in date order also hold the recurring occurrences
+    due by today that are not materialized yet, with minus their rule's id as id.
+    They have no tags, so a tags filter leaves them out.
+    """
+    connection = connect_db()
+    cursor = connection.cursor()
+
+    column = _SORT_SQL[sort]
+    direction = "DESC" if descending else "ASC"
+    params = [user_id]
+    query = f"SELECT t.*, {TAGS_COLUMN_SQL} FROM transactions t WHERE t.user_id = ?"
+    query += _filter_clauses(params, category, tags)
+
+    if after is not None:
+        query += f" AND ({column}, t.id) {'<' if descending else '>'} (?, ?)"
+        params.extend(after)
+
+    query += f" ORDER BY {column} {direction}, t.id {direction} LIMIT ?"
+    params.append(limit)
+
+    cursor.execute(query, params)
+    rows = _split_tag_lists(cursor.fetchall())
+    if include_recurring and sort == 'date' and not tags:
+        pending = recurring.pending_rows(user_id, category=category, descending=descending, after=after)
+        rows = list(itertools.islice(
+            heapq.merge(rows, pending, key=lambda row: (row[5], row[0]), reverse=descending), limit
+        ))
+    return rows
+
+def page_key(row, sort='date'):
+    """The keyset position of a row returned by get_transactions_page"""
+    return row[SORT_COLUMNS[sort]], row[0]
+
+def fts_query(text):
+    """FTS5 query matching descriptions that contain every word of text as a word prefix"""
+    # Quoting each word keeps FTS5 operators and punctuation in user input literal
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in text.split())
+
+@instrumentation.instrumented
+@query_cache.cached
+def search_transactions(user_id, text, category=None, tags=None, limit=100, offset=0):
+    """Full-text search over transaction descriptions, best matches first.
+
+    Every word typed must start a word of the description ("cof sh" finds "Coffee
+    shop"); category and tags narrow the results as in get_transactions_page. Rows
+    include their tag list. Uses the transactions_fts index (schema migration 5).
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+
+    connection = connect_db()
+    cursor = connection.cursor()
+
+    params = [query, user_id]
+    sql = f"""
+        SELECT t.*, {TAGS_COLUMN_SQL}
+        FROM transactions_fts f JOIN transactions t ON t.id = f.rowid
+        WHERE transactions_fts MATCH ? AND t.user_id = ?
+    """
+    sql += _filter_clauses(params, category, tags)
+    sql += " ORDER BY f.rank, t.id LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+
+    cursor.execute(sql, params)
+    return _split_tag_lists(cursor.fetchall())
+
+@instrumentation.instrumented
 def get_tags_for_transaction(transaction_id):
     """Retrieve tags associated with a transaction"""
     connection = connect_db()
@@ -391,21 +602,39 @@ def get_tags_for_transaction(transaction_id):
     """, (transaction_id,))
     tags = [row[0] for row in cursor.fetchall()]
 
-    connection.close()
     return tags
 
-def delete_category(user_id, category_name):
+@instrumentation.instrumented
+def get_tags_for_transactions(transaction_ids):
+    """Retrieve tags for many transactions in one query; returns {transaction_id: [tag names]}.
+
+    The ids are passed as a single JSON array parameter, so any number of them
+    can be looked up without hitting SQLite's bound-parameter limit.
+    """
     connection = connect_db()
     cursor = connection.cursor()
+
+    cursor.execute("""
+        SELECT tt.transaction_id, tg.name
+        FROM transaction_tags tt
+        JOIN tags tg ON tg.id = tt.tag_id
+        WHERE tt.transaction_id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(list(transaction_ids)),))
+
+    tags = {transaction_id: [] for transaction_id in transaction_ids}
+    for transaction_id, name in cursor.fetchall():
+        tags[transaction_id].append(name)
+
+    return tags
+
+@instrumentation.instrumented
+def delete_category(user_id, category_name):
+    connection = connect_db()
     try:
-        cursor.execute("""
-            DELETE FROM categories WHERE user_id = ? AND name = ?
-        """, (user_id, category_name))
-        connection.commit()
+        with connection:
+            remove_category(connection, user_id, category_name)
+        query_cache.bump_version(user_id)
         return True
     except Exception as e:
-        print(f"An error occurred while deleting category: {e}")
+        logger.error("An error occurred while deleting category: %s", e)
         return False
-    finally:
-        connection.close()
-
@@ -0,0 +1,226 @@
+# write_queue.py
+#
+# Group commit for the single-row writes. Callers on any thread put their writes on one
+# queue; a single writer thread takes everything queued, runs it in one transaction
+# (each write in its own savepoint, so a failing write doesn't undo the others) and
+# commits once. While one group is being committed the next one collects, so under
+# load N writes cost one log sync instead of N, and writers never wait on each other
+# for SQLite's write lock.
+#
+# Every submit returns a Future that resolves only after the commit holding its write:
+# with database.SYNCHRONOUS at FULL, .result() returning means the write is on disk.
+#
+#   future = write_queue.add_transaction(user_id, 12.5, 'Food', 'expense', '2024-08-01', 'Lunch')
+#   transaction_id = future.result()
+#
+# The user_model write functions still commit on their own; this is the path for many
+# concurrent writers, such as the HTTP API's.
+
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from models import database
+from models import instrumentation
+from models import query_cache
+from models import user_model
+
+# Most writes committed together; more stay queued for the next commit
+MAX_BATCH = 1000
+# How long the writer waits for more writes after the first of a group. 0 only takes
+# what queued up during the previous commit, which adds no latency to a lone write.
+MAX_DELAY = 0.0
+
+_lock = threading.Lock()
+_default = None
+
+
+class _Write:
+    __slots__ = ('func', 'args', 'user_id', 'future', 'result', 'error')
+
+    def __init__(self, func, args, user_id):
+        self.func = func
+        self.args = args
+        self.user_id = user_id
+        self.future = Future()
+        self.result = None
+        self.error = None
+
+
+@instrumentation.instrumented
+def _group_commit(connection, writes):
+    """Run writes in one transaction, each in a savepoint; raises if the commit itself fails"""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        for write in writes:
+            connection.execute("SAVEPOINT queued_write")
+            try:
+                write.result = write.func(connection, *write.args)
+            except Exception as e:
+                connection.execute("ROLLBACK TO queued_write")
+                write.error = e
+            connection.execute("RELEASE queued_write")
+        connection.commit()
+    except BaseException:
+        if connection.in_transaction:
+            connection.rollback()
+        raise
+
+
+class WriteQueue:
+    """A writer thread that group-commits the writes submitted to it"""
+
+    def __init__(self, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._stats = {"writes": 0, "failed": 0, "commits": 0, "largest_commit": 0}
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, user_id=None):
+        """Queue func(connection, *args); returns a Future of its result, set once committed.
+
+        func runs on the writer thread inside a transaction it must not commit or
+        roll back. user_id's cached reads are invalidated when the write commits.
+        """
+        if self._closed:
+            raise RuntimeError("write queue is closed")
+        write = _Write(func, args, user_id)
+        self._queue.put(write)
+        return write.future
+
+    def _run(self):
+        while True:
+            write = self._queue.get()
+            if write is None:
+                return
+            writes = [write]
+            closing = False
+            deadline = time.monotonic() + self.max_delay
+            while len(writes) < self.max_batch:
+                try:
+                    timeout = deadline - time.monotonic()
+                    write = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if write is None:
+                    closing = True
+                    break
+                writes.append(write)
+            self._commit(writes)
+            if closing:
+                return
+
+    def _commit(self, writes):
+        writes = [write for write in writes if write.future.set_running_or_notify_cancel()]
+        if not writes:
+            return
+        try:
+            _group_commit(database.get_connection(), writes)
+        except Exception as e:
+            # Nothing of the group was committed
+            with self._stats_lock:
+                self._stats["failed"] += len(writes)
+            for write in writes:
+                write.future.set_exception(e)
+            return
+
+        for user_id in {write.user_id for write in writes if write.error is None and write.user_id is not None}:
+            query_cache.bump_version(user_id)
+        failed = sum(write.error is not None for write in writes)
+        with self._stats_lock:
+            self._stats["writes"] += len(writes) - failed
+            self._stats["failed"] += failed
+            self._stats["commits"] += 1
+            self._stats["largest_commit"] = max(self._stats["largest_commit"], len(writes))
+        for write in writes:
+            if write.error is None:
+                write.future.set_result(write.result)
+            else:
+                write.future.set_exception(write.error)
+
+    def stats(self):
+        """Committed and failed writes, commits, and the largest group committed at once"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["writes_per_commit"] = stats["writes"] / stats["commits"] if stats["commits"] else 0.0
+        return stats
+
+    def close(self):
+        """Commit what is queued, then stop the writer thread"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+
+def get_queue():
+    """The shared queue, started on first use and drained at exit"""
+    global _default
+    with _lock:
+        if _default is None:
+            _default = WriteQueue()
+            atexit.register(_default.close)
+        return _default
+
+
+def shutdown():
+    """Drain and stop the shared queue; the next write starts a new one"""
+    global _default
+    with _lock:
+        write_queue, _default = _default, None
+    if write_queue is not None:
+        write_queue.close()
+
+
+# The user_model writes, queued
+
+def _add_transaction(connection, user_id, amount, category, transaction_type, date, description, tags):
+    transaction_id = user_model.insert_transaction(connection, user_id, amount, category, transaction_type, date,
+                                                   description)
+    if tags:
+        user_model.link_tags(connection, transaction_id, tags, user_id)
+    return transaction_id
+
+
+def _add_category(connection, user_id, category_name):
+    try:
+        user_model.insert_category(connection, user_id, category_name)
+    except sqlite3.IntegrityError:
+        return False  # Category already exists for this user
+    return True
+
+
+def _delete_transaction(connection, transaction_id, user_id):
+    return user_model.remove_transaction(connection, transaction_id, user_id) is not None
+
+
+def add_transaction(user_id, amount, category, transaction_type, date, description, tags=None):
+    """Future of the new transaction's id; tags are added in the same write"""
+    return get_queue().submit(_add_transaction, user_id, amount, category, transaction_type, date, description,
+                              tags, user_id=user_id)
+
+
+def add_category(user_id, category_name):
+    """Future of True, or False if the user already has the category"""
+    return get_queue().submit(_add_category, user_id, category_name, user_id=user_id)
+
+
+def delete_category(user_id, category_name):
+    """Future of True, or False if the user has no such category"""
+    return get_queue().submit(user_model.remove_category, user_id, category_name, user_id=user_id)
+
+
+def add_tags_to_transaction(transaction_id, tags, user_id):
+    return get_queue().submit(user_model.link_tags, transaction_id, tags, user_id, user_id=user_id)
+
+
+def delete_transaction(transaction_id, user_id):
+    """Future of True, or False if user_id has no such transaction"""
+    return get_queue().submit(_delete_transaction, transaction_id, user_id, user_id=user_id)
@@ -0,0 +1,803 @@
+# api_service.py
+#
+# Local JSON HTTP API over the same data layer the desktop app uses, for scripts and
+# other front ends on this machine. Built on http.server, so it needs nothing beyond
+# the standard library:
+#
+#   GET    /health
+#   POST   /login                                        {"username", "password"}, returns a bearer token
+#   GET    /metrics                                      request counts and latency per route
+#   GET    /users/{id}/transactions                      one page; ?limit&sort&order&category&tag&cursor&recurring
+#   POST   /users/{id}/transactions                      {"amount", "category", "type", "date", "description", "tags"}
+#   GET    /users/{id}/transactions/stream               every row, chunked; ?format=ndjson|csv&start&end&category
+#   DELETE /users/{id}/transactions/{transaction_id}
+#   GET    /users/{id}/transactions/{transaction_id}/tags
+#   POST   /users/{id}/transactions/{transaction_id}/tags    {"tags": [...]}
+#   GET    /users/{id}/search                            ?q&category&tag&limit&offset
+#   GET    /users/{id}/summary                           ?start&end
+#   GET    /users/{id}/categories    POST {"name"}    DELETE /users/{id}/categories/{name}
+#   GET    /users/{id}/export                            ?format=csv|excel|pdf|arrow|parquet&start&end&category
+#   GET    /users/{id}/recurring    POST {"amount", "category", "type", "start_date", "frequency", "interval",
+#                                         "end_date", "description"}    DELETE /users/{id}/recurring/{rule_id}
+#   POST   /users/{id}/recurring/materialize             {"through": date}, default today
+#
+# Every endpoint but /health and /login needs an "Authorization: Bearer <token>" header
+# with a token from POST /login (checked against user_model.authenticate_user); a
+# token only opens its own user's /users/{id}/... routes. Tokens live in the server's
+# memory and expire after TOKEN_LIFETIME seconds, or when the server stops.
+#
+# Pages are keyset pages (user_model.get_transactions_page): each response carries an
+# opaque next_cursor to pass back as ?cursor=, so a page deep into the ledger costs
+# no more than the first; recurring=true mixes the pending recurring occurrences into
+# date-ordered pages (see models/recurring.py). Streams and exports are sent with
+# chunked transfer encoding one fetch batch at a time, so memory stays flat however
+# many rows there are.
+#
+# Requests run on a fixed pool of worker threads, each keeping its own pooled SQLite
+# connection (see database.get_connection) across requests. Connections beyond the
+# pool plus a short queue are answered 503 straight away rather than piling up.
+# Transaction, tag and category writes go through write_queue, so concurrent requests
+# share group commits; a write is acknowledged once it is committed.
+#
+#   python src/cli.py serve [--port 8765] [--workers 8] [--queue 32]
+
+import base64
+import csv
+import datetime
+import http.server
+import io
+import json
+import logging
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from models import database
+from models import instrumentation
+from models import recurring
+from models import user_model
+from models import write_queue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 8
+# Accepted connections that may wait for a free worker before new ones get a 503
+DEFAULT_QUEUE_SIZE = 32
+# A kept-alive connection holds its worker while idle, so it is dropped after this long
+IDLE_TIMEOUT = 5.0
+# Rejected connections waiting for their 503; beyond this they are closed without one
+REJECT_BACKLOG = 64
+# Seconds a token from POST /login stays valid
+TOKEN_LIFETIME = 12 * 60 * 60
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+FILE_CHUNK_SIZE = 256 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+TRANSACTION_FIELDS = ['id', 'user_id', 'amount', 'category', 'type', 'date', 'description', 'tags']
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pdf': 'application/pdf',
+    'arrow': 'application/vnd.apache.arrow.file',
+    'parquet': 'application/vnd.apache.parquet',
+}
+EXPORT_EXTENSIONS = {'csv': '.csv', 'excel': '.xlsx', 'pdf': '.pdf', 'arrow': '.arrow', 'parquet': '.parquet'}
+
+
+class ApiError(Exception):
+    """Ends a request with an error status and {"error": message} as the body"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Stream:
+    """A response body sent chunk by chunk as chunks (an iterable of bytes) produces it"""
+
+    def __init__(self, content_type, chunks, headers=None):
+        self.content_type = content_type
+        self.chunks = chunks
+        self.headers = headers or {}
+
+
+class RouteStats:
+    def __init__(self):
+        self.statuses = {}
+        self.latency = instrumentation.Histogram()
+
+    def as_dict(self):
+        latency = self.latency
+        return {
+            "requests": latency.count,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "mean_seconds": latency.total / latency.count if latency.count else 0.0,
+            "p50_seconds": latency.percentile(50),
+            "p90_seconds": latency.percentile(90),
+            "p99_seconds": latency.percentile(99),
+            "max_seconds": latency.max,
+        }
+
+
+class Metrics:
+    """Request counts, statuses and latency per route, plus the pool's load"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}  # route label -> RouteStats
+        self.in_flight = 0
+        self.rejected = 0
+        self.started = time.time()
+
+    def record(self, label, status, seconds):
+        with self._lock:
+            stats = self.routes.get(label)
+            if stats is None:
+                stats = self.routes[label] = RouteStats()
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.latency.add(seconds)
+
+    def adjust_in_flight(self, change):
+        with self._lock:
+            self.in_flight += change
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "routes": {label: stats.as_dict() for label, stats in sorted(self.routes.items())},
+            }
+
+
+class Sessions:
+    """Bearer tokens handed out by POST /login, each good for one user until it expires"""
+
+    def __init__(self, lifetime=TOKEN_LIFETIME):
+        self.lifetime = lifetime
+        self._lock = threading.Lock()
+        self._tokens = {}  # token -> (user_id, time.monotonic() it expires at)
+
+    def issue(self, user_id):
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            # Expired tokens are dropped as new ones are issued
+            self._tokens = {key: entry for key, entry in self._tokens.items() if entry[1] > now}
+            self._tokens[token] = (user_id, now + self.lifetime)
+        return token
+
+    def user_for(self, token):
+        """The user a token was issued for, or None if it is unknown or expired"""
+        with self._lock:
+            entry = self._tokens.get(token)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+
+# Request parameters
+
+def _one(query, name, default=None):
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+def _int(query, name, default, minimum=0, maximum=None):
+    value = _one(query, name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer") from None
+    if number < minimum or maximum is not None and number > maximum:
+        raise ApiError(400, f"{name} must be between {minimum} and {maximum}" if maximum is not None
+                       else f"{name} must be at least {minimum}")
+    return number
+
+
+def _date(query, name):
+    from services import date_service
+
+    value = _one(query, name)
+    if not value:
+        return None
+    try:
+        return date_service.normalize_date(value)
+    except ValueError as e:
+        raise ApiError(400, f"{name}: {e}") from None
+
+
+def _tags(query):
+    return query.get('tag') or None
+
+
+def _flag(query, name):
+    value = _one(query, name, 'false').lower()
+    if value not in ('true', 'false', '1', '0'):
+        raise ApiError(400, f"{name} must be true or false")
+    return value in ('true', '1')
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort='date'):
+    """The (value, transaction_id) keyset position in cursor; value must fit the sort column"""
+    try:
+        value, transaction_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(transaction_id, int) or isinstance(transaction_id, bool):
+            raise ValueError(cursor)
+        if sort == 'price':
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError(cursor)
+        elif not isinstance(value, str):
+            raise ValueError(cursor)
+        elif sort == 'date':
+            datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):  # ValueError includes binascii.Error and json.JSONDecodeError
+        raise ApiError(400, "invalid cursor") from None
+    return value, transaction_id
+
+
+def _transaction(row):
+    return dict(zip(TRANSACTION_FIELDS, row))
+
+
+def _require_user(user_id):
+    if database.get_connection().execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone() is None:
+        raise ApiError(404, f"no user {user_id}")
+
+
+def _require_transaction(user_id, transaction_id):
+    row = database.get_connection().execute(
+        "SELECT user_id FROM transactions WHERE id = ?", (transaction_id,)).fetchone()
+    if row is None or row[0] != user_id:
+        raise ApiError(404, f"no transaction {transaction_id} for user {user_id}")
+
+
+def _tag_list(value):
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(tag, str) and tag.strip() for tag in value):
+        raise ApiError(400, "tags must be a list of non-empty strings")
+    return [tag.strip() for tag in value]
+
+
+# Endpoints: each takes the request handler and the path's parameters and returns
+# (status, JSON-serializable body) or a Stream
+
+def health(request):
+    return 200, {"status": "ok", "database": database.get_database()}
+
+
+def login(request):
+    body = request.read_json()
+    username, password = body.get('username'), body.get('password')
+    if not isinstance(username, str) or not isinstance(password, str):
+        raise ApiError(400, "username and password must be strings")
+    user_id = user_model.authenticate_user(username, password)
+    if user_id is None:
+        raise ApiError(401, "invalid username or password")
+    sessions = request.server.sessions
+    return 200, {"user_id": user_id, "token": sessions.issue(user_id), "expires_in": sessions.lifetime}
+
+
+def metrics(request):
+    body = request.server.metrics.as_dict()
+    body["workers"] = request.server.workers
+    body["queue_size"] = request.server.queue_size
+    body["write_queue"] = write_queue.get_queue().stats()
+    body["data_layer"] = instrumentation.get_stats()["functions"]
+    return 200, body
+
+
+def list_transactions(request, user_id):
+    query = request.query
+    sort = _one(query, 'sort', 'date')
+    if sort not in user_model.SORT_COLUMNS:
+        raise ApiError(400, f"sort must be one of {', '.join(user_model.SORT_COLUMNS)}")
+    order = _one(query, 'order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ApiError(400, "order must be asc or desc")
+    limit = _int(query, 'limit', DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    cursor = _one(query, 'cursor')
+    after = decode_cursor(cursor, sort) if cursor else None
+
+    _require_user(user_id)
+    rows = user_model.get_transactions_page(user_id, after, limit, sort, order == 'desc',
+                                            _one(query, 'category'), _tags(query), _flag(query, 'recurring'))
+    next_cursor = encode_cursor(user_model.page_key(rows[-1], sort)) if len(rows) == limit else None
+    return 200, {"transactions": [_transaction(row) for row in rows], "next_cursor": next_cursor}
+
+
+def create_transaction(request, user_id):
+    from services import import_service
+
+    body = request.read_json()
+    try:
+        amount, category, transaction_type, date, description = import_service.normalize_row(
+            body.get('amount'), body.get('category'), body.get('type'), body.get('date'),
+            body.get('description', ''))
+    except ValueError as e:
+        raise ApiError(400, str(e)) from None
+    tags = _tag_list(body.get('tags'))
+
+    _require_user(user_id)
+    transaction_id = write_queue.add_transaction(user_id, amount, category, transaction_type, date, description,
+                                                 tags).result()
+    return 201, _transaction((transaction_id, user_id, amount, category, transaction_type, date, description,
+                              list(dict.fromkeys(tags))))
+
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        yield ''.join(json.dumps(_transaction(row)) + '\n' for row in batch).encode()
+
+
+def _csv_chunks(batches, with_tags):
+    from services import export_service
+
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(export_service.EXPORT_COLUMNS + (['Tags'] if with_tags else []))
+    for batch in batches:
+        if with_tags:
+            batch = [(*row[:-1], ';'.join(row[-1])) for row in batch]
+        writer.writerows(batch)
+        yield text.getvalue().encode()
+        text.seek(0)
+        text.truncate()
+    if text.tell():  # Header only: nothing matched
+        yield text.getvalue().encode()
+
+
+def stream_transactions(request, user_id):
+    query = request.query
+    stream_format = _one(query, 'format', 'ndjson')
+    if stream_format not in ('ndjson', 'csv'):
+        raise ApiError(400, "format must be ndjson or csv")
+    start_date, end_date = _date(query, 'start'), _date(query, 'end')
+
+    _require_user(user_id)
+    batches = user_model.iter_transactions(user_id, start_date, end_date, _one(query, 'category'),
+                                           STREAM_BATCH_SIZE, with_tags=True)
+    if stream_format == 'csv':
+        return Stream(EXPORT_CONTENT_TYPES['csv'], _csv_chunks(batches, with_tags=True))
+    return Stream('application/x-ndjson', _ndjson_chunks(batches))
+
+
+def delete_transaction(request, user_id, transaction_id):
+    if not write_queue.delete_transaction(transaction_id, user_id).result():
+        raise ApiError(404, f"no transaction {transaction_id} for user {user_id}")
+    return 200, {"deleted": transaction_id}
+
+
+def transaction_tags(request, user_id, transaction_id):
+    _require_transaction(user_id, transaction_id)
+    return 200, {"tags": user_model.get_tags_for_transaction(transaction_id)}
+
+
+def add_transaction_tags(request, user_id, transaction_id):
+    tags = _tag_list(request.read_json().get('tags'))
+    _require_transaction(user_id, transaction_id)
+    if tags:
+        write_queue.add_tags_to_transaction(transaction_id, tags, user_id).result()
+    return 200, {"tags": user_model.get_tags_for_transaction(transaction_id)}
+
+
+def search(request, user_id):
+    query = request.query
+    text = _one(query, 'q', '')
+    limit = _int(query, 'limit', DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    offset = _int(query, 'offset', 0)
+
+    _require_user(user_id)
+    rows = user_model.search_transactions(user_id, text, _one(query, 'category'), _tags(query), limit, offset)
+    return 200, {"transactions": [_transaction(row) for row in rows],
+                 "next_offset": offset + limit if len(rows) == limit else None}
+
+
+def summary(request, user_id):
+    start_date, end_date = _date(request.query, 'start'), _date(request.query, 'end')
+
+    _require_user(user_id)
+    income, expenses = user_model.get_financial_summary(user_id, start_date, end_date)
+    return 200, {
+        "start": start_date,
+        "end": end_date,
+        "income": income,
+        "expenses": expenses,
+        "net": round(income - expenses, 2),
+        "expenses_by_category": user_model.get_expenses_by_category(user_id, start_date, end_date),
+    }
+
+
+def list_categories(request, user_id):
+    _require_user(user_id)
+    return 200, {"categories": user_model.get_categories(user_id)}
+
+
+def create_category(request, user_id):
+    name = request.read_json().get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise ApiError(400, "name must be a non-empty string")
+
+    _require_user(user_id)
+    if not write_queue.add_category(user_id, name.strip()).result():
+        raise ApiError(409, f"category {name.strip()!r} already exists")
+    return 201, {"name": name.strip()}
+
+
+def remove_category(request, user_id, name):
+    _require_user(user_id)
+    if not write_queue.delete_category(user_id, name).result():
+        raise ApiError(404, f"no category {name!r}")
+    return 200, {"deleted": name}
+
+
+def list_rules(request, user_id):
+    _require_user(user_id)
+    return 200, {"rules": [rule._asdict() for rule in recurring.get_rules(user_id)]}
+
+
+def create_rule(request, user_id):
+    body = request.read_json()
+    _require_user(user_id)
+    try:
+        rule_id = recurring.add_rule(user_id, body.get('amount'), body.get('category'), body.get('type'),
+                                     body.get('start_date'), body.get('frequency', 'monthly'),
+                                     body.get('interval', 1), body.get('end_date'), body.get('description', ''))
+    except (TypeError, ValueError) as e:
+        raise ApiError(400, str(e)) from None
+    rule = next(rule for rule in recurring.get_rules(user_id) if rule.id == rule_id)
+    return 201, rule._asdict()
+
+
+def remove_rule(request, user_id, rule_id):
+    if not recurring.delete_rule(user_id, rule_id):
+        raise ApiError(404, f"no recurring rule {rule_id} for user {user_id}")
+    return 200, {"deleted": rule_id}
+
+
+def materialize_rules(request, user_id):
+    through = request.read_json().get('through')
+    _require_user(user_id)
+    try:
+        written = recurring.materialize(user_id, through)
+    except (TypeError, ValueError) as e:
+        raise ApiError(400, f"through: {e}") from None
+    return 200, {"materialized": written}
+
+
+def _file_chunks(path):
+    try:
+        with open(path, 'rb') as exported:
+            while True:
+                chunk = exported.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def export(request, user_id):
+    query = request.query
+    export_format = _one(query, 'format', 'csv')
+    if export_format not in EXPORT_CONTENT_TYPES:
+        raise ApiError(400, f"format must be one of {', '.join(EXPORT_CONTENT_TYPES)}")
+    start_date, end_date = _date(query, 'start'), _date(query, 'end')
+    category = _one(query, 'category')
+    filename = f"transactions{EXPORT_EXTENSIONS[export_format]}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+
+    _require_user(user_id)
+    if export_format == 'csv':
+        # Same columns as the file export, without the temporary file
+        batches = user_model.iter_transactions(user_id, start_date, end_date, category, STREAM_BATCH_SIZE)
+        return Stream(EXPORT_CONTENT_TYPES['csv'], _csv_chunks(batches, with_tags=False), headers)
+
+    # The other formats are written by their file exporters, then sent from the file
+    from services import export_service
+
+    descriptor, path = tempfile.mkstemp(suffix=EXPORT_EXTENSIONS[export_format], prefix='api-export-')
+    os.close(descriptor)
+    try:
+        exported = getattr(export_service, f"export_transactions_to_{export_format}")(
+            user_id, path, start_date, end_date, category)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    if not exported:
+        os.remove(path)
+        return 204, None
+    headers['Content-Length'] = str(os.path.getsize(path))
+    return Stream(EXPORT_CONTENT_TYPES[export_format], _file_chunks(path), headers)
+
+
+# (method, path template, endpoint); {...} segments ending in _id are integers
+ROUTES = [
+    ('GET', '/health', health),
+    ('POST', '/login', login),
+    ('GET', '/metrics', metrics),
+    ('GET', '/users/{user_id}/transactions', list_transactions),
+    ('POST', '/users/{user_id}/transactions', create_transaction),
+    ('GET', '/users/{user_id}/transactions/stream', stream_transactions),
+    ('DELETE', '/users/{user_id}/transactions/{transaction_id}', delete_transaction),
+    ('GET', '/users/{user_id}/transactions/{transaction_id}/tags', transaction_tags),
+    ('POST', '/users/{user_id}/transactions/{transaction_id}/tags', add_transaction_tags),
+    ('GET', '/users/{user_id}/search', search),
+    ('GET', '/users/{user_id}/summary', summary),
+    ('GET', '/users/{user_id}/categories', list_categories),
+    ('POST', '/users/{user_id}/categories', create_category),
+    ('DELETE', '/users/{user_id}/categories/{name}', remove_category),
+    ('GET', '/users/{user_id}/export', export),
+    ('GET', '/users/{user_id}/recurring', list_rules),
+    ('POST', '/users/{user_id}/recurring', create_rule),
+    ('DELETE', '/users/{user_id}/recurring/{rule_id}', remove_rule),
+    ('POST', '/users/{user_id}/recurring/materialize', materialize_rules),
+]
+
+
+def _compile(template):
+    def segment(match):
+        name = match.group(1)
+        return f"(?P<{name}>\\d+)" if name.endswith('_id') else f"(?P<{name}>[^/]+)"
+    return re.compile(re.sub(r"\\\{(\w+)\\\}", segment, re.escape(template)) + '$')
+
+
+_ROUTES = [(method, _compile(template), template, endpoint) for method, template, endpoint in ROUTES]
+
+# Endpoints that answer without a token
+PUBLIC_ENDPOINTS = {health, login}
+
+
+def resolve(method, path):
+    """(endpoint, path parameters, route label) for a request, or raise ApiError 404/405"""
+    allowed = []
+    for route_method, pattern, template, endpoint in _ROUTES:
+        match = pattern.match(path)
+        if match is None:
+            continue
+        if route_method != method:
+            allowed.append(route_method)
+            continue
+        params = {name: int(value) if name.endswith('_id') else unquote(value)
+                  for name, value in match.groupdict().items()}
+        return endpoint, params, f"{method} {template}"
+    if allowed:
+        raise ApiError(405, f"{method} is not allowed here", {'Allow': ', '.join(allowed)})
+    raise ApiError(404, f"no such endpoint {path}")
+
+
+class ApiRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FinanceTrackerAPI/1.0'
+
+    def setup(self):
+        self.timeout = self.server.idle_timeout
+        super().setup()
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def read_json(self):
+        """The request body as a JSON object"""
+        length = self.headers.get('Content-Length')
+        if length is None:
+            raise ApiError(411, "a JSON body with a Content-Length is required")
+        try:
+            length = int(length)
+        except ValueError:
+            raise ApiError(400, "invalid Content-Length") from None
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True  # The body is left unread
+            raise ApiError(413, f"request bodies are limited to {MAX_BODY_BYTES} bytes")
+        self._body_read = True
+        try:
+            body = json.loads(self.rfile.read(length))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise ApiError(400, "the request body is not valid JSON") from None
+        if not isinstance(body, dict):
+            raise ApiError(400, "the request body must be a JSON object")
+        return body
+
+    def _dispatch(self, method):
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        self.query = parse_qs(url.query)
+        self._body_read = False
+        label = 'unmatched'
+        try:
+            endpoint, params, label = resolve(method, url.path.rstrip('/') or '/')
+            if endpoint not in PUBLIC_ENDPOINTS:
+                self._authorize(params.get('user_id'))
+            result = endpoint(self, **params)
+        except ApiError as e:
+            result = e
+        except Exception:
+            logger.exception("%s %s failed", method, self.path)
+            result = ApiError(500, "internal error")
+
+        if not self._body_read and int(self.headers.get('Content-Length') or 0):
+            self.close_connection = True  # An unread body would be taken for the next request
+
+        if isinstance(result, ApiError):
+            status = self._send_json(result.status, {"error": str(result)}, result.headers)
+        elif isinstance(result, Stream):
+            status = self._send_stream(result)
+        else:
+            status = self._send_json(*result)
+        self.server.metrics.record(label, status, time.perf_counter() - started)
+
+    def _authorize(self, user_id):
+        """Check the bearer token: 401 without a valid one, 403 if it is for another user than user_id"""
+        scheme, _, token = (self.headers.get('Authorization') or '').partition(' ')
+        token_user = self.server.sessions.user_for(token.strip()) if scheme.lower() == 'bearer' else None
+        if token_user is None:
+            raise ApiError(401, "a valid bearer token is required; POST /login for one",
+                           {'WWW-Authenticate': 'Bearer'})
+        if user_id is not None and user_id != token_user:
+            raise ApiError(403, f"this token is not for user {user_id}")
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        return status
+
+    def _send_stream(self, stream):
+        chunks = iter(stream.chunks)
+        try:
+            # Errors before the first chunk (a bad query, say) can still become a 500
+            first = next(chunks, b'')
+        except Exception:
+            logger.exception("GET %s failed", self.path)
+            return self._send_json(500, {"error": "internal error"})
+
+        self.send_response(200)
+        self.send_header('Content-Type', stream.content_type)
+        for name, value in stream.headers.items():
+            self.send_header(name, value)
+        chunked = 'Content-Length' not in stream.headers
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            chunk = first
+            while True:
+                if chunk:
+                    self.wfile.write(b"%X\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        except Exception:
+            # Too late for an error status: drop the connection so the client sees a truncated body
+            logger.exception("GET %s failed while streaming", self.path)
+            self.close_connection = True
+            return 500
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        return 200
+
+
+class ApiServer(http.server.HTTPServer):
+    """HTTP server handing each connection to a fixed pool of worker threads.
+
+    At most workers + queue_size connections are accepted at a time; beyond that a
+    connection is answered 503 with Retry-After and closed. That happens on a thread
+    of its own, so a slow client can't hold up the accept loop.
+    """
+
+    def __init__(self, address, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 idle_timeout=IDLE_TIMEOUT):
+        super().__init__(address, ApiRequestHandler)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.idle_timeout = idle_timeout
+        self.metrics = Metrics()
+        self.sessions = Sessions()
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        self._reject_slots = threading.BoundedSemaphore(REJECT_BACKLOG)
+        self._rejecter = ThreadPoolExecutor(max_workers=1, thread_name_prefix='api-reject')
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self.metrics.reject()
+            if self._reject_slots.acquire(blocking=False):
+                self._rejecter.submit(self._reject, request)
+            else:
+                self.shutdown_request(request)  # Flooded: not even a 503
+            return
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        self.metrics.adjust_in_flight(1)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+            self.metrics.adjust_in_flight(-1)
+
+    def _reject(self, request):
+        body = json.dumps({"error": "server busy"}).encode()
+        try:
+            # Take in the request first: closing with it unread would reset the connection
+            request.settimeout(0.05)
+            request.recv(64 * 1024)
+        except OSError:
+            pass
+        try:
+            request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                            b"Content-Length: %d\r\nRetry-After: 1\r\nConnection: close\r\n\r\n%s"
+                            % (len(body), body))
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+            self._reject_slots.release()
+
+    def handle_error(self, request, client_address):
+        logger.exception("Error handling a request from %s", client_address[0])
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+        self._rejecter.shutdown(wait=True)
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                  database_path=None, idle_timeout=IDLE_TIMEOUT):
+    """An ApiServer bound to (host, port), not yet serving; port 0 picks a free port.
+
+    Call serve_forever() on it (from any thread), then shutdown() and server_close().
+    database_path switches the data layer to that database first.
+    """
+    if database_path is not None:
+        database.set_database(database_path)
+    user_model.initialize_database()
+    return ApiServer((host, port), workers, queue_size, idle_timeout)
+
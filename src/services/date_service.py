@@ -0,0 +1,90 @@
+# date_service.py
+#
+# Date normalization for everything that accepts a date from the user or a file.
+# Numeric dates (YYYY-MM-DD, YYYY/MM/DD, DD.MM.YYYY, MM/DD/YYYY) are parsed by hand,
+# which is far cheaper than strptime or dateparser, and memoized in a bounded LRU.
+# dateparser is imported and called only for text that isn't a numeric date, such
+# as "yesterday" or "3 days ago", and only when natural language is allowed.
+
+import datetime
+import re
+from functools import lru_cache
+
+# Distinct date strings remembered; a decade of daily dates in each layout fits
+CACHE_SIZE = 16384
+
+# Loose numeric layouts (single-digit day/month allowed): (pattern, group order y/m/d)
+NUMERIC_PATTERNS = (
+    (re.compile(r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})'), (1, 2, 3)),
+    (re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})'), (3, 2, 1)),
+    (re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})'), (3, 1, 2)),
+)
+
+
+def _iso(year, month, day):
+    """'YYYY-MM-DD', or None when that day doesn't exist"""
+    try:
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_numeric(value):
+    """Normalize a numeric date; returns None for an impossible date, False if value isn't numeric"""
+    if len(value) == 10:
+        # Zero-padded layouts, recognised by their separator positions
+        separators = value[2] + value[4] + value[5] + value[7]
+        try:
+            if separators[1] == '-' and separators[3] == '-' or separators[1] == '/' and separators[3] == '/':
+                return _iso(int(value[:4]), int(value[5:7]), int(value[8:]))
+            if separators[0] == '.' and separators[2] == '.':
+                return _iso(int(value[6:]), int(value[3:5]), int(value[:2]))
+            if separators[0] == '/' and separators[2] == '/':
+                return _iso(int(value[6:]), int(value[:2]), int(value[3:5]))
+        except ValueError:
+            pass  # Not all digits; try the patterns
+    for pattern, order in NUMERIC_PATTERNS:
+        match = pattern.fullmatch(value)
+        if match:
+            year, month, day = (int(match.group(group)) for group in order)
+            return _iso(year, month, day)
+    return False
+
+
+@lru_cache(maxsize=256)
+def _parse_natural_language(value, today):
+    """dateparser's reading of value relative to today, or None"""
+    # Imported on first use: dateparser takes a long time to load
+    import dateparser
+
+    parsed = dateparser.parse(value, settings={
+        'RELATIVE_BASE': datetime.datetime.combine(datetime.date.fromisoformat(today), datetime.time()),
+    })
+    return parsed.strftime('%Y-%m-%d') if parsed else None
+
+
+def normalize_date(value, natural_language=False):
+    """Return a date as 'YYYY-MM-DD'; raises ValueError if it isn't recognised.
+
+    Accepts date/datetime objects and numeric strings. With natural_language=True
+    any other text is handed to dateparser ("yesterday", "March 3rd").
+    """
+    if hasattr(value, 'strftime'):  # datetime, date or pandas Timestamp
+        return value.strftime('%Y-%m-%d')
+    if value.__class__ is not str:
+        value = '' if value is None else str(value)
+    value = value.strip()
+
+    normalized = _parse_numeric(value)
+    if normalized is False and natural_language and value:
+        # Relative dates change meaning at midnight, so today is part of the memo key
+        normalized = _parse_natural_language(value, datetime.date.today().isoformat())
+    if not normalized:
+        raise ValueError(f"invalid date {value!r}")
+    return normalized
+
+
+def cache_info():
+    """functools cache statistics of the numeric fast path"""
+    return _parse_numeric.cache_info()
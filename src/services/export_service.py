@@ -0,0 +1,592 @@
+# export_service.py
+#
+# File exports rendered outside the UI process: every function here is a plain
+# module-level function taking picklable arguments, so it can run in the job
+# service's process pool. Exports read the ledger through user_model.iter_transactions,
+# one fetchmany batch at a time, so memory stays flat however many rows there are.
+# Arrow and Parquet snapshots (see snapshot_service) are written the same way, one
+# record batch per fetch.
+#
+# export_transactions() serves several formats from one query: rows are read once,
+# CSV is written during that pass and the spooled rows are rendered to Excel and
+# PDF concurrently in a process pool. Files appear only once every format succeeded.
+
+import csv
+import itertools
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+
+from models import database
+from models import user_model
+from services import snapshot_service
+
+EXPORT_COLUMNS = ['ID', 'User ID', 'Price', 'Category', 'Type', 'Date', 'Description']
+
+# Excel's hard limit, header row included
+EXCEL_MAX_ROWS = 1048576
+
+
+def _use_database(database_path):
+    # Process-pool workers start with the default database; follow the caller's
+    if database_path and database_path != database.get_database():
+        database.set_database(database_path)
+
+
+class CsvWriter:
+    """Writes transaction rows into a CSV file under an EXPORT_COLUMNS header"""
+
+    def __init__(self, filename):
+        self.file = open(filename, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+
+
+class ExcelWriter:
+    """Writes transaction rows into an .xlsx file as they arrive.
+
+    XlsxWriter's constant_memory mode flushes each row to disk once the next one
+    starts, so only the current row is held in memory. Past max_rows rows (header
+    included) the rows continue on a new sheet, or ValueError is raised when
+    split_sheets is False.
+    """
+
+    def __init__(self, filename, split_sheets=True, max_rows=EXCEL_MAX_ROWS, sheet_name='Transactions'):
+        import xlsxwriter
+
+        self.workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+        self.header_format = self.workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        # Create a format for text wrapping
+        self.wrap_format = self.workbook.add_format({'text_wrap': True})
+        self.split_sheets = split_sheets
+        self.max_rows = max_rows
+        self.sheet_name = sheet_name
+        self.worksheet = None
+        self.sheet_count = 0
+        self.row = 0
+
+    def _add_sheet(self):
+        self.sheet_count += 1
+        name = self.sheet_name if self.sheet_count == 1 else f"{self.sheet_name} {self.sheet_count}"
+        self.worksheet = self.workbook.add_worksheet(name)
+
+        # Set the column width and format; wrap the Description column
+        self.worksheet.set_column('A:F', 20)
+        self.worksheet.set_column('G:G', 30, self.wrap_format)
+
+        self.worksheet.write_row(0, 0, EXPORT_COLUMNS, self.header_format)
+        self.row = 1
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self.worksheet is None or self.row >= self.max_rows:
+                if self.worksheet is not None and not self.split_sheets:
+                    raise ValueError(f"more than {self.max_rows - 1} rows do not fit on one Excel sheet")
+                self._add_sheet()
+            self.worksheet.write_row(self.row, 0, row)
+            self.row += 1
+
+    def close(self):
+        if self.worksheet is None:
+            self._add_sheet()  # An empty export still gets its header
+        self.workbook.close()
+
+    def abort(self):
+        """Give up on the workbook, releasing its temporary files"""
+        self.workbook.close()
+
+
+def _export(writer_class, user_id, filename, start_date, end_date, category, progress, database_path,
+            batch_size=1000, with_tags=False, **options):
+    """Stream a user's transactions into writer_class(filename, **options)"""
+    _use_database(database_path)
+    batches = user_model.iter_transactions(user_id, start_date, end_date, category, batch_size, with_tags)
+    first_batch = next(batches, None)
+
+    if not first_batch:
+        return False  # No transactions to export
+
+    rows_written = 0
+    writer = writer_class(filename, **options)
+    try:
+        for batch in itertools.chain([first_batch], batches):
+            writer.write_rows(batch)
+            rows_written += len(batch)
+            if progress:
+                progress(rows_written)
+        writer.close()
+    except BaseException:
+        batches.close()
+        try:
+            writer.abort()  # Release the writer's temporary files before deleting the output
+        except Exception:
+            pass
+        if os.path.exists(filename):
+            os.remove(filename)  # Don't leave a truncated file behind
+        raise
+    return True
+
+
+def export_transactions_to_csv(user_id, filename, start_date=None, end_date=None, category=None,
+                               progress=None, database_path=None):
+    """Export user's transactions to a CSV file, the layout import_service reads back.
+
+    Rows are streamed from the database straight into the file in a single pass.
+    progress, if given, is called with the number of rows written after each batch;
+    database_path points a worker process at the caller's database. Returns False
+    without creating the file when there is nothing to export, and deletes the
+    partial file when the export fails or is cancelled.
+    """
+    return _export(CsvWriter, user_id, filename, start_date, end_date, category, progress, database_path)
+
+
+def export_transactions_to_excel(user_id, filename, start_date=None, end_date=None, category=None,
+                                 progress=None, database_path=None, split_sheets=True):
+    """Export user's transactions to an Excel file with text wrapping in the Description column.
+
+    Arguments and return value as in export_transactions_to_csv.
+    """
+    return _export(ExcelWriter, user_id, filename, start_date, end_date, category, progress, database_path,
+                   split_sheets=split_sheets)
+
+
+def export_transactions_to_arrow(user_id, filename, start_date=None, end_date=None, category=None,
+                                 progress=None, database_path=None, compression=None):
+    """Export user's transactions, with their tags, as an Arrow IPC snapshot (see snapshot_service).
+
+    Arguments and return value as in export_transactions_to_excel. Rows are
+    fetched and written ROW_GROUP_SIZE at a time. Leave compression off for a
+    file that open_snapshot() can map without copying.
+    """
+    return _export(snapshot_service.SnapshotWriter, user_id, filename, start_date, end_date, category, progress,
+                   database_path, batch_size=snapshot_service.ROW_GROUP_SIZE, with_tags=True,
+                   file_format='arrow', compression=compression)
+
+
+def export_transactions_to_parquet(user_id, filename, start_date=None, end_date=None, category=None,
+                                   progress=None, database_path=None, compression='snappy'):
+    """Export user's transactions, with their tags, as a Parquet snapshot of ROW_GROUP_SIZE row groups"""
+    return _export(snapshot_service.SnapshotWriter, user_id, filename, start_date, end_date, category, progress,
+                   database_path, batch_size=snapshot_service.ROW_GROUP_SIZE, with_tags=True,
+                   file_format='parquet', compression=compression)
+
+
+class _LazyFlowables(list):
+    """Flowable list for platypus that is refilled from a generator as it is consumed.
+
+    doc.build() only ever looks at the front of its list and deletes flowables as
+    they are placed, so the report never holds more than a couple of tables.
+    """
+
+    def __init__(self, source, lookahead=2):
+        super().__init__()
+        self.source = source
+        self.lookahead = lookahead
+
+    def _fill(self):
+        while self.source is not None and list.__len__(self) < self.lookahead:
+            try:
+                self.append(next(self.source))
+            except StopIteration:
+                self.source = None
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+
+class PdfReportWriter:
+    """Multi-page transactions report: summary, category totals, then every row.
+
+    Rows are spooled to a temporary file as they arrive while the totals are
+    accumulated, so the summary can open the report without a second query. On
+    close() the ledger is laid out in tables of ROWS_PER_TABLE rows that platypus
+    splits across pages; a page template draws the column header at the top of
+    every ledger page. Only a couple of tables exist at a time; what still grows
+    with the row count is reportlab's buffer of finished page streams, which it
+    holds until the file is saved.
+    """
+
+    ROWS_PER_TABLE = 50
+    COLUMNS = ['ID', 'Price', 'Category', 'Type', 'Date', 'Description']
+    COLUMN_WIDTHS = [50, 60, 80, 60, 80, 200]
+    FONT, FONT_SIZE = 'Helvetica', 9
+    MARGIN = 40
+    HEADER_HEIGHT = 18
+
+    def __init__(self, filename, title="Transactions Report", subtitle=None, render_progress=None):
+        self.filename = os.fspath(filename)  # reportlab only takes str paths
+        self.title = title
+        self.subtitle = subtitle
+        self.render_progress = render_progress
+        self.spool = tempfile.TemporaryFile('w+', newline='', encoding='utf-8')
+        self.spool_writer = csv.writer(self.spool)
+        self.totals = {'income': 0.0, 'expense': 0.0}
+        self.category_totals = {}  # (type, category) -> [total, count]
+        self.row_count = 0
+
+    def write_rows(self, rows):
+        self.spool_writer.writerows(rows)
+        for row in rows:
+            amount, category, transaction_type = row[2], row[3], row[4]
+            self.totals[transaction_type] = self.totals.get(transaction_type, 0.0) + amount
+            category_total = self.category_totals.get((transaction_type, category))
+            if category_total is None:
+                self.category_totals[(transaction_type, category)] = [amount, 1]
+            else:
+                category_total[0] += amount
+                category_total[1] += 1
+        self.row_count += len(rows)
+
+    def close(self):
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import BaseDocTemplate, Frame, NextPageTemplate, PageBreak, PageTemplate
+
+        width, height = letter
+        frame_width = width - 2 * self.MARGIN
+        doc = BaseDocTemplate(self.filename, pagesize=letter, title=self.title,
+                              leftMargin=self.MARGIN, rightMargin=self.MARGIN,
+                              topMargin=self.MARGIN, bottomMargin=self.MARGIN, pageCompression=1)
+        ledger_frame_height = height - 2 * self.MARGIN - self.HEADER_HEIGHT
+        doc.addPageTemplates([
+            PageTemplate('summary', [Frame(self.MARGIN, self.MARGIN, frame_width, height - 2 * self.MARGIN)],
+                         onPage=self._draw_footer),
+            PageTemplate('ledger', [Frame(self.MARGIN, self.MARGIN, frame_width, ledger_frame_height,
+                                          leftPadding=0, rightPadding=0, topPadding=0)],
+                         onPage=self._draw_ledger_page),
+        ])
+
+        def flowables():
+            yield from self._summary_flowables()
+            if self.row_count:
+                yield NextPageTemplate('ledger')
+                yield PageBreak()
+                yield from self._ledger_tables()
+
+        try:
+            self.spool.seek(0)
+            doc.build(_LazyFlowables(flowables()))
+        finally:
+            self.spool.close()
+
+    def _summary_flowables(self):
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+        styles = getSampleStyleSheet()
+        yield Paragraph(self.title, styles['Title'])
+        if self.subtitle:
+            yield Paragraph(self.subtitle, styles['Normal'])
+        yield Spacer(0, 12)
+
+        income, expenses = self.totals.get('income', 0.0), self.totals.get('expense', 0.0)
+        summary = Table([
+            ['Transactions', f"{self.row_count:,}"],
+            ['Total Income', f"${income:,.2f}"],
+            ['Total Expenses', f"${expenses:,.2f}"],
+            ['Net Profit/Loss', f"${income - expenses:,.2f}"],
+        ], colWidths=[150, 120], hAlign='LEFT')
+        summary.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('LINEBELOW', (0, -2), (-1, -2), 0.5, colors.black),
+        ]))
+        yield summary
+        yield Spacer(0, 18)
+
+        if self.category_totals:
+            yield Paragraph("Totals by Category", styles['Heading2'])
+            rows = sorted(self.category_totals.items(), key=lambda item: (item[0][0], -item[1][0]))
+            data = [['Type', 'Category', 'Transactions', 'Total']] + [
+                [transaction_type.capitalize(), category, f"{count:,}", f"${total:,.2f}"]
+                for (transaction_type, category), (total, count) in rows
+            ]
+            table = Table(data, colWidths=[70, 200, 90, 100], repeatRows=1, hAlign='LEFT')
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.gray),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ]))
+            yield table
+
+    def _ledger_tables(self):
+        from reportlab.lib import colors
+        from reportlab.lib.utils import simpleSplit
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        from reportlab.platypus import Table, TableStyle
+
+        style = TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), self.FONT),
+            ('FONTSIZE', (0, 0), (-1, -1), self.FONT_SIZE),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ])
+        category_width = self.COLUMN_WIDTHS[2] - 12  # Less the cell padding
+        description_width = self.COLUMN_WIDTHS[-1] - 12
+
+        def wrap(text, text_width):
+            # Measuring is much cheaper than splitting, and most values fit on one line
+            if stringWidth(text, self.FONT, self.FONT_SIZE) <= text_width:
+                return text
+            return '\n'.join(simpleSplit(text, self.FONT, self.FONT_SIZE, text_width))
+
+        reader = csv.reader(self.spool)
+        rendered = 0
+        while True:
+            rows = list(itertools.islice(reader, self.ROWS_PER_TABLE))
+            if not rows:
+                break
+            data = []
+            for transaction_id, _, price, category, transaction_type, date, description in rows:
+                data.append([transaction_id, f"${float(price):.2f}", wrap(category, category_width),
+                             transaction_type, date, wrap(description, description_width)])
+            table = Table(data, colWidths=self.COLUMN_WIDTHS, hAlign='LEFT')
+            table.setStyle(style)
+            yield table
+
+            rendered += len(rows)
+            if self.render_progress:
+                self.render_progress(rendered, self.row_count)
+
+    def _draw_footer(self, canvas, doc):
+        canvas.saveState()
+        canvas.setFont(self.FONT, 8)
+        canvas.drawRightString(doc.pagesize[0] - self.MARGIN, self.MARGIN / 2, f"Page {doc.page}")
+        canvas.restoreState()
+
+    def _draw_ledger_page(self, canvas, doc):
+        """Column header above the ledger frame, so every page starts with it"""
+        from reportlab.lib import colors
+
+        self._draw_footer(canvas, doc)
+        canvas.saveState()
+        top = doc.pagesize[1] - self.MARGIN
+        canvas.setFillColor(colors.gray)
+        canvas.rect(self.MARGIN, top - self.HEADER_HEIGHT, sum(self.COLUMN_WIDTHS), self.HEADER_HEIGHT,
+                    stroke=1, fill=1)
+        canvas.setFillColor(colors.whitesmoke)
+        canvas.setFont('Helvetica-Bold', self.FONT_SIZE)
+        x = self.MARGIN
+        for column, column_width in zip(self.COLUMNS, self.COLUMN_WIDTHS):
+            canvas.drawString(x + 6, top - self.HEADER_HEIGHT + 6, column)
+            x += column_width
+        canvas.restoreState()
+
+    def abort(self):
+        """Give up on the report without rendering it"""
+        self.spool.close()
+
+
+def export_transactions_to_pdf(user_id, filename, start_date=None, end_date=None, category=None,
+                               progress=None, database_path=None):
+    """Export user's transactions to a paginated PDF report with summary and category totals.
+
+    Arguments and return value as in export_transactions_to_excel. progress is
+    called with the number of rows read while the rows are spooled, then with
+    (rows laid out, total rows) while the pages are rendered.
+    """
+    return _export(PdfReportWriter, user_id, filename, start_date, end_date, category, progress, database_path,
+                   subtitle=_report_subtitle(start_date, end_date, category), render_progress=progress)
+
+
+def _report_subtitle(start_date, end_date, category):
+    if start_date and end_date:
+        period = f"Period: {start_date} to {end_date}"
+    elif start_date or end_date:
+        period = f"From {start_date}" if start_date else f"Up to {end_date}"
+    else:
+        period = None
+    return ", ".join(filter(None, [category and f"Category: {category}", period])) or None
+
+
+# Format name -> writer class; the rendered ones run in the process pool
+WRITERS = {'csv': CsvWriter, 'excel': ExcelWriter, 'pdf': PdfReportWriter}
+RENDERED_FORMATS = ('excel', 'pdf')
+SPOOL_BATCH_SIZE = 1000
+
+ExportReport = namedtuple('ExportReport', ['rows', 'read_seconds', 'seconds', 'total_seconds'])
+
+
+def _render_spool(file_format, spool_path, filename, options):
+    """Feed the rows spooled by export_transactions() to one writer; returns the seconds it took.
+
+    Runs in a pool worker, so it takes only paths and plain options.
+    """
+    started = time.perf_counter()
+    writer = WRITERS[file_format](filename, **options)
+    try:
+        with open(spool_path, newline='', encoding='utf-8') as spool:
+            reader = csv.reader(spool)
+            while True:
+                rows = [(int(transaction_id), int(user_id), float(amount), category, transaction_type, date,
+                         description)
+                        for transaction_id, user_id, amount, category, transaction_type, date, description
+                        in itertools.islice(reader, SPOOL_BATCH_SIZE)]
+                if not rows:
+                    break
+                writer.write_rows(rows)
+        writer.close()
+    except BaseException:
+        try:
+            writer.abort()
+        except Exception:
+            pass
+        raise
+    return time.perf_counter() - started
+
+
+def _temporary_path(filename):
+    """A unique name next to filename, so the final rename stays on one filesystem"""
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex}.part")
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _discard(futures, paths):
+    """Cancel futures and delete paths as soon as none of them can still be writing or reading"""
+    running = [future for future in futures if not future.cancel() and not future.done()]
+    if not running:
+        for path in paths:
+            _remove(path)
+        return
+
+    # A started pool task can't be stopped; clean up behind the last one
+    lock = threading.Lock()
+    remaining = [len(running)]
+
+    def finished(future):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for path in paths:
+                _remove(path)
+
+    for future in running:
+        future.add_done_callback(finished)
+
+
+def export_transactions(user_id, exports, start_date=None, end_date=None, category=None, progress=None,
+                        database_path=None, cpu_pool=None):
+    """Export one filtered set of transactions to several formats with a single query.
+
+    exports maps format ('csv', 'excel' or 'pdf') to filename. Each file is written
+    under a temporary name and renamed into place only after every format has
+    succeeded, so on error no output file is created or replaced. cpu_pool is the
+    executor that renders Excel and PDF (the job service's process pool from the
+    GUI); without one a process pool is started for the call.
+
+    progress is called with the number of rows read, then with (formats done,
+    formats) while the rendering runs. Returns an ExportReport with the time
+    taken by each format, or False when there is nothing to export.
+    """
+    unknown = set(exports) - set(WRITERS)
+    if unknown:
+        raise ValueError(f"Unknown export format {', '.join(sorted(unknown))}; expected one of {', '.join(WRITERS)}")
+
+    started = time.perf_counter()
+    _use_database(database_path)
+    batches = user_model.iter_transactions(user_id, start_date, end_date, category)
+    first_batch = next(batches, None)
+
+    if not first_batch:
+        return False  # No transactions to export
+
+    rendered = [file_format for file_format in RENDERED_FORMATS if file_format in exports]
+    temporary = {file_format: _temporary_path(filename) for file_format, filename in exports.items()}
+    spool_path = None
+    futures = []
+    own_pool = None
+    seconds = {}
+    try:
+        # The single pass over the database: CSV is written on the way, rows for the rest are spooled
+        csv_writer = CsvWriter(temporary['csv']) if 'csv' in exports else None
+        spool = spool_writer = None
+        if rendered:
+            handle, spool_path = tempfile.mkstemp(suffix='.csv')
+            spool = open(handle, 'w', newline='', encoding='utf-8')
+            spool_writer = csv.writer(spool)
+        rows_read = 0
+        try:
+            for batch in itertools.chain([first_batch], batches):
+                if csv_writer:
+                    writer_started = time.perf_counter()
+                    csv_writer.write_rows(batch)
+                    seconds['csv'] = seconds.get('csv', 0.0) + time.perf_counter() - writer_started
+                if spool_writer:
+                    spool_writer.writerows(batch)
+                rows_read += len(batch)
+                if progress:
+                    progress(rows_read)
+            if csv_writer:
+                csv_writer.close()
+        except BaseException:
+            batches.close()
+            if csv_writer:
+                csv_writer.abort()
+            raise
+        finally:
+            if spool:
+                spool.close()
+        read_seconds = time.perf_counter() - started
+
+        if rendered:
+            if cpu_pool is None:
+                own_pool = cpu_pool = ProcessPoolExecutor(max_workers=len(rendered),
+                                                          mp_context=multiprocessing.get_context('spawn'))
+            options = {'pdf': {'subtitle': _report_subtitle(start_date, end_date, category)}}
+            futures = [
+                cpu_pool.submit(_render_spool, file_format, spool_path, temporary[file_format],
+                                options.get(file_format, {}))
+                for file_format in rendered
+            ]
+            pending = futures
+            while pending:
+                # Short waits keep progress (and with it cancellation) responsive
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    future.result()  # Re-raises a failed format's error
+                if progress:
+                    progress(len(futures) - len(pending), len(futures))
+            for file_format, future in zip(rendered, futures):
+                seconds[file_format] = future.result()
+    except BaseException:
+        _discard(futures, list(temporary.values()) + ([spool_path] if spool_path else []))
+        raise
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown(wait=False, cancel_futures=True)
+
+    if spool_path:
+        _remove(spool_path)
+    for file_format, filename in exports.items():
+        os.replace(temporary[file_format], filename)
+    return ExportReport(rows_read, read_seconds, seconds, time.perf_counter() - started)
@@ -0,0 +1,418 @@
+# import_service.py
+#
+# Bulk loading of historical transactions. Rows are validated and normalized in a
+# single streaming pass and written with executemany in large batches, one write
+# transaction per batch, so a whole file costs one commit per batch instead of one
+# per row and other writers (the API, the write queue) get the database between
+# batches. exclusive=True instead loads everything in one transaction that holds
+# the write lock throughout; it is for initial loads with no other writers.
+
+import csv
+import math
+import operator
+import time
+from models import database
+from models import instrumentation
+from models import query_cache
+from models import schema
+from services import date_service
+
+# Columns written by export_service.export_transactions_to_csv. 'ID' and 'User ID' are
+# ignored on import: rows get new ids and belong to the importing user.
+IMPORT_COLUMNS = ['Price', 'Category', 'Type', 'Date', 'Description']
+COLUMN_ALIASES = {'amount': 'Price'}
+TAGS_COLUMN = 'Tags'  # Optional column of tag names separated by TAG_SEPARATOR
+TAG_SEPARATOR = ';'
+
+TRANSACTION_TYPES = ('income', 'expense')
+
+DEFAULT_BATCH_SIZE = 50000
+
+# The rollup (schema migration 3), full-text (migration 5) and data version (migration
+# 7) triggers are switched off inside each write transaction of an import (see
+# schema.SUSPEND_TRIGGERS); their effect is applied once per user/category/month, with
+# one INSERT ... SELECT into the search index and with one version bump instead of
+# once per row. They are back on before each commit, so other writers never see them
+# off. An exclusive import drops them for its one transaction instead, together with
+# the indexes, which also saves evaluating the switch on every row.
+
+# In an exclusive import, secondary indexes on transactions are dropped and rebuilt
+# after the load when the import adds at least 1/INDEX_REBUILD_RATIO as many rows as
+# the table already holds
+INDEX_REBUILD_RATIO = 2
+
+
+def _text(value):
+    """str() of a cell, treating None and NaN (pandas' missing value) as empty"""
+    if value.__class__ is str:
+        return value.strip()
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    return str(value).strip()
+
+
+def normalize_date(value):
+    """Return a date as 'YYYY-MM-DD'; raises ValueError if it isn't recognised.
+
+    Imports take numeric dates only (see date_service); natural-language dates like
+    "yesterday" are rejected rather than resolved relative to the day of the import.
+    """
+    return date_service.normalize_date(value)
+
+
+def normalize_row(price, category, transaction_type, date, description, date_cache=None):
+    """Validate one imported row and return it in the form stored in transactions.
+
+    date_cache, if given, memoizes normalize_date (ledgers repeat the same dates
+    many times). Raises ValueError describing the first problem found.
+    """
+    try:
+        amount = float(price)  # Plain numbers, including surrounding whitespace
+    except ValueError:
+        try:
+            amount = float(price.strip().lstrip('$').replace(',', ''))  # "$1,234.50" -> 1234.5
+        except (AttributeError, ValueError):
+            raise ValueError(f"invalid price {price!r}") from None
+    except TypeError:
+        raise ValueError(f"invalid price {price!r}") from None
+    if not math.isfinite(amount):
+        raise ValueError(f"invalid price {price!r}")
+
+    category = category.strip() if category.__class__ is str else _text(category)
+    if not category:
+        raise ValueError("missing category")
+
+    if transaction_type not in TRANSACTION_TYPES:
+        transaction_type = _text(transaction_type).lower()
+        if transaction_type not in TRANSACTION_TYPES:
+            raise ValueError(f"invalid type {transaction_type!r}")
+
+    if date_cache is None:
+        date = normalize_date(date)
+    else:
+        normalized = date_cache.get(date)
+        if normalized is None:
+            normalized = date_cache[date] = normalize_date(date)
+        date = normalized
+
+    description = description.strip() if description.__class__ is str else _text(description)
+    return amount, category, transaction_type, date, description
+
+
+def _column_indices(header):
+    """Map the import columns (and the optional tags column) to positions in header"""
+    positions = {}
+    for index, name in enumerate(header):
+        name = _text(name)
+        name = COLUMN_ALIASES.get(name.lower(), name)
+        positions.setdefault(name.lower(), index)
+
+    missing = [column for column in IMPORT_COLUMNS if column.lower() not in positions]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+
+    indices = [positions[column.lower()] for column in IMPORT_COLUMNS]
+    if TAGS_COLUMN.lower() in positions:
+        indices.append(positions[TAGS_COLUMN.lower()])
+    return indices
+
+
+def _drop_triggers(connection):
+    """Drop the bulk-gated per-row triggers inside the current transaction and return their definitions"""
+    triggers = connection.execute("""
+        SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND ({})
+    """.format(' OR '.join(['name GLOB ?'] * len(schema.BULK_GATED_TRIGGER_PATTERNS))),
+        schema.BULK_GATED_TRIGGER_PATTERNS).fetchall()
+    for name, _ in triggers:
+        connection.execute(f"DROP TRIGGER {name}")
+    return triggers
+
+
+def _drop_transaction_indexes(connection):
+    """Drop the secondary indexes on transactions inside the current transaction and return their definitions"""
+    indexes = connection.execute("""
+        SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transactions' AND sql IS NOT NULL
+    """).fetchall()
+    for name, _ in indexes:
+        connection.execute(f"DROP INDEX {name}")
+    return indexes
+
+
+def _recreate(connection, definitions):
+    """Re-run the CREATE statements returned by _drop_triggers/_drop_transaction_indexes"""
+    for _, sql in definitions:
+        connection.execute(sql)
+
+
+def _next_transaction_id(connection):
+    """First id AUTOINCREMENT would hand out next; ids are assigned explicitly so tags can be linked"""
+    return connection.execute("""
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'transactions'), 0),
+                   COALESCE((SELECT MAX(id) FROM transactions), 0)) + 1
+    """).fetchone()[0]
+
+
+def _tag_ids(connection, user_id, names, known):
+    """Return {name: tag_id} for names, creating missing tags; known caches earlier lookups"""
+    missing = [name for name in names if name not in known]
+    if missing:
+        connection.executemany("INSERT OR IGNORE INTO tags (user_id, name) VALUES (?, ?)",
+                               [(user_id, name) for name in missing])
+        for start in range(0, len(missing), 500):  # Stay under SQLite's bound-parameter limit
+            chunk = missing[start:start + 500]
+            cursor = connection.execute(
+                "SELECT name, id FROM tags WHERE user_id = ? AND name IN ({})".format(','.join('?' * len(chunk))),
+                [user_id, *chunk])
+            known.update(cursor.fetchall())
+    return known
+
+
+def _normalized_batches(rows, tags, batch_size, skipped):
+    """Validate rows and yield them in lists of at most batch_size as (records, tag_links).
+
+    records are normalize_row() tuples and tag_links (position in records, tag name)
+    pairs. Invalid rows are appended to skipped as (row_number, reason).
+    """
+    common_tags = [tag for tag in (tags or ()) if tag]
+    date_cache = {}
+    records, tag_links = [], []
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            record = normalize_row(*row[:5], date_cache)
+        except (TypeError, ValueError) as e:
+            skipped.append((row_number, str(e)))
+            continue
+
+        position = len(records)
+        records.append(record)
+        for name in common_tags:
+            tag_links.append((position, name))
+        if len(row) > 5 and row[5]:
+            row_tags = row[5]
+            if row_tags.__class__ is str:
+                row_tags = row_tags.split(TAG_SEPARATOR)
+            for name in row_tags:
+                name = _text(name)
+                if name:
+                    tag_links.append((position, name))
+
+        if len(records) >= batch_size:
+            yield records, tag_links
+            records, tag_links = [], []
+    if records:
+        yield records, tag_links
+
+
+def _write_batch(connection, user_id, first_id, records, tag_links, tag_cache):
+    """Insert records with ids from first_id on, and link their tags"""
+    connection.executemany("""
+        INSERT INTO transactions (id, user_id, amount, category, type, date, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(first_id + position, user_id, *record) for position, record in enumerate(records)])
+    if tag_links:
+        tag_ids = _tag_ids(connection, user_id, {name for _, name in tag_links}, tag_cache)
+        connection.executemany("INSERT OR IGNORE INTO transaction_tags (transaction_id, tag_id) VALUES (?, ?)",
+                               [(first_id + position, tag_ids[name]) for position, name in tag_links])
+
+
+def _index_descriptions(connection, first_id):
+    """Add the imported rows to the full-text index, as the suspended triggers would have"""
+    connection.execute("""
+        INSERT INTO transactions_fts (rowid, description)
+        SELECT id, description FROM transactions WHERE id >= ?
+    """, (first_id,))
+
+
+def _apply_rollups(connection, user_id, records):
+    """Add the records' totals to the rollup tables, as the suspended triggers would have"""
+    income = expenses = 0.0
+    category_totals = {}  # (type, category, month) -> [total, count]
+    for amount, category, transaction_type, date, _ in records:
+        if transaction_type == 'income':
+            income += amount
+        else:
+            expenses += amount
+        key = (transaction_type, category, date[:7])
+        category_total = category_totals.get(key)
+        if category_total is None:
+            category_totals[key] = [amount, 1]
+        else:
+            category_total[0] += amount
+            category_total[1] += 1
+
+    connection.execute("""
+        INSERT INTO user_totals (user_id, total_income, total_expenses, transaction_count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_income = total_income + excluded.total_income,
+            total_expenses = total_expenses + excluded.total_expenses,
+            transaction_count = transaction_count + excluded.transaction_count
+    """, (user_id, income, expenses, len(records)))
+    connection.executemany("""
+        INSERT INTO category_monthly_totals (user_id, type, category, month, total, transaction_count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, type, category, month) DO UPDATE SET
+            total = total + excluded.total,
+            transaction_count = transaction_count + excluded.transaction_count
+    """, [(user_id, *key, total, count) for key, (total, count) in category_totals.items()])
+
+
+def _undo_batches(connection, user_id, committed):
+    """Delete the batches an interrupted import already committed, one transaction per batch.
+
+    The triggers are in place again, so the deletes take the rows back out of the
+    rollups and the search index.
+    """
+    for first_id, last_id in committed:
+        with connection:
+            connection.execute("DELETE FROM transaction_tags WHERE transaction_id BETWEEN ? AND ?",
+                               (first_id, last_id))
+            connection.execute("DELETE FROM transactions WHERE user_id = ? AND id BETWEEN ? AND ?",
+                               (user_id, first_id, last_id))
+    if committed:
+        query_cache.bump_version(user_id)
+
+
+def _import_batched(connection, user_id, batches, progress):
+    """Write each batch in its own transaction; returns the number of rows imported"""
+    imported = 0
+    tag_cache = {}
+    committed = []  # (first_id, last_id) of each committed batch
+    try:
+        for records, tag_links in batches:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(schema.SUSPEND_TRIGGERS)
+                # Other writers may have added rows since the last batch
+                first_id = _next_transaction_id(connection)
+                _write_batch(connection, user_id, first_id, records, tag_links, tag_cache)
+                _apply_rollups(connection, user_id, records)
+                _index_descriptions(connection, first_id)
+                connection.execute(schema.BUMP_DATA_VERSION, (user_id,))
+                connection.execute(schema.RESUME_TRIGGERS)
+            except BaseException:
+                connection.rollback()
+                raise
+            connection.commit()
+            committed.append((first_id, first_id + len(records) - 1))
+            query_cache.bump_version(user_id)
+            imported += len(records)
+            if progress:
+                progress(imported)
+    except BaseException:
+        _undo_batches(connection, user_id, committed)
+        raise
+    return imported
+
+
+def _import_exclusive(connection, user_id, batches, progress):
+    """Write every batch in one transaction; returns the number of rows imported"""
+    imported = 0
+    tag_cache = {}
+    dropped_indexes = None  # Decided at the first batch
+    connection.execute("BEGIN EXCLUSIVE")
+    try:
+        triggers = _drop_triggers(connection)
+        first_id = next_id = _next_transaction_id(connection)
+
+        for records, tag_links in batches:
+            if dropped_indexes is None:
+                # Inserting into three secondary indexes row by row is several times slower than
+                # building them once with CREATE INDEX; worth it when the import is large
+                # compared to what is already stored. The id high-water mark bounds existing rows.
+                if len(records) * INDEX_REBUILD_RATIO >= first_id - 1:
+                    dropped_indexes = _drop_transaction_indexes(connection)
+                else:
+                    dropped_indexes = []
+            _write_batch(connection, user_id, next_id, records, tag_links, tag_cache)
+            _apply_rollups(connection, user_id, records)
+            next_id += len(records)
+            imported += len(records)
+            if progress:
+                progress(imported)
+
+        if imported:
+            _index_descriptions(connection, first_id)
+            connection.execute(schema.BUMP_DATA_VERSION, (user_id,))
+        _recreate(connection, dropped_indexes or [])
+        _recreate(connection, triggers)
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+    query_cache.bump_version(user_id)
+    return imported
+
+
+@instrumentation.instrumented
+def import_rows(user_id, rows, tags=None, batch_size=DEFAULT_BATCH_SIZE, progress=None, exclusive=False):
+    """Import rows of (price, category, type, date, description[, row_tags]) for a user.
+
+    row_tags is a list of tag names or a TAG_SEPARATOR-separated string; tags are
+    attached to every imported row. Invalid rows are skipped and reported.
+
+    Each batch of batch_size rows is committed on its own, so the write lock is
+    only held for one batch at a time; if the import fails or is cancelled, the
+    batches already committed are deleted again. With exclusive=True the whole
+    import is one transaction holding the write lock until it ends (concurrent
+    writers time out), which lets a load into a small table rebuild the indexes
+    once instead of updating them row by row.
+
+    Returns a dict with 'imported', 'skipped' (list of (row_number, reason), row
+    numbers starting at 1) and 'seconds'.
+    """
+    connection = database.get_connection()
+    started = time.perf_counter()
+    skipped = []
+    batches = _normalized_batches(rows, tags, batch_size, skipped)
+    # The trace callback would run once per inserted row
+    with instrumentation.untraced(connection):
+        if exclusive:
+            imported = _import_exclusive(connection, user_id, batches, progress)
+        else:
+            imported = _import_batched(connection, user_id, batches, progress)
+    return {'imported': imported, 'skipped': skipped, 'seconds': time.perf_counter() - started}
+
+
+def import_csv(user_id, filename, tags=None, batch_size=DEFAULT_BATCH_SIZE, progress=None, exclusive=False):
+    """Import a CSV file laid out like export_transactions_to_csv's output.
+
+    Column order doesn't matter; an optional 'Tags' column is honoured. Row
+    numbers in the result count data rows, excluding the header.
+    """
+    with open(filename, newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, None)
+        if header is None:
+            return {'imported': 0, 'skipped': [], 'seconds': 0.0}
+        indices = _column_indices(header)
+        width = max(indices) + 1
+
+        columns = operator.itemgetter(*indices)
+
+        def rows():
+            for record in reader:
+                if len(record) < width:
+                    record += [''] * (width - len(record))
+                yield columns(record)
+
+        return import_rows(user_id, rows(), tags, batch_size, progress, exclusive)
+
+
+def import_snapshot(user_id, filename, tags=None, batch_size=DEFAULT_BATCH_SIZE, progress=None, exclusive=False):
+    """Import an Arrow or Parquet snapshot written by export_service.export_transactions_to_arrow/_parquet.
+
+    The file is memory-mapped and its typed columns are decoded by Arrow, so no
+    text is parsed; tags travel with their rows.
+    """
+    from services import snapshot_service
+
+    table = snapshot_service.open_snapshot(filename)
+    return import_rows(user_id, snapshot_service.iter_rows(table), tags, batch_size, progress, exclusive)
+
+
+def import_dataframe(user_id, df, tags=None, batch_size=DEFAULT_BATCH_SIZE, progress=None, exclusive=False):
+    """Import a pandas DataFrame with the same columns as the CSV layout"""
+    indices = _column_indices(list(df.columns))
+    rows = df.iloc[:, indices].itertuples(index=False, name=None)
+    return import_rows(user_id, rows, tags, batch_size, progress, exclusive)
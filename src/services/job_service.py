@@ -0,0 +1,141 @@
+# job_service.py
+#
+# Runs blocking work (SQLite queries, bcrypt, file exports) off the Tk thread.
+# Tk may only be touched from the thread running mainloop, so workers never call
+# back into Tk directly: completions and progress reports are queued and drained
+# on the Tk thread by a short after() polling loop. Anything queued for a job that
+# has been cancelled in the meantime is dropped there, so nothing reaches a dialog
+# the user has already closed.
+
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+POLL_INTERVAL_MS = 50
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job by report_progress() once cancel() has been called"""
+
+
+class Job:
+    """Handle for submitted work: cooperative cancellation and progress reporting"""
+
+    def __init__(self, executor, on_progress=None):
+        self._executor = executor
+        self._cancelled = threading.Event()
+        self._on_progress = on_progress
+        self.future = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Ask the job to stop; a job that hasn't started yet never runs"""
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def report_progress(self, *progress):
+        """Called from the worker; forwards progress to the Tk thread and raises JobCancelled if cancelled"""
+        if self.cancelled:
+            raise JobCancelled()
+        if self._on_progress:
+            self._executor._post(self, self._on_progress, *progress)
+
+
+class JobExecutor:
+    """Thread pool for I/O-bound work plus a lazily started process pool for CPU-bound work.
+
+    Callbacks (on_success, on_error, on_progress) always run on the Tk thread. Errors
+    of jobs submitted without on_error, and of failing callbacks, are logged and
+    passed to the executor's own on_error, also on the Tk thread.
+    """
+
+    def __init__(self, root, io_workers=4, cpu_workers=None, on_error=None):
+        self.root = root
+        self.on_error = on_error
+        self.io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='finance-io')
+        self.cpu_workers = cpu_workers
+        self._cpu_pool = None
+        self._callbacks = queue.SimpleQueue()
+        self._closed = False
+        self._poll()
+
+    @property
+    def cpu_pool(self):
+        if self._cpu_pool is None:
+            # spawn, not fork: forking a process that runs Tk and worker threads is unsafe
+            self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._cpu_pool
+
+    def submit(self, func, *args, on_success=None, on_error=None, on_progress=None, pass_job=False):
+        """Run func(*args) on the I/O thread pool.
+
+        With pass_job=True the Job is passed as func's first argument so it can call
+        job.report_progress(); on_progress then receives whatever it reports. A job
+        stopped by cancel() completes without calling on_success or on_error.
+        """
+        job = Job(self, on_progress)
+        call_args = (job, *args) if pass_job else args
+        job.future = self.io_pool.submit(func, *call_args)
+        job.future.add_done_callback(lambda future: self._finished(job, future, on_success, on_error))
+        return job
+
+    def submit_cpu(self, func, *args, on_success=None, on_error=None):
+        """Run func(*args) in the process pool; func and its arguments must be picklable"""
+        job = Job(self)
+        job.future = self.cpu_pool.submit(func, *args)
+        job.future.add_done_callback(lambda future: self._finished(job, future, on_success, on_error))
+        return job
+
+    def _finished(self, job, future, on_success, on_error):
+        # Runs on the worker thread: hand the outcome over to the Tk thread
+        if future.cancelled() or job.cancelled:
+            return
+        error = future.exception()
+        if isinstance(error, JobCancelled):
+            return
+        if error is not None:
+            self._post(job, on_error or self._report_error, error)
+        elif on_success:
+            self._post(job, on_success, future.result())
+
+    def _post(self, job, callback, *args):
+        self._callbacks.put((job, callback, args))
+
+    def _poll(self):
+        while True:
+            try:
+                job, callback, args = self._callbacks.get_nowait()
+            except queue.Empty:
+                break
+            if job.cancelled:
+                continue  # Cancelled after this was queued
+            try:
+                callback(*args)
+            except Exception as e:
+                self._report_error(e)
+        if not self._closed:
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _report_error(self, error):
+        logger.error("Background job failed: %r", error, exc_info=error)
+        if self.on_error:
+            try:
+                self.on_error(error)
+            except Exception:
+                logger.exception("Error handler failed")
+
+    def shutdown(self):
+        """Stop accepting work, cancel anything queued and release the pools"""
+        self._closed = True
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,289 @@
+# visualization_service.py
+#
+# Pie charts for the Financial Overview window. The figure, canvas and every chart's
+# artists are created once and then updated in place, so toggling between charts and
+# resizing the window never rebuild the axes or the legend. PieChart, which keeps one
+# pie's artists, needs no Tk and works on any matplotlib axes.
+
+import math
+import textwrap
+from tkinter import ttk
+
+CHART_TITLES = {
+    'category': 'Expenses by Category',
+    'income_expense': 'Income vs Expenses',
+}
+INCOME_EXPENSE_LABELS = ['Income', 'Expenses']
+INCOME_EXPENSE_COLORS = ['green', 'red']
+
+# Same geometry ax.pie uses by default, needed to move labels when wedges are updated in place
+START_ANGLE = 90
+LABEL_DISTANCE = 1.1
+PCT_DISTANCE = 0.6
+LABEL_WRAP_WIDTH = 15
+
+
+def wrap_label(label):
+    """Handle long category names by wrapping text"""
+    return '\n'.join(textwrap.wrap(label, LABEL_WRAP_WIDTH))
+
+
+def create_custom_legend(parent_frame, labels, patches, colors=None):
+    """
+    Create a custom legend using Tkinter widgets.
+    :param parent_frame: The Tkinter frame where the legend will be placed.
+    :param labels: List of label strings.
+    :param patches: List of matplotlib Patch objects.
+    :param colors: Optional list of colors if patches do not contain color information.
+    """
+    # Clear any existing widgets in the legend frame
+    for widget in parent_frame.winfo_children():
+        widget.destroy()
+
+    # Create a title for the legend
+    legend_title = ttk.Label(parent_frame, text="Categories", font=("Arial", 14, "bold"))
+    legend_title.pack(anchor='w')
+
+    # Create a frame for the legend entries
+    entries_frame = ttk.Frame(parent_frame)
+    entries_frame.pack(anchor='w', pady=5)
+
+    for i, label in enumerate(labels):
+        # Get the color from the patch or use the provided color list
+        if colors:
+            color = colors[i] if i < len(colors) else 'black'
+        else:
+            color = patches[i].get_facecolor()
+            if isinstance(color, tuple) or isinstance(color, list):
+                # Convert RGBA to HEX
+                color = '#%02x%02x%02x' % (int(color[0]*255), int(color[1]*255), int(color[2]*255))
+            else:
+                color = 'black'
+
+        # Create a colored square
+        color_label = ttk.Label(entries_frame, background=color, width=2)
+        color_label.pack(side='left', padx=(0,5))
+
+        # Create the text label
+        text_label = ttk.Label(entries_frame, text=label, font=("Arial", 12))
+        text_label.pack(side='left', padx=(0,15))
+
+    # Add some padding at the bottom
+    entries_frame.pack(pady=(0,10))
+
+
+def wedge_angles(amounts):
+    """[(theta1, theta2, fraction)] of each wedge, in degrees, as ax.pie lays them out from START_ANGLE"""
+    total = float(sum(amounts))
+    angles = []
+    theta1 = START_ANGLE
+    for amount in amounts:
+        fraction = amount / total if total else 0
+        theta2 = theta1 + 360 * fraction
+        angles.append((theta1, theta2, fraction))
+        theta1 = theta2
+    return angles
+
+
+def label_positions(theta1, theta2):
+    """(label xy, horizontal alignment, percentage xy) of a wedge, as ax.pie places them"""
+    middle = math.radians((theta1 + theta2) / 2)
+    x, y = math.cos(middle), math.sin(middle)
+    alignment = 'left' if x > 0 else 'right'
+    return (LABEL_DISTANCE * x, LABEL_DISTANCE * y), alignment, (PCT_DISTANCE * x, PCT_DISTANCE * y)
+
+
+class PieChart:
+    """The artists of one pie on an axes, updated in place while the number of wedges stays the same"""
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.labels = None
+        self.colors = None
+        self.wedges = []
+        self.texts = []
+        self.autotexts = []
+
+    def plot(self, title, labels, amounts, colors=None):
+        """Show amounts under labels; returns True if the artists were rebuilt, False if they were moved"""
+        if self.labels is not None and len(labels) == len(self.labels) and colors == self.colors:
+            self._move_wedges(labels, amounts)
+            return False
+        self._draw_pie(title, labels, amounts, colors)
+        return True
+
+    def _draw_pie(self, title, labels, amounts, colors):
+        self.ax.clear()
+        self.wedges, self.texts, self.autotexts = self.ax.pie(
+            amounts,
+            labels=[wrap_label(label) for label in labels],
+            autopct='%1.1f%%',
+            startangle=START_ANGLE,
+            colors=colors,
+            labeldistance=LABEL_DISTANCE,
+            pctdistance=PCT_DISTANCE,
+            textprops={'fontsize': 12 if colors else 10},
+            wedgeprops={'linewidth': 1, 'edgecolor': 'white'}
+        )
+        self.ax.axis('equal')
+        self.ax.set_title(title)
+        self.labels = list(labels)
+        self.colors = colors
+
+    def _move_wedges(self, labels, amounts):
+        """Re-angle the existing wedges and their labels for new amounts"""
+        for wedge, text, autotext, label, (theta1, theta2, fraction) in zip(
+                self.wedges, self.texts, self.autotexts, labels, wedge_angles(amounts)):
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+            label_xy, alignment, pct_xy = label_positions(theta1, theta2)
+            text.set_position(label_xy)
+            text.set_horizontalalignment(alignment)
+            text.set_text(wrap_label(label))
+            autotext.set_position(pct_xy)
+            autotext.set_text('%1.1f%%' % (100 * fraction))
+        self.labels = list(labels)
+
+
+class ChartState:
+    """Artists and cached rendering of one chart type"""
+
+    def __init__(self, ax, legend_frame):
+        self.ax = ax
+        self.pie = PieChart(ax)
+        self.legend_frame = legend_frame
+        self.background = None  # Rendered pixels, reused while size and data are unchanged
+        self.layout_dirty = True
+
+
+class ChartController:
+    """Owns the chart canvas of a window and switches between cached chart types.
+
+    Every chart type gets its own axes and legend frame; only the current one is
+    visible. Data updates move the existing wedges when the number of labels is the
+    same, and resize events are coalesced into one idle redraw.
+    """
+
+    def __init__(self, window, legend_parent, title_label, figsize=(8, 8)):
+        # Imported here so matplotlib is only loaded when a chart is first shown
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.window = window
+        self.legend_parent = legend_parent
+        self.title_label = title_label
+
+        # A standalone Figure (rather than pyplot) is not tracked globally, so it is freed with the window
+        self.figure = Figure(figsize=figsize)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=window)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+        self.charts = {}
+        self.data = {}
+        self.current = None
+        self.window_size = None
+        self.redraw_pending = None
+
+        window.bind('<Configure>', self.on_configure, add='+')
+
+    @property
+    def widget(self):
+        return self.canvas.get_tk_widget()
+
+    def set_data(self, summary, expenses_by_category):
+        """Feed both charts from get_financial_summary and get_expenses_by_category results"""
+        total_income, total_expenses = summary
+        if total_income == 0 and total_expenses == 0:
+            self.update('income_expense', None)
+        else:
+            self.update('income_expense', INCOME_EXPENSE_LABELS, [total_income, total_expenses],
+                        INCOME_EXPENSE_COLORS)
+        if expenses_by_category:
+            self.update('category', list(expenses_by_category.keys()), list(expenses_by_category.values()))
+        else:
+            self.update('category', None)
+
+    def update(self, kind, labels, amounts=None, colors=None):
+        """Replace the data of one chart type; labels=None means there is nothing to show"""
+        self.data[kind] = (labels, amounts, colors) if labels else None
+        state = self.charts.get(kind)
+        if state is None or not labels:
+            return
+        self._plot(kind, state)
+        state.background = None
+        if kind == self.current:
+            self.redraw()
+
+    def has_data(self, kind):
+        return bool(self.data.get(kind))
+
+    def show(self, kind):
+        """Make kind the visible chart; returns False when it has no data"""
+        if not self.has_data(kind):
+            return False
+        state = self.charts.get(kind)
+        if state is None:
+            state = self._create(kind)
+
+        if self.current is not None and self.current != kind:
+            previous = self.charts[self.current]
+            previous.ax.set_visible(False)
+            previous.legend_frame.pack_forget()
+        state.ax.set_visible(True)
+        state.legend_frame.pack()
+        self.title_label.config(text=CHART_TITLES[kind])
+        self.current = kind
+
+        if state.background is not None:
+            # Same size and data as last time: put the cached pixels back instead of rendering
+            self.canvas.restore_region(state.background)
+            self.canvas.blit(self.figure.bbox)
+        else:
+            self.redraw()
+        return True
+
+    def redraw(self):
+        state = self.charts[self.current]
+        if state.layout_dirty:
+            self.figure.tight_layout()
+            state.layout_dirty = False
+        self.canvas.draw_idle()
+
+    def on_draw(self, event):
+        if self.current is not None:
+            self.charts[self.current].background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def on_configure(self, event):
+        # Children report their own <Configure> events too; only a change of window size matters
+        if event.widget is not self.window:
+            return
+        size = (event.width, event.height)
+        if size == self.window_size:
+            return
+        self.window_size = size
+        for state in self.charts.values():
+            state.background = None
+            state.layout_dirty = True
+        if self.redraw_pending is None and self.current is not None:
+            self.redraw_pending = self.window.after_idle(self._redraw_after_resize)
+
+    def _redraw_after_resize(self):
+        self.redraw_pending = None
+        if self.window.winfo_exists():
+            self.redraw()
+
+    def _create(self, kind):
+        ax = self.figure.add_subplot(label=kind)
+        state = ChartState(ax, ttk.Frame(self.legend_parent))
+        self.charts[kind] = state
+        self._plot(kind, state)
+        return state
+
+    def _plot(self, kind, state):
+        labels, amounts, colors = self.data[kind]
+        previous_labels = state.pie.labels
+        rebuilt = state.pie.plot(CHART_TITLES[kind], labels, amounts, colors)
+        if rebuilt or state.pie.labels != previous_labels:
+            # New label texts take different room around the pie
+            state.layout_dirty = True
+            create_custom_legend(state.legend_frame, labels, state.pie.wedges, colors)
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import database, user_model  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    database.set_database(tmp_path / "test.db")
+    user_model.initialize_database()
+    yield database.get_connection()
+    database.close_all()
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from services.visualization_service import PieChart, wedge_angles  # noqa: E402
+
+
+def new_pie():
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    return PieChart(figure.add_subplot())
+
+
+def layout(pie):
+    return [(wedge.theta1, wedge.theta2, text.get_position(), text.get_horizontalalignment(), text.get_text(),
+             autotext.get_position(), autotext.get_text())
+            for wedge, text, autotext in zip(pie.wedges, pie.texts, pie.autotexts)]
+
+
+def assert_drawn_like_a_fresh_pie(pie, labels, amounts):
+    fresh = new_pie()
+    fresh.plot("Expenses by Category", labels, amounts)
+    assert len(pie.wedges) == len(labels)
+    for moved, drawn in zip(layout(pie), layout(fresh)):
+        assert moved[:2] == pytest.approx(drawn[:2])
+        assert moved[2] == pytest.approx(drawn[2]) and moved[5] == pytest.approx(drawn[5])
+        assert moved[3:5] == drawn[3:5] and moved[6] == drawn[6]
+
+
+def test_wedge_angles_split_the_circle_from_the_start_angle():
+    assert wedge_angles([1, 1, 2]) == [(90, 180, 0.25), (180, 270, 0.25), (270, 450, 0.5)]
+    assert wedge_angles([0, 0]) == [(90, 90, 0), (90, 90, 0)]
+
+
+def test_pie_chart_moves_wedges_in_place_while_the_category_count_is_unchanged():
+    pie = new_pie()
+    assert pie.plot("Expenses by Category", ["Rent", "Food", "Travel"], [500, 300, 200]) is True
+    wedges = list(pie.wedges)
+
+    # Same categories, new amounts: the same artists, where ax.pie would have put them
+    assert pie.plot("Expenses by Category", ["Rent", "Food", "Travel"], [100, 100, 800]) is False
+    assert pie.wedges == wedges
+    assert_drawn_like_a_fresh_pie(pie, ["Rent", "Food", "Travel"], [100, 100, 800])
+
+    # As many categories under other names: still moved, with the labels replaced
+    assert pie.plot("Expenses by Category", ["Rent", "Utilities and household", "Gifts"], [1, 2, 3]) is False
+    assert pie.wedges == wedges and pie.labels == ["Rent", "Utilities and household", "Gifts"]
+    assert_drawn_like_a_fresh_pie(pie, ["Rent", "Utilities and household", "Gifts"], [1, 2, 3])
+
+    # A category more or less rebuilds the pie
+    assert pie.plot("Expenses by Category", ["Rent", "Food", "Travel", "Health"], [4, 3, 2, 1]) is True
+    assert_drawn_like_a_fresh_pie(pie, ["Rent", "Food", "Travel", "Health"], [4, 3, 2, 1])
+    assert pie.plot("Expenses by Category", ["Rent", "Food"], [1, 3]) is True
+    assert_drawn_like_a_fresh_pie(pie, ["Rent", "Food"], [1, 3])
+    pie.ax.figure.canvas.draw()
+
+
+def test_pie_chart_rebuilds_when_colors_change():
+    pie = new_pie()
+    pie.plot("Income vs Expenses", ["Income", "Expenses"], [10, 5], ["green", "red"])
+    wedges = list(pie.wedges)
+    assert pie.plot("Income vs Expenses", ["Income", "Expenses"], [5, 10], ["green", "red"]) is False
+    assert pie.wedges == wedges and pie.autotexts[1].get_text() == "66.7%"
+    assert pie.plot("Expenses by Category", ["Rent", "Food"], [5, 10]) is True
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import database, user_model  # noqa: E402
+
+
+def connection_in_thread():
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(database.get_connection()))
+    thread.start()
+    thread.join()
+    return connections[0]
+
+
+def test_each_thread_keeps_its_own_connection(db):
+    assert database.get_connection() is db
+    assert user_model.connect_db() is db
+    other = connection_in_thread()
+    assert other is not db
+    # The other thread's connection stays in the pool until close_all
+    assert other.execute("SELECT 1").fetchone() == (1,)
+
+
+def test_connections_are_configured_once_when_opened(db):
+    def pragma(name):
+        return db.execute(f"PRAGMA {name}").fetchone()[0]
+
+    assert pragma("cache_size") == -16000
+    assert pragma("mmap_size") == 268435456
+    assert pragma("temp_store") == 2  # MEMORY
+    assert pragma("journal_mode") == "wal"
+    assert pragma("synchronous") == 2  # FULL
+    assert pragma("busy_timeout") == 5000
+
+
+def test_user_model_reuses_the_pooled_connection(db, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+    monkeypatch.setattr(sqlite3, "connect", lambda *args, **kwargs: opened.append(args) or connect(*args, **kwargs))
+
+    assert user_model.create_user("alice", "secret")
+    user_id = user_model.authenticate_user("alice", "secret")
+    user_model.add_category(user_id, "Food")
+    for _ in range(20):
+        user_model.add_transaction(user_id, 12.5, "Food", "expense", "2024-03-01", "Lunch")
+        user_model.get_categories(user_id)
+        user_model.get_transactions(user_id, with_tags=True)
+    assert len(user_model.get_transactions(user_id)) == 20
+    assert opened == []
+
+
+def test_close_all_closes_connections_and_threads_reconnect(db):
+    other = connection_in_thread()
+    database.close_all()
+    for closed in (db, other):
+        with pytest.raises(sqlite3.ProgrammingError):
+            closed.execute("SELECT 1")
+
+    reopened = database.get_connection()
+    assert reopened is not db
+    assert reopened.execute("SELECT COUNT(*) FROM users").fetchone() == (0,)
+
+
+def test_set_database_switches_files(db, tmp_path):
+    user_model.create_user("alice", "secret")
+    path = database.get_database()
+
+    database.set_database(tmp_path / "other.db")
+    assert database.get_database() == str(tmp_path / "other.db")
+    user_model.initialize_database()
+    assert user_model.authenticate_user("alice", "secret") is None
+
+    database.set_database(path)
+    assert user_model.authenticate_user("alice", "secret") == 1
+
+
+def test_connection_hooks_run_for_open_and_new_connections(db):
+    seen = []
+    hook = seen.append
+    database.add_connection_hook(hook)
+    try:
+        assert seen == [db]
+        other = connection_in_thread()
+        assert seen == [db, other]
+
+        visited = []
+        database.for_each_connection(visited.append)
+        assert visited == [db, other]
+    finally:
+        database._connection_hooks.remove(hook)
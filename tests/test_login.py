@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import user_model  # noqa: E402
+
+
+def test_create_user_rejects_taken_usernames(db):
+    assert user_model.create_user("alice", "secret") is True
+    assert user_model.create_user("alice", "other") is False
+    assert user_model.create_user("bob", "secret") is True
+    assert db.execute("SELECT COUNT(*) FROM users").fetchone() == (2,)
+
+
+def test_passwords_are_stored_hashed(db):
+    user_model.create_user("alice", "secret")
+    stored = db.execute("SELECT password FROM users WHERE username = 'alice'").fetchone()[0]
+    assert b"secret" not in stored
+    assert user_model.verify_password(stored, "secret")
+
+
+def test_authenticate_user_returns_the_id_only_for_the_right_password(db):
+    user_model.create_user("alice", "secret")
+    user_model.create_user("bob", "hunter2")
+    assert user_model.authenticate_user("alice", "secret") == 1
+    assert user_model.authenticate_user("bob", "hunter2") == 2
+    assert user_model.authenticate_user("alice", "hunter2") is None
+    assert user_model.authenticate_user("carol", "secret") is None
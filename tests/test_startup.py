@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Must stay out of `import main` until after login (see DEFERRED_IMPORTS in main.py)
+HEAVY_MODULES = ("dateparser", "matplotlib", "pandas", "reportlab", "numpy")
+
+
+def loaded_after(script, modules):
+    """Run script in a fresh interpreter and return which of modules it left imported"""
+    check = f"{script}\nimport sys\nprint(' '.join(m for m in {modules!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", check], cwd=SRC_DIR, capture_output=True, text=True,
+                            check=True)
+    return result.stdout.split()
+
+
+def test_main_defers_heavy_imports_until_warmed():
+    pytest.importorskip("tkinter")
+    assert loaded_after("import main", HEAVY_MODULES) == []
+    assert loaded_after("import main\nmain.warm_deferred_imports()", HEAVY_MODULES) == list(HEAVY_MODULES)
+
+
+@pytest.mark.parametrize("module", ["cli", "services.date_service", "services.export_service",
+                                    "services.import_service", "models.user_model"])
+def test_headless_modules_import_without_gui_or_heavy_dependencies(module):
+    assert loaded_after(f"import {module}", HEAVY_MODULES + ("tkinter",)) == []
+
+
+def test_numeric_dates_parse_without_dateparser():
+    script = ("from services import date_service\n"
+              "assert date_service.normalize_date('2024-03-01') == '2024-03-01'\n"
+              "assert date_service.normalize_date('01/03/2024') is not None")
+    assert loaded_after(script, ("dateparser",)) == []
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+sys.path.insert(0, BENCHMARK_DIR)
+
+import compare_results  # noqa: E402
+import synthetic  # noqa: E402
+from models import database, user_model  # noqa: E402
+
+
+def test_sizes_and_user_shares():
+    assert synthetic.rows_for_size("10k") == 10_000
+    assert synthetic.rows_for_size("1M") == 1_000_000
+    assert synthetic.rows_for_size("10_000_000") == 10_000_000
+    assert synthetic.rows_for_size(1234) == 1234
+
+    counts = synthetic.user_row_counts(10_000, 20)
+    assert len(counts) == 20 and sum(counts) == 10_000
+    assert counts == sorted(counts, reverse=True) and min(counts) >= 1
+    assert synthetic.user_row_counts(3, 20) == [1, 1, 1]
+
+
+def test_generated_rows_are_deterministic_and_realistic():
+    rows = list(synthetic.generate_rows(np.random.default_rng(7), 5000))
+    assert rows == list(synthetic.generate_rows(np.random.default_rng(7), 5000))
+    assert rows != list(synthetic.generate_rows(np.random.default_rng(8), 5000))
+
+    assert len(rows) == 5000
+    first, last = str(synthetic.FIRST_DAY), str(synthetic.LAST_DAY)
+    for price, category, kind, day, description, tags in rows:
+        assert price > 0 and first <= day <= last
+        assert kind == synthetic.CATEGORIES[category][0]
+        assert description.split(" #")[0] in synthetic.CATEGORIES[category][5]
+        assert tags is None or (set(tags) <= set(synthetic.TAGS) and len(tags) == len(set(tags)))
+        fixed_day = synthetic.CATEGORIES[category][4]
+        if fixed_day:
+            assert int(day[-2:]) == fixed_day
+
+    tagged = sum(tags is not None for *_, tags in rows) / len(rows)
+    assert tagged == pytest.approx(synthetic.TAGGED_SHARE, abs=0.03)
+    assert all(tags is None for *_, tags in synthetic.generate_rows(np.random.default_rng(7), 100, tags=False))
+
+
+def test_populate_builds_the_same_ledger_for_the_same_seed(tmp_path):
+    def build(name, seed):
+        database.set_database(tmp_path / name)
+        user_model.initialize_database()
+        created = synthetic.populate(300, users=4, seed=seed)
+        ledger = database.get_connection().execute(
+            "SELECT user_id, amount, category, type, date, description FROM transactions ORDER BY id"
+        ).fetchall()
+        database.close_all()
+        return created, ledger
+
+    try:
+        created, ledger = build("a.db", 1)
+        assert created == list(zip(range(1, 5), synthetic.user_row_counts(300, 4)))
+        assert len(ledger) == 300
+        assert build("b.db", 1) == (created, ledger)
+        assert build("c.db", 2)[1] != ledger
+    finally:
+        database.close_all()
+
+
+def test_compare_flags_regressions_beyond_the_threshold():
+    def run(**timings):
+        return {"results": {name: {"min": seconds} for name, seconds in timings.items()}}
+
+    rows = compare_results.compare(run(steady=0.010, slower=0.010, faster=0.010, tiny=0.00001, removed=0.01),
+                                   run(steady=0.011, slower=0.020, faster=0.005, tiny=0.00004, added=0.01),
+                                   threshold=0.25)
+    assert {name: verdict for name, *_, verdict in rows} == {
+        "added": "added", "faster": "faster", "removed": "removed", "slower": "REGRESSION", "steady": "",
+        "tiny": "",
+    }
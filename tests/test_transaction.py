@@ -0,0 +1,860 @@
+import http.client
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import cli  # noqa: E402
+from models import (analytics, database, instrumentation, ledger, query_cache, recurring, schema,  # noqa: E402
+                    user_model, write_queue)
+from services import api_service, date_service, export_service, import_service, snapshot_service  # noqa: E402
+from services.job_service import JobExecutor  # noqa: E402
+
+
+def captured_sql(connection, func, *args):
+    """Run func and return the SQL statements it executed (with parameters expanded)"""
+    statements = []
+    connection.set_trace_callback(statements.append)
+    try:
+        func(*args)
+    finally:
+        connection.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+
+def query_plan(connection, sql):
+    return " | ".join(row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + sql))
+
+
+def test_migrate_is_idempotent(db):
+    assert schema.get_version(db) == schema.LATEST_VERSION
+
+    statements = []
+    db.set_trace_callback(statements.append)
+    assert user_model.initialize_database() == schema.LATEST_VERSION
+    db.set_trace_callback(None)
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_migrate_upgrades_unversioned_database(tmp_path):
+    database.set_database(tmp_path / "legacy.db")
+    connection = database.get_connection()
+    connection.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, "
+                       "password TEXT NOT NULL)")
+    connection.execute("INSERT INTO users (username, password) VALUES ('alice', 'x')")
+    connection.commit()
+
+    assert user_model.initialize_database() == schema.LATEST_VERSION
+    assert connection.execute("SELECT username FROM users").fetchall() == [("alice",)]
+    database.close_all()
+
+
+@pytest.mark.parametrize("func, args", [
+    (user_model.get_transactions, (1,)),
+    (user_model.get_financial_summary, (1,)),
+    (user_model.get_expenses_by_category, (1,)),
+    (user_model.get_transactions_filtered, (1, "Rent")),
+    (user_model.get_transactions_filtered, (1, None, ["home"])),
+])
+def test_hot_queries_use_indexes(db, func, args):
+    statements = captured_sql(db, func, *args)
+    assert statements
+
+    for sql in statements:
+        plan = query_plan(db, sql)
+        assert "SCAN " not in plan, plan
+        assert "SEARCH" in plan, plan
+        assert "TEMP B-TREE FOR ORDER BY" not in plan, plan
+
+
+def test_rollups_track_inserts_and_deletes(db):
+    user_model.add_transaction(1, 1000.0, "Salary", "income", "2024-01-31", "")
+    rent = user_model.add_transaction(1, 400.0, "Rent", "expense", "2024-01-01", "")
+    user_model.add_transaction(1, 0.1, "Market", "expense", "2024-01-05", "")
+    user_model.add_transaction(1, 0.2, "Market", "expense", "2024-02-05", "")
+    user_model.add_transaction(2, 50.0, "Market", "expense", "2024-01-05", "")
+
+    assert user_model.get_financial_summary(1) == (1000.0, 400.3)
+    assert user_model.get_expenses_by_category(1) == {"Rent": 400.0, "Market": 0.3}
+
+    user_model.delete_transaction(rent)
+    assert user_model.get_financial_summary(1) == (1000.0, 0.3)
+    assert user_model.get_expenses_by_category(1) == {"Market": 0.3}
+    assert user_model.check_rollups(1) == []
+    assert user_model.get_financial_summary(3) == (0, 0)
+
+
+def test_rebuild_rollups_repairs_drift(db):
+    user_model.add_transaction(1, 25.0, "Market", "expense", "2024-03-02", "")
+    with db:
+        db.execute("UPDATE user_totals SET total_expenses = 99 WHERE user_id = 1")
+        db.execute("DELETE FROM category_monthly_totals WHERE user_id = 1")
+
+    assert len(user_model.check_rollups(1)) == 2
+    user_model.rebuild_rollups(1)
+    assert user_model.check_rollups(1) == []
+    assert user_model.get_expenses_by_category(1) == {"Market": 25.0}
+
+
+def test_export_csv_streams_filtered_rows(db, tmp_path):
+    for day in range(1, 11):
+        user_model.add_transaction(1, day, "Market", "expense", f"2024-05-{day:02d}", f"item {day}")
+    filename = tmp_path / "export.csv"
+    progress = []
+
+    assert user_model.export_transactions_to_csv(1, filename, start_date="2024-05-03", end_date="2024-05-07",
+                                                 progress=progress.append)
+    lines = filename.read_text(encoding="utf-8").splitlines()
+    assert lines[0] == "ID,User ID,Price,Category,Type,Date,Description"
+    assert [line.split(",")[5] for line in lines[1:]] == [f"2024-05-0{day}" for day in (7, 6, 5, 4, 3)]
+    assert progress[-1] == 5
+
+    assert not user_model.export_transactions_to_csv(2, tmp_path / "empty.csv")
+    assert not (tmp_path / "empty.csv").exists()
+
+
+def test_import_csv_round_trips_export(db, tmp_path):
+    user_model.add_transaction(1, 1200.0, "Salary", "income", "2024-06-01", "June pay")
+    user_model.add_transaction(1, 45.5, "Market", "expense", "2024-06-03", "groceries, weekly")
+    exported = tmp_path / "export.csv"
+    assert user_model.export_transactions_to_csv(1, exported)
+
+    result = import_service.import_csv(2, exported, tags=["imported"], exclusive=True)
+    assert result["imported"] == 2 and result["skipped"] == []
+    assert [row[2:] for row in user_model.get_transactions(2)] == [row[2:] for row in user_model.get_transactions(1)]
+    assert user_model.get_financial_summary(2) == (1200.0, 45.5)
+    assert user_model.check_rollups(2) == []
+    assert user_model.get_transactions_filtered(2, tags=["imported"])
+
+    # Indexes and rollup triggers suspended during the import are back in place
+    assert "idx_transactions_user_date" in query_plan(db, "SELECT * FROM transactions WHERE user_id = 2 ORDER BY date")
+    user_model.add_transaction(2, 4.5, "Market", "expense", "2024-06-04", "")
+    assert user_model.get_financial_summary(2) == (1200.0, 50.0)
+
+
+def test_import_csv_skips_invalid_rows(db, tmp_path):
+    source = tmp_path / "ledger.csv"
+    source.write_text(
+        "Date,Type,Category,Price,Description,Tags\n"
+        "03.02.2024,Expense,Rent,\"$1,000.00\",February,home;fixed\n"
+        "2024-02-30,expense,Rent,10,bad date,\n"
+        "2024-02-05,refund,Market,10,bad type,\n"
+        "2024-02-06,expense,,10,no category,\n"
+        "2024-02-07,expense,Market,abc,bad price,\n",
+        encoding="utf-8")
+
+    result = import_service.import_csv(1, source)
+    assert result["imported"] == 1
+    assert [row_number for row_number, _ in result["skipped"]] == [2, 3, 4, 5]
+    transaction = user_model.get_transactions(1)[0]
+    assert transaction[2:] == (1000.0, "Rent", "expense", "2024-02-03", "February")
+    assert sorted(user_model.get_tags_for_transaction(transaction[0])) == ["fixed", "home"]
+
+    with pytest.raises(ValueError):
+        (tmp_path / "bad.csv").write_text("Price,Category\n1,Rent\n", encoding="utf-8")
+        import_service.import_csv(1, tmp_path / "bad.csv")
+
+
+def test_import_commits_in_batches_and_undoes_them_on_failure(db, tmp_path):
+    rows = [(day, "Food", "expense", f"2024-03-{day:02}", f"Meal {day}", ["trip"]) for day in range(1, 8)]
+    other = sqlite3.connect(database.get_database(), timeout=0)  # Fails at once if the import holds the lock
+
+    def write_between_batches(imported):
+        with other:
+            other.execute("INSERT INTO transactions (user_id, amount, category, type, date, description) "
+                          "VALUES (2, 1, 'Food', 'expense', '2024-03-01', 'Other writer')")
+
+    schema_version = db.execute("PRAGMA schema_version").fetchone()[0]
+    result = import_service.import_rows(1, rows, batch_size=3, progress=write_between_batches)
+    assert result["imported"] == 7
+    # The triggers are switched off through bulk_writes, not dropped: no DDL, so other
+    # connections keep their prepared statements
+    assert db.execute("PRAGMA schema_version").fetchone()[0] == schema_version
+    assert db.execute("SELECT COUNT(*) FROM bulk_writes").fetchone()[0] == 0
+    assert user_model.get_financial_summary(1) == (0, 28) and user_model.get_financial_summary(2) == (0, 3)
+    assert user_model.check_rollups(1) == [] and user_model.check_rollups(2) == []
+    assert len(user_model.get_transactions_filtered(1, tags=["trip"])) == 7
+    assert len(user_model.search_transactions(1, "meal")) == 7
+
+    def fail_after_two_batches(imported):
+        if imported > 3:
+            raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        import_service.import_rows(3, rows, batch_size=3, progress=fail_after_two_batches)
+    assert user_model.get_transactions(3) == [] and user_model.get_financial_summary(3) == (0, 0)
+    assert user_model.check_rollups(3) == []
+    other.close()
+
+
+def test_tags_are_fetched_in_bulk(db):
+    first = user_model.add_transaction(1, 10.0, "Market", "expense", "2024-07-01", "")
+    second = user_model.add_transaction(1, 20.0, "Rent", "expense", "2024-07-02", "")
+    user_model.add_tags_to_transaction(first, ["food", "weekly"], 1)
+
+    tags = user_model.get_tags_for_transactions([first, second])
+    assert sorted(tags[first]) == ["food", "weekly"] and tags[second] == []
+
+    rows = user_model.get_transactions(1, with_tags=True)
+    assert [(row[0], sorted(row[7])) for row in rows] == [(second, []), (first, ["food", "weekly"])]
+    filtered = user_model.get_transactions_filtered(1, tags=["food"], with_tags=True)
+    assert [(row[0], sorted(row[7])) for row in filtered] == [(first, ["food", "weekly"])]
+
+
+def test_transactions_page_walks_ledger_by_keyset(db):
+    # Amounts 1..9 on four dates, so pages break in the middle of a date
+    ids = [user_model.add_transaction(1, amount, "Market" if amount % 2 else "Rent", "expense",
+                                      f"2024-08-0{1 + amount // 3}", "")
+           for amount in range(1, 10)]
+    user_model.add_tags_to_transaction(ids[0], ["weekly"], 1)
+
+    def walk(**kwargs):
+        rows, after = [], None
+        while True:
+            page = user_model.get_transactions_page(1, after=after, limit=2, **kwargs)
+            rows.extend(page)
+            if len(page) < 2:
+                return rows
+            after = user_model.page_key(page[-1], kwargs.get("sort", "date"))
+
+    assert [row[2] for row in walk()] == [9, 8, 7, 6, 5, 4, 3, 2, 1]
+    assert [row[2] for row in walk(sort="price", descending=False)] == [1, 2, 3, 4, 5, 6, 7, 8, 9]
+    assert [row[2] for row in walk(category="Rent")] == [8, 6, 4, 2]
+    assert [(row[0], row[7]) for row in walk(tags=["weekly"])] == [(ids[0], ["weekly"])]
+
+    # The page before a row is the page after it in the opposite order (TransactionList scrolling up)
+    rows = walk(sort="price")
+    before = user_model.get_transactions_page(1, after=user_model.page_key(rows[5], "price"), limit=2,
+                                              sort="price", descending=False)
+    assert before[::-1] == rows[3:5]
+
+
+class ManualRoot:
+    """Stands in for the Tk root: after() callbacks run only when drained by the test"""
+
+    def __init__(self):
+        self.pending = []
+
+    def after(self, delay, callback):
+        self.pending.append(callback)
+
+    def drain(self):
+        pending, self.pending = self.pending, []
+        for callback in pending:
+            callback()
+
+
+def test_job_executor_delivers_results_on_poll_and_honours_cancel(db, caplog):
+    root = ManualRoot()
+    errors = []
+    executor = JobExecutor(root, on_error=errors.append)
+    user_model.add_transaction(1, 12.5, "Market", "expense", "2024-08-01", "")
+    results, progress = [], []
+
+    def export(job, filename):
+        return user_model.export_transactions_to_csv(1, filename, progress=job.report_progress)
+
+    filename = os.path.join(os.path.dirname(database.get_database()), "jobs.csv")
+    job = executor.submit(export, filename, pass_job=True, on_success=results.append, on_progress=progress.append)
+    job.future.result(timeout=5)
+    assert results == [] and progress == []  # Nothing reaches the caller until the Tk thread polls
+    root.drain()
+    assert results == [True] and progress == [1]
+
+    def blocked(job):
+        job.cancel()
+        job.report_progress(0)
+        return "finished"
+
+    job = executor.submit(blocked, pass_job=True, on_success=results.append, on_error=results.append)
+    job.future.exception(timeout=5)
+    root.drain()
+    assert results == [True]
+
+    # Cancelling drops what the job had already queued for the Tk thread
+    job = executor.submit(export, filename, pass_job=True, on_success=results.append, on_progress=progress.append)
+    job.future.result(timeout=5)
+    job.cancel()
+    root.drain()
+    assert results == [True] and progress == [1]
+
+    # A failure nobody handles is logged and shown through the executor's on_error
+    executor.submit(user_model.get_transactions_page, 1, None, 50, "no such column").future.exception(timeout=5)
+    root.drain()
+    assert len(errors) == 1 and isinstance(errors[0], KeyError)
+    assert "Background job failed" in caplog.text
+    executor.shutdown()
+
+
+def test_query_cache_serves_repeats_until_a_write(db):
+    query_cache.clear()
+    user_model.add_category(1, "Rent")
+    assert user_model.get_categories(1) == ["Rent"]
+    user_model.get_categories(1).append("mutated")  # Callers get a copy
+    assert user_model.get_categories(1) == ["Rent"]
+    assert query_cache.get_stats()["hits"] == 2
+
+    transaction_id = user_model.add_transaction(1, 40, "Rent", "expense", "2024-08-01", "")
+    assert user_model.get_financial_summary(1) == (0, 40)
+    user_model.delete_transaction(transaction_id)
+    assert user_model.get_financial_summary(1) == (0, 0)
+    user_model.delete_category(1, "Rent")
+    assert user_model.get_categories(1) == []
+
+    import_service.import_rows(1, [(5, "Food", "income", "2024-08-02", "")])
+    assert user_model.get_financial_summary(1) == (5, 0)
+    assert query_cache.get_stats()["misses"] == 5
+
+    # Tag lists inside cached rows are copied too
+    user_model.add_tags_to_transaction(user_model.get_transactions(1)[0][0], ["work"], 1)
+    user_model.get_transactions_page(1)[0][7].append("mutated")
+    assert user_model.get_transactions_page(1)[0][7] == ["work"]
+
+    # Writes from another connection (another process, say) invalidate as well
+    assert user_model.get_financial_summary(1, "2024-08-01", "2024-08-31") == (5, 0)
+    assert ledger.get_ledger(1).totals_by_category('expense') == {}
+    with sqlite3.connect(database.get_database()) as other:
+        other.execute("INSERT INTO transactions (user_id, amount, category, type, date, description) "
+                      "VALUES (1, 10, 'Food', 'expense', '2024-08-03', '')")
+    other.close()
+    assert user_model.get_financial_summary(1) == (5, 10)
+    assert user_model.get_financial_summary(1, "2024-08-01", "2024-08-31") == (5, 10)
+    assert ledger.get_ledger(1).totals_by_category('expense') == {"Food": 10}
+
+
+@pytest.mark.parametrize("max_cube_cells", [ledger.MAX_CUBE_CELLS, 0])
+def test_ledger_matches_sql_and_follows_writes(db, monkeypatch, max_cube_cells):
+    monkeypatch.setattr(ledger, "MAX_CUBE_CELLS", max_cube_cells)  # 0 forces the row-scan fallback
+    for amount, category, transaction_type, date in [
+        (100, "Salary", "income", "2024-07-31"), (12.34, "Food", "expense", "2024-08-01"),
+        (20, "Rent", "expense", "2024-08-15"), (0.66, "Food", "expense", "2024-09-02"),
+    ]:
+        user_model.add_transaction(1, amount, category, transaction_type, date, "")
+
+    snapshot = ledger.get_ledger(1)
+    assert snapshot.summary() == user_model.get_financial_summary(1)
+    assert snapshot.totals_by_category() == user_model.get_expenses_by_category(1)
+    assert user_model.get_financial_summary(1, "2024-08-01", "2024-08-31") == (0, 32.34)
+    assert user_model.get_expenses_by_category(1, start_date="2024-08-02") == {"Rent": 20, "Food": 0.66}
+
+    days, balance = snapshot.daily_balance()
+    assert [ledger.from_day(day) for day in days][:2] == ["2024-07-31", "2024-08-01"]
+    assert list(balance) == [100, 87.66, 67.66, 67.0]
+
+    # A back-dated add is merged in order into a copy, leaving the snapshot already handed out as it
+    # was; a delete forces a reload
+    added = user_model.add_transaction(1, 5, "Food", "expense", "2024-01-01", "")
+    merged = ledger.get_ledger(1)
+    assert len(merged) == len(snapshot) + 1 and ledger.from_day(merged.days[0]) == "2024-01-01"
+    assert ledger.from_day(snapshot.days[0]) == "2024-07-31" and snapshot.summary() == (100, 33.0)
+    user_model.delete_transaction(added)
+    assert len(ledger.get_ledger(1)) == len(snapshot)
+    assert ledger.get_ledger(1).summary() == user_model.get_financial_summary(1)
+
+    # A user's (re)build holds only that user's lock: here user 1 is mid-load on another thread
+    user_model.add_transaction(1, 1, "Food", "expense", "2024-09-03", "")
+    user_model.add_transaction(2, 7, "Food", "expense", "2024-09-03", "")
+    with ledger._load_locks[(database.get_database(), 1)]:
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            assert pool.submit(lambda: ledger.get_ledger(2).summary()).result(timeout=5) == (0, 7)
+
+
+def test_analytics_series_fill_gaps_and_agree_across_sources(db):
+    for amount, category, transaction_type, date in [
+        (1000, "Salary", "income", "2024-01-15"), (200, "Rent", "expense", "2024-01-01"),
+        (50, "Food", "expense", "2024-01-07"), (300, "Rent", "expense", "2024-03-01"),
+        (25, "Food", "expense", "2024-03-04"),
+    ]:
+        user_model.add_transaction(1, amount, category, transaction_type, date, "")
+
+    monthly = analytics.get_series(1, "month")  # From the rollup
+    ranged = analytics.get_series(1, "month", start_date="2024-01-01")  # From transactions
+    assert [str(month) for month in monthly.periods] == ["2024-01", "2024-02", "2024-03"]
+    for name in ("periods", "income", "expenses", "net"):
+        assert list(getattr(monthly, name)) == list(getattr(ranged, name))
+    assert list(monthly.expenses) == [250, 0, 325] and list(monthly.net) == [750, 0, -325]
+
+    weekly = analytics.get_series(1, "week")
+    assert str(weekly.periods[0]) == "2024-01-01" and len(weekly.periods) == 10  # Mondays through 2024-03-04
+    assert weekly.expenses[0] == 250 and weekly.expenses[-1] == 25  # 2024-01-07 is that Sunday
+    assert analytics.get_series(1, "year").expenses.tolist() == [575]
+
+    trends = analytics.get_category_trends(1)
+    assert trends.categories == ["Rent", "Food"]
+    assert trends.totals.tolist() == [[200, 0, 300], [50, 0, 25]]
+
+    averages = analytics.rolling_average(monthly.expenses, 2)
+    assert np.isnan(averages[0]) and averages[1:].tolist() == [125, 162.5]
+    months, totals, change, percent = analytics.month_over_month(1)
+    assert change[1:].tolist() == [-250, 325] and percent[1] == -100 and np.isnan(percent[2])
+
+
+def test_search_ranks_prefix_matches_and_stays_in_sync(db):
+    coffee = user_model.add_transaction(1, 4, "Food", "expense", "2024-08-01", "Coffee shop")
+    user_model.add_transaction(1, 9, "Food", "expense", "2024-08-02", "Coffee coffee")
+    user_model.add_transaction(1, 30, "Rent", "expense", "2024-08-03", "Café rent share")
+    user_model.add_transaction(2, 5, "Food", "expense", "2024-08-01", "Coffee with friends")
+    user_model.add_tags_to_transaction(coffee, ["daily"], 1)
+
+    def descriptions(text, **kwargs):
+        return [row[6] for row in user_model.search_transactions(1, text, **kwargs)]
+
+    assert descriptions("cof") == ["Coffee coffee", "Coffee shop"]
+    assert descriptions("cof sh") == ["Coffee shop"]
+    assert descriptions("cafe") == ["Café rent share"]
+    assert descriptions("coffee", tags=["daily"]) == ["Coffee shop"]
+    assert descriptions("c", category="Rent") == ["Café rent share"]
+    assert descriptions('"OR -') == [] and descriptions("  ") == []
+
+    user_model.delete_transaction(coffee)
+    assert descriptions("shop") == []
+
+    # Bulk imports index descriptions with one statement instead of per-row triggers
+    import_service.import_rows(1, [(7, "Food", "expense", "2024-08-04", "Espresso bar")])
+    assert descriptions("espr") == ["Espresso bar"]
+    assert db.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('integrity-check')") is not None
+
+
+def test_normalize_date_fast_path_and_natural_language():
+    assert date_service.normalize_date("2024-08-01") == "2024-08-01"
+    assert date_service.normalize_date(" 01.08.2024 ") == "2024-08-01"
+    assert date_service.normalize_date("08/01/2024") == "2024-08-01"
+    assert date_service.normalize_date("8/1/2024") == "2024-08-01"
+    assert date_service.normalize_date("2024/8/1") == "2024-08-01"
+    for invalid in ("2024-02-30", "31/12/2024", "yesterday", "", None):
+        with pytest.raises(ValueError):
+            date_service.normalize_date(invalid)
+
+    yesterday = date.today() - timedelta(days=1)
+    assert date_service.normalize_date("yesterday", natural_language=True) == yesterday.isoformat()
+    with pytest.raises(ValueError):
+        date_service.normalize_date("2024-02-30", natural_language=True)  # Numeric dates never fall through
+
+
+def xlsx_sheets(filename):
+    """{sheet name: number of rows} read straight from the workbook XML"""
+    with zipfile.ZipFile(filename) as workbook:
+        names = re.findall(r'<sheet name="([^"]+)"', workbook.read("xl/workbook.xml").decode())
+        return {name: workbook.read(f"xl/worksheets/sheet{i}.xml").decode().count("<row ")
+                for i, name in enumerate(names, start=1)}
+
+
+def test_excel_export_streams_rows_and_splits_sheets(db, tmp_path):
+    filename = tmp_path / "out.xlsx"
+    assert export_service.export_transactions_to_excel(1, filename) is False
+    assert not filename.exists()
+
+    for day in range(1, 6):
+        user_model.add_transaction(1, day, "Food", "expense", f"2024-08-0{day}", "Groceries " * 10)
+    written = []
+    assert export_service.export_transactions_to_excel(1, filename, start_date="2024-08-02",
+                                                       progress=written.append) is True
+    assert xlsx_sheets(filename) == {"Transactions": 5} and written == [4]
+
+    writer = export_service.ExcelWriter(tmp_path / "split.xlsx", max_rows=3)
+    writer.write_rows(user_model.get_transactions(1))
+    writer.close()
+    assert xlsx_sheets(tmp_path / "split.xlsx") == {"Transactions": 3, "Transactions 2": 3, "Transactions 3": 2}
+
+    writer = export_service.ExcelWriter(tmp_path / "single.xlsx", split_sheets=False, max_rows=3)
+    with pytest.raises(ValueError):
+        writer.write_rows(user_model.get_transactions(1))
+    writer.close()
+
+
+def test_pdf_report_renders_ledger_in_chunks(db, tmp_path, monkeypatch):
+    filename = tmp_path / "report.pdf"
+    assert export_service.export_transactions_to_pdf(1, filename) is False
+    assert not filename.exists()
+
+    for day in range(1, 6):
+        user_model.add_transaction(1, day, "Food", "expense", f"2024-08-0{day}", "Groceries " * 10)
+    user_model.add_transaction(1, 100, "Salary", "income", "2024-08-01", "Pay")
+    monkeypatch.setattr(export_service.PdfReportWriter, "ROWS_PER_TABLE", 2)
+    progress = []
+    assert export_service.export_transactions_to_pdf(1, filename, progress=lambda *args: progress.append(args))
+    assert filename.read_bytes().startswith(b"%PDF")
+    # Fetch progress reports rows written; rendering reports (rows rendered, total)
+    assert progress == [(6,), (2, 6), (4, 6), (6, 6)]
+
+
+def test_export_job_reads_once_and_replaces_files_atomically(db, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+    out.mkdir()
+    exports = {"csv": out / "all.csv", "excel": out / "all.xlsx", "pdf": out / "all.pdf"}
+    assert export_service.export_transactions(1, exports) is False
+    assert not list(out.iterdir())
+
+    for day in range(1, 6):
+        user_model.add_transaction(1, day + 0.5, "Food", "expense", f"2024-08-0{day}", f"Groceries, week {day}")
+    # No cpu_pool: rendered in a process pool started for the call
+    report = export_service.export_transactions(1, exports, category="Food")
+    assert report.rows == 5 and set(report.seconds) == {"csv", "excel", "pdf"}
+    user_model.export_transactions_to_csv(1, out / "single.csv")
+    assert exports["csv"].read_text() == (out / "single.csv").read_text()
+    assert xlsx_sheets(exports["excel"]) == {"Transactions": 6}
+    assert exports["pdf"].read_bytes().startswith(b"%PDF")
+
+    # A failing format leaves the previous files untouched and no temporary files behind
+    before = {name: path.read_bytes() for name, path in exports.items()}
+    monkeypatch.setattr(export_service.PdfReportWriter, "close", lambda self: 1 / 0)
+    with ThreadPoolExecutor() as pool, pytest.raises(ZeroDivisionError):
+        export_service.export_transactions(1, exports, cpu_pool=pool)
+    assert {name: path.read_bytes() for name, path in exports.items()} == before
+    assert sorted(path.name for path in out.iterdir()) == ["all.csv", "all.pdf", "all.xlsx", "single.csv"]
+
+
+def test_instrumentation_records_calls_statements_and_slow_queries(db, tmp_path, caplog, monkeypatch):
+    instrumentation.reset()
+    for day in range(1, 4):
+        user_model.add_transaction(1, day * 10, "Rent", "expense", f"2024-08-0{day}", "")
+    assert len(user_model.get_transactions(1)) == 3
+    list(user_model.iter_transactions(1, batch_size=2))
+
+    functions = instrumentation.get_stats()["functions"]
+    assert functions["user_model.add_transaction"]["calls"] == 3
+    assert functions["user_model.get_transactions"]["rows"] == 3
+    assert functions["user_model.iter_transactions"]["rows"] == 3
+    assert functions["user_model.get_transactions"]["statements"] >= 1
+    latency = functions["user_model.get_transactions"]
+    assert 0 < latency["p50_seconds"] <= latency["max_seconds"]
+    with pytest.raises(KeyError):
+        user_model.get_transactions_page(1, sort="no such column")
+    assert instrumentation.get_stats()["functions"]["user_model.get_transactions_page"]["errors"] == 1
+
+    # Every call is slow at a zero threshold; SELECTs are logged with their plan, without their values
+    instrumentation.configure(slow_query_seconds=0)
+    try:
+        user_model.get_transactions_filtered(1, category="Rent")
+        caplog.clear()
+        with caplog.at_level(logging.WARNING, logger="models.instrumentation"):
+            assert user_model.authenticate_user("nobody", "secret") is None
+    finally:
+        instrumentation.configure(slow_query_seconds=instrumentation.SLOW_QUERY_SECONDS)
+    entry = instrumentation.get_stats()["slow_queries"][-1]
+    assert entry["function"] == "user_model.get_transactions_filtered" and entry["statements"][0]["plan"]
+    assert "Rent" not in entry["statements"][0]["sql"] and "category = ?" in entry["statements"][0]["sql"]
+    assert not caplog.records  # Logins are bcrypt-slow by design and aren't instrumented
+
+    # The trace callback is only installed while recording is on, and bulk writers can drop it
+    traced = []
+    monkeypatch.setattr(instrumentation, "_trace", traced.append)
+    instrumentation.configure(enabled=False)
+    try:
+        db.execute("SELECT 1")
+        assert traced == []
+    finally:
+        instrumentation.configure(enabled=True)
+    db.execute("SELECT 2")
+    with instrumentation.untraced(db):
+        db.execute("SELECT 3")
+    db.execute("SELECT 4")
+    assert traced == ["SELECT 2", "SELECT 4"]
+
+    assert instrumentation.normalize_sql("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x'") == \
+        "SELECT * FROM t WHERE id IN (?, ...) AND name = ?"
+    saved = json.loads(instrumentation.dump_json(tmp_path / "stats.json"))
+    assert json.loads((tmp_path / "stats.json").read_text()) == saved
+    instrumentation.reset()
+    assert instrumentation.get_stats()["functions"] == {}
+
+
+@pytest.mark.parametrize("file_format", ["arrow", "parquet"])
+def test_snapshot_round_trips_typed_columns_and_tags(db, tmp_path, monkeypatch, file_format):
+    export = getattr(export_service, f"export_transactions_to_{file_format}")
+    filename = tmp_path / f"ledger.{file_format}"
+    assert export(1, filename) is False and not filename.exists()
+
+    import_service.import_rows(1, [(2.5, "Food", "expense", "2024-08-01", "Bread", ["weekly", "bakery"]),
+                                   (1000, "Salary", "income", "2024-08-01", "Pay", None),
+                                   (40.1, "Food", "expense", "2024-07-30", "Market", ["weekly"])])
+    monkeypatch.setattr(snapshot_service, "ROW_GROUP_SIZE", 2)  # Two batches: the dictionaries grow in between
+    assert export(1, filename)
+
+    table = snapshot_service.open_snapshot(filename)
+    assert table.column_names == snapshot_service.COLUMNS
+    assert str(table.schema.field("category").type) == "dictionary<values=string, indices=int32, ordered=0>"
+    assert str(table.schema.field("date").type) == "date32[day]"
+    stored = sorted(row[2:] for row in user_model.get_transactions(1, with_tags=True))
+    assert sorted(snapshot_service.iter_rows(table)) == stored
+
+    snapshot = ledger.from_snapshot(table)
+    assert snapshot.user_id == 1
+    assert snapshot.summary() == user_model.get_financial_summary(1)
+    assert snapshot.totals_by_category() == {"Food": 42.6}
+
+    assert import_service.import_snapshot(2, filename)["imported"] == 3
+    assert sorted(row[2:] for row in user_model.get_transactions(2, with_tags=True)) == stored
+
+
+def test_cli_runs_headless_commands_against_the_database(db, tmp_path, capsys):
+    db.execute("INSERT INTO users (username, password) VALUES ('alice', 'x')")
+    db.commit()
+    path = database.get_database()
+    (tmp_path / "in.csv").write_text("Price,Category,Type,Date,Description,Tags\n"
+                                     "12.5,Food,expense,2024-08-01,Lunch,work\n"
+                                     "100,Salary,income,2024-08-02,Pay,\n"
+                                     "x,Food,expense,2024-08-03,Bad price,\n", encoding="utf-8")
+
+    assert cli.main(["--db", path, "import", "--user", "alice", str(tmp_path / "in.csv")]) == 0
+    out = capsys.readouterr().out
+    assert "Imported 2 transactions" in out and "row 3: invalid price 'x'" in out
+
+    assert cli.main(["--db", path, "summary", "--user", "alice", "--start", "2024-08-01"]) == 0
+    assert capsys.readouterr().out.splitlines() == ["Income\t100.00", "Expenses\t12.50", "Net\t87.50",
+                                                    "Food\t12.50"]
+
+    assert cli.main(["--db", path, "export", "--user", "alice", "-"]) == 0
+    assert capsys.readouterr().out.splitlines()[1:] == ["2,1,100.0,Salary,income,2024-08-02,Pay",
+                                                        "1,1,12.5,Food,expense,2024-08-01,Lunch"]
+    assert cli.main(["--db", path, "export", "--user", "alice", str(tmp_path / "out.parquet")]) == 0
+    assert cli.main(["--db", path, "import", "--user", "alice", str(tmp_path / "out.parquet")]) == 0
+    assert [row[7] for row in user_model.get_transactions_filtered(1, tags=["work"], with_tags=True)] == \
+        [["work"], ["work"]]  # The snapshot carried the tag over
+
+    db = database.get_connection()
+    db.execute("UPDATE user_totals SET total_income = 0")
+    db.commit()
+    assert cli.main(["--db", path, "rebuild-rollups", "--all", "--check"]) == 1
+    assert cli.main(["--db", path, "rebuild-rollups", "--user", "alice"]) == 0
+    assert cli.main(["--db", path, "rebuild-rollups", "--all", "--check"]) == 0
+    assert cli.main(["--db", path, "summary", "--user", "bob"]) == 1
+    assert "no user named 'bob'" in capsys.readouterr().err
+
+
+
+def test_write_queue_group_commits_and_acknowledges_each_write(db):
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
+    user_model.add_category(1, "Food")
+    assert user_model.get_categories(1) == ["Food"]
+
+    def fail(connection):
+        connection.execute("INSERT INTO categories (user_id, name) VALUES (1, 'Rolled back')")
+        raise ValueError("bad write")
+
+    queue = write_queue.WriteQueue(max_delay=0.2)  # Wait long enough to gather every write below
+    try:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = list(pool.map(lambda day: queue.submit(write_queue._add_transaction, 1, day, "Food", "expense",
+                                                             f"2024-08-{day:02}", "", ["work"], user_id=1),
+                                    range(1, 21)))
+        failed = queue.submit(fail)
+        duplicate = queue.submit(write_queue._add_category, 1, "Food", user_id=1)
+        ids = [future.result(timeout=10) for future in futures]
+        with pytest.raises(ValueError, match="bad write"):
+            failed.result(timeout=10)
+        assert duplicate.result(timeout=10) is False
+    finally:
+        queue.close()
+
+    assert sorted(ids) == list(range(1, 21))
+    stats = queue.stats()
+    assert stats["writes"] == 21 and stats["failed"] == 1 and stats["commits"] < 5
+    assert user_model.get_categories(1) == ["Food"]  # The failed write's insert was rolled back alone
+    assert user_model.get_financial_summary(1) == (0, 210)  # Cached reads saw the commit
+    assert user_model.get_transactions_filtered(1, tags=["work"], with_tags=True)[0][7] == ["work"]
+    with pytest.raises(RuntimeError):
+        queue.submit(fail)
+
+    assert write_queue.delete_transaction(1, user_id=2).result(timeout=10) is False  # Not user 2's
+    assert write_queue.delete_transaction(1, user_id=1).result(timeout=10) is True
+    assert user_model.get_financial_summary(1) == (0, 209)
+
+    database.configure(synchronous="normal")
+    try:
+        assert database.get_connection().execute("PRAGMA synchronous").fetchone()[0] == 1
+        with pytest.raises(ValueError):
+            database.configure(synchronous="sometimes")
+    finally:
+        database.configure(synchronous=database.SYNCHRONOUS)
+
+def test_api_serves_pages_streams_summaries_and_sheds_load(db):
+    assert user_model.create_user("alice", "secret")
+    assert user_model.create_user("bob", "hunter2")
+    server = api_service.create_server(port=0, workers=1, queue_size=1, idle_timeout=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_address[1]
+
+    def call(method, path, body=None, token=None):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        if token or session:
+            headers["Authorization"] = f"Bearer {token or session}"
+        connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = connection.getresponse()
+        data = response.read()
+        connection.close()
+        is_json = response.getheader("Content-Type") == "application/json"
+        return response.status, json.loads(data) if is_json else data
+
+    session = None
+    try:
+        # Everything but /health and /login needs a token, which only opens its own user's routes
+        assert call("GET", "/users/1/summary") == (401, {"error": "a valid bearer token is required; "
+                                                                 "POST /login for one"})
+        assert call("GET", "/users/1/summary", token="forged")[0] == 401
+        assert call("POST", "/login", {"username": "alice", "password": "wrong"})[0] == 401
+        status, bob = call("POST", "/login", {"username": "bob", "password": "hunter2"})
+        assert status == 200 and bob["user_id"] == 2
+        assert call("GET", "/users/1/summary", token=bob["token"])[0] == 403
+        status, alice = call("POST", "/login", {"username": "alice", "password": "secret"})
+        session = alice["token"]
+
+        for day in range(1, 6):
+            status, created = call("POST", "/users/1/transactions", {
+                "amount": "$1,000" if day == 5 else day, "category": "Food", "type": "expense",
+                "date": f"2024-08-0{day}", "description": f"Meal {day}", "tags": ["work"] if day % 2 else []})
+            assert status == 201
+        assert created == {"id": 5, "user_id": 1, "amount": 1000.0, "category": "Food", "type": "expense",
+                           "date": "2024-08-05", "description": "Meal 5", "tags": ["work"]}
+        assert call("POST", "/users/1/transactions", {"amount": "x", "category": "Food", "type": "expense",
+                                                      "date": "2024-08-01"}) == (400, {"error": "invalid price 'x'"})
+        assert call("GET", "/users/9/summary")[0] == 403
+        assert call("PUT", "/users/1/summary")[0] == 501  # Not a method the server handles at all
+        assert call("DELETE", "/users/1/summary")[0] == 405
+
+        # Keyset pages, newest first, until there is no cursor
+        ids, path = [], "/users/1/transactions?limit=2"
+        while path:
+            status, page = call("GET", path)
+            ids += [row["id"] for row in page["transactions"]]
+            path = page["next_cursor"] and f"/users/1/transactions?limit=2&cursor={page['next_cursor']}"
+        assert ids == [5, 4, 3, 2, 1]
+        status, page = call("GET", "/users/1/transactions?tag=work&order=asc")
+        assert [row["id"] for row in page["transactions"]] == [1, 3, 5] and page["next_cursor"] is None
+        assert call("GET", "/users/1/transactions?cursor=nonsense")[0] == 400
+        # A cursor's value has to fit the sort column, or the keyset query would fail with a 500
+        for sort, value in [("date", ["2024-08-01"]), ("date", {"a": 1}), ("date", "August"), ("price", "12"),
+                            ("category", 3), ("date", None)]:
+            cursor = api_service.encode_cursor((value, 4))
+            assert call("GET", f"/users/1/transactions?sort={sort}&cursor={cursor}") == \
+                (400, {"error": "invalid cursor"})
+        cursor = api_service.encode_cursor((4.0, 4))
+        assert call("GET", f"/users/1/transactions?sort=price&cursor={cursor}")[0] == 200
+
+        status, stream = call("GET", "/users/1/transactions/stream?start=2024-08-04")
+        assert [json.loads(line)["id"] for line in stream.splitlines()] == [5, 4]
+        status, stream = call("GET", "/users/1/export?format=csv&end=2024-08-01")
+        assert stream.decode().splitlines() == ["ID,User ID,Price,Category,Type,Date,Description",
+                                                "1,1,1.0,Food,expense,2024-08-01,Meal 1"]
+        status, exported = call("GET", "/users/1/export?format=parquet")
+        assert status == 200 and exported[:4] == snapshot_service.PARQUET_MAGIC
+        assert call("GET", "/users/1/export?format=excel&start=2030-01-01")[0] == 204
+
+        assert call("GET", "/users/1/summary?start=2024-08-02") == (200, {
+            "start": "2024-08-02", "end": None, "income": 0, "expenses": 1009.0, "net": -1009.0,
+            "expenses_by_category": {"Food": 1009.0}})
+        assert call("POST", "/users/1/transactions/2/tags", {"tags": ["home"]}) == (200, {"tags": ["home"]})
+        assert call("DELETE", "/users/1/transactions/5") == (200, {"deleted": 5})
+        assert call("DELETE", "/users/1/transactions/5")[0] == 404
+        assert call("POST", "/users/1/categories", {"name": "Rent"})[0] == 201
+        assert call("POST", "/users/1/categories", {"name": "Rent"})[0] == 409
+        assert call("DELETE", "/users/1/categories/Rent") == (200, {"deleted": "Rent"})
+        assert call("DELETE", "/users/1/categories/Rent")[0] == 404
+
+        # Idle connections hold the only worker and the one queue slot: shed, don't wait
+        while server.metrics.in_flight:
+            time.sleep(0.01)
+        idle = [socket.create_connection(("127.0.0.1", port)) for _ in range(2)]
+        try:
+            time.sleep(0.2)
+            assert call("GET", "/health") == (503, {"error": "server busy"})
+        finally:
+            for connection in idle:
+                connection.close()
+        deadline = time.monotonic() + 5
+        while call("GET", "/health")[0] == 503 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        status, metrics = call("GET", "/metrics")
+        assert metrics["rejected"] >= 1
+        pages = metrics["routes"]["GET /users/{user_id}/transactions"]
+        assert pages["requests"] == 12 and pages["statuses"] == {"200": 5, "400": 7}
+        assert 0 < pages["p50_seconds"] <= pages["max_seconds"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_recurring_rules_expand_lazily_and_materialize_on_demand(db, capsys):
+    db.execute("INSERT INTO users (username, password) VALUES ('alice', 'x')")
+    db.commit()
+    rent = recurring.add_rule(1, 1000, "Rent", "expense", "2024-01-31", "monthly", end_date="2024-06-30")
+    salary = recurring.add_rule(1, 3000, "Salary", "income", "2024-01-01")
+    user_model.add_transaction(1, 50, "Food", "expense", "2024-02-29", "Lunch")
+    assert [rule.id for rule in recurring.get_rules(1)] == [rent, salary]
+
+    # Month ends are clamped, and the rule stops at its end date
+    rent_rule = recurring.get_rules(1)[0]
+    assert list(recurring.occurrences(rent_rule)) == ["2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30",
+                                                      "2024-05-31", "2024-06-30"]
+    assert user_model.get_financial_summary(1, "2024-01-01", "2024-06-30") == (18000, 6050)
+    assert user_model.get_expenses_by_category(1, "2024-01-01", "2024-06-30") == {"Rent": 6000, "Food": 50}
+    assert user_model.get_financial_summary(1)[0] == 3000 * recurring.pending_count(recurring.get_rules(1)[1])
+
+    # A century of daily occurrences is counted, not expanded
+    assert recurring.get_rules(2) == []
+    recurring.add_rule(2, 2.5, "Coffee", "expense", "2024-01-01", "daily")
+    started = time.perf_counter()
+    assert user_model.get_financial_summary(2, end_date="2123-12-31") == (0, 2.5 * 36524)
+    assert time.perf_counter() - started < 1
+
+    # Pending occurrences interleave with stored rows in date order, across keyset pages
+    page = user_model.get_transactions_page(1, limit=3, descending=False, include_recurring=True)
+    assert [(row[0], row[5]) for row in page] == [(-salary, "2024-01-01"), (-rent, "2024-01-31"),
+                                                  (-salary, "2024-02-01")]
+    page = user_model.get_transactions_page(1, after=user_model.page_key(page[-1]), limit=3, descending=False,
+                                            include_recurring=True)
+    assert [(row[0], row[5]) for row in page] == [(-rent, "2024-02-29"), (1, "2024-02-29"), (-salary, "2024-03-01")]
+    assert [row[0] for row in user_model.get_transactions_page(1, include_recurring=False)] == [1]
+
+    # Materialized occurrences become ordinary rows and stop being pending
+    assert cli.main(["--db", database.get_database(), "recurring", "--user", "alice", "--materialize",
+                     "--through", "2024-03-31"]) == 0
+    assert "Materialized 6 transactions" in capsys.readouterr().out
+    assert recurring.materialize(1, "2024-03-31") == 0
+    assert user_model.get_financial_summary(1, "2024-01-01", "2024-06-30") == (18000, 6050)
+    assert len(user_model.get_transactions_filtered(1, category="Rent")) == 3
+
+    # Concurrent calls post each occurrence once
+    barrier = threading.Barrier(4)
+    written = []
+
+    def materialize():
+        barrier.wait()
+        written.append(recurring.materialize(2, "2024-12-31"))
+
+    threads = [threading.Thread(target=materialize) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(written) == [0, 0, 0, 366]
+    assert len(user_model.get_transactions_filtered(2)) == 366
+
+    # Deleting a rule keeps what it already posted
+    assert recurring.delete_rule(2, rent) is False
+    assert recurring.delete_rule(1, rent) is True
+    assert user_model.get_financial_summary(1, "2024-01-01", "2024-06-30") == (18000, 3050)
+
+    for args in [(1, 10, "Rent", "expense", "2024-01-01", "hourly"),
+                 (1, 10, "Rent", "refund", "2024-01-01"),
+                 (1, 10, "Rent", "expense", "2024-01-01", "weekly", 0),
+                 (1, 10, "Rent", "expense", "2024-02-01", "weekly", 1, "2024-01-01")]:
+        with pytest.raises(ValueError):
+            recurring.add_rule(*args)